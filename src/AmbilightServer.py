@@ -1,14 +1,107 @@
 from proto import ambilight_pb2
-import socket, time
+from google.protobuf import json_format
+import socket, time, json, os
 from enum import Enum
 from typing import Dict, Tuple
 import threading
 import NTP
+from ClientRegistry import ClientRegistry
+import fast_packet
+import logging
+
+log = logging.getLogger(__name__)
 
 class Client:
+  # Pacing limits applied once a client starts sending receiver reports
+  MIN_SEND_RATE_HZ = 15
+  DEFAULT_MAX_REFRESH_HZ = 90
+  RATE_STEP_UP_HZ = 5           # additive increase when the link is clean
+  RATE_BACKOFF = 0.75           # multiplicative decrease when the link is lossy
+  LOSS_HIGH = 0.05              # loss fraction above which we back off
+  LOSS_LOW = 0.01               # loss fraction below which we speed up
+
   def __init__(self, config, last_seen):
     self.config = config
     self.last_seen = last_seen
+    self.addr = (config.ipv4, config.port)
+    self.group = config.group     # which screen's DATA to send, "" for the first one
+    self.data_format = ambilight_pb2.DataFormat.PROTOBUF
+
+    # Receiver report state. send_rate_hz stays None until the first report so
+    # clients that never report keep getting every frame.
+    self.received = 0
+    self.lost = 0
+    self.jitter_ms = 0.0
+    self.max_refresh_hz = self.DEFAULT_MAX_REFRESH_HZ
+    self.loss_fraction = 0.0
+    self.send_rate_hz = None
+    self.next_send_s = 0.0
+    self.frames_sent = 0
+    self.frames_paced = 0
+
+  '''
+  Applies a receiver report and adapts the send rate (AIMD): back off when the
+  client reports loss above LOSS_HIGH, creep back up to its max refresh rate
+  while loss stays below LOSS_LOW. Returns True if the send rate changed.
+  '''
+  def apply_report(self, report) -> bool:
+    # Counts are cumulative, so work on the deltas since the last report. A
+    # client that restarted will report smaller counts; treat those as fresh.
+    if report.received < self.received or report.lost < self.lost:
+      self.received = 0
+      self.lost = 0
+    delta_received = report.received - self.received
+    delta_lost = report.lost - self.lost
+    self.received = report.received
+    self.lost = report.lost
+    self.jitter_ms = report.jitter_ms
+    if report.HasField("max_refresh_hz") and report.max_refresh_hz > 0:
+      self.max_refresh_hz = report.max_refresh_hz
+
+    total = delta_received + delta_lost
+    self.loss_fraction = delta_lost / total if total > 0 else 0.0
+
+    old_rate = self.send_rate_hz
+    rate = self.send_rate_hz if self.send_rate_hz is not None else self.max_refresh_hz
+    if self.loss_fraction > self.LOSS_HIGH:
+      rate = rate * self.RATE_BACKOFF
+    elif self.loss_fraction < self.LOSS_LOW:
+      rate = rate + self.RATE_STEP_UP_HZ
+    self.send_rate_hz = max(self.MIN_SEND_RATE_HZ, min(rate, self.max_refresh_hz))
+
+    return old_rate != self.send_rate_hz
+
+  '''
+  Returns True if a DATA frame should go to this client now, advancing its
+  send deadline if so. Clients without a send rate are never paced.
+  '''
+  def due(self, now_s: float) -> bool:
+    if self.send_rate_hz is None:
+      return True
+    if now_s < self.next_send_s:
+      self.frames_paced += 1
+      return False
+    interval_s = 1 / self.send_rate_hz
+    self.next_send_s += interval_s
+    if self.next_send_s < now_s - interval_s:
+      # fell more than a frame behind (e.g. capture stalled), so resync
+      self.next_send_s = now_s + interval_s
+    return True
+
+  '''
+  Returns a dict of this client's link statistics.
+  '''
+  def stats(self) -> dict:
+    return {
+      "received": self.received,
+      "lost": self.lost,
+      "loss_fraction": self.loss_fraction,
+      "jitter_ms": self.jitter_ms,
+      "max_refresh_hz": self.max_refresh_hz,
+      "send_rate_hz": self.send_rate_hz,
+      "frames_sent": self.frames_sent,
+      "frames_paced": self.frames_paced,
+    }
 
 class AmbilightServer:
   # 255.255.255.255 is the default broadcast IP address
@@ -17,23 +110,42 @@ class AmbilightServer:
   UDP_BROADCAST_PORT = 3000
   UDP_DATA_PORT = 3001
   NTP_PERIOD_MS = 5000
+  NTP_RETRY_MS = 1000
+  STATS_PERIOD_MS = 60000       # how often the link statistics of reporting clients are logged
   ALL_CLIENTS = (0,0)
 
+  # Once the set of clients stops changing, the discovery broadcast interval
+  # doubles after every broadcast up to this cap
+  DISCOVERY_BACKOFF_MAX_MS = 8000
+
   # MTU is typically 1472
   MAX_MESSAGE_BYTES = 1460
 
+  # Highest DATA format this server can send, see fast_packet.py
+  MAX_DATA_FORMAT = ambilight_pb2.DataFormat.RAW_RGB_CHUNKED
+
   '''
   Initialize an AmbilightServer that will broadcast discovery messages at the
   given time interval and waits to receive messages for the given time duration.
+  If registry_path is given, registered clients are saved there on every change
+  and restored on the next start, so they get DATA again right away.
   '''
-  def __init__(self, discovery_broadcast_ms: int=1000, receive_timeout_ms: int=1000, client_heartbeat_timeout_ms: int=5000) -> None:
+  def __init__(self, discovery_broadcast_ms: int=1000, receive_timeout_ms: int=1000, client_heartbeat_timeout_ms: int=5000,
+               registry_path: str=None) -> None:
     self.discovery_broadcast_ms = discovery_broadcast_ms
     self.client_heartbeat_timeout_ms = client_heartbeat_timeout_ms
+    self.registry_path = registry_path
+    saved = self.read_registry_file()
     
-    # Setup socket for broadcasting discovery messages
+    # Setup socket for broadcasting discovery messages. Clients send their
+    # heartbeats to this socket's port, so reuse the saved one if we can.
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-    sock.bind(("", 0))
+    try:
+      sock.bind(("", saved.get("server_port", 0)))
+    except OSError:
+      log.warning("Could not reuse port %s, clients will have to rediscover the server", saved.get("server_port"))
+      sock.bind(("", 0))
     sock.settimeout(receive_timeout_ms / 1000)
     self.sock_discovery = sock
 
@@ -43,14 +155,25 @@ class AmbilightServer:
     sock.settimeout(receive_timeout_ms / 1000)
     self.sock_data = sock
 
-    self.clients: Dict[str, ambilight_pb2.Message.Config] = {}
+    # Registered clients. The send path reads registry.snapshot without locking.
+    self.registry = ClientRegistry(client_heartbeat_timeout_ms)
 
-    # Lock to protect the clients list
-    self.client_lock = threading.Lock()
+    # Time from the first client registering (after none) to the first DATA
+    # from a new frame going out, to keep an eye on how quickly an idle
+    # pipeline resumes (see data_sent)
+    self.had_clients = False
+    self.demand_since_s = None
+    self.resume_latency_ms = None
+    self.registry_changed = False
+    self.registry_dirty = threading.Event()
+    self.registry.subscribe(self.on_registry_change)
+    self.restore_clients(saved.get("clients", []))
 
     self.discovery_thread = None
     self.ntp_thread = None
     self.cleanup_thread = None
+    self.persist_thread = None
+    self.stats_thread = None
 
     # Lock to protect time variables
     self.ntp_lock = threading.Lock()
@@ -58,12 +181,18 @@ class AmbilightServer:
     self.perf_counter_at_last_ntp = -1
     self.sequence_number = 0
 
+    # Preallocated buffer for fast-path DATA packets. Output threads for
+    # different groups take turns using it.
+    self.send_lock = threading.Lock()
+    self.fast_encoder = fast_packet.Encoder(self.MAX_MESSAGE_BYTES - fast_packet.HEADER.size)
+    self.chunked_encoder = fast_packet.ChunkedEncoder(self.MAX_MESSAGE_BYTES)
+
   '''
   Gets time from the NTP server and updates member variables.
   '''
   def update_time(self):
     while True:
-      print("Getting NTP time")
+      log.debug("Getting NTP time")
       latest_ntp_time_ms = NTP.get_ntp_time_ms()
       
       if latest_ntp_time_ms:
@@ -71,8 +200,10 @@ class AmbilightServer:
         self.ntp_time_ms = latest_ntp_time_ms
         self.perf_counter_at_last_ntp = time.perf_counter()
         self.ntp_lock.release()
-
-      time.sleep(self.NTP_PERIOD_MS)
+        time.sleep(self.NTP_PERIOD_MS / 1000)
+      else:
+        # retry soon, e.g. when we started before the network was fully up
+        time.sleep(self.NTP_RETRY_MS / 1000)
 
   '''
   Returns the current time
@@ -85,76 +216,204 @@ class AmbilightServer:
     return timestamp
 
   '''
-  Sends discovery packets every DISCOVERY_BROADCAST_MS, listens for config 
-  packets, and when received, adds the client's information to the client list
-  and sends an ACK. Runs in a loop in its own thread.
+  Returns a monotonic time in ms for heartbeat bookkeeping. Unlike
+  get_time_ms() it does not jump when the first NTP response arrives.
+  '''
+  def clock_ms(self) -> int:
+    return int(time.monotonic() * 1000)
+
+  '''
+  Sends discovery packets every DISCOVERY_BROADCAST_MS, and in between listens
+  for client messages (config, heartbeat, receiver report) on the discovery
+  socket. Runs in a loop in its own thread. While the set of clients is stable
+  the interval backs off to DISCOVERY_BACKOFF_MAX_MS; any change, or having no
+  clients at all, resets it.
   '''
   def discovery_broadcast(self):
+    next_broadcast_s = time.perf_counter()
+    interval_ms = self.discovery_broadcast_ms
     while True:
-      message = ambilight_pb2.Message()
-      print("Sending discovery message")
+      now_s = time.perf_counter()
+      if self.registry_changed or not self.registry.snapshot:
+        self.registry_changed = False
+        interval_ms = self.discovery_broadcast_ms
+        next_broadcast_s = min(next_broadcast_s, now_s + interval_ms / 1000)
+      if now_s >= next_broadcast_s:
+        log.debug("Sending discovery message", extra={"rate_limit": True})
+        try:
+          self.send(ambilight_pb2.MessageType.DISCOVERY, (self.UDP_BROADCAST_IP, self.UDP_BROADCAST_PORT))
+        except (socket.timeout):
+          log.warning("Discovery socket send timeout", extra={"rate_limit": True})
+        except:
+          log.exception("Failed discovery socket send", extra={"rate_limit": True})
+        next_broadcast_s = now_s + interval_ms / 1000
+        interval_ms = min(interval_ms * 2, max(self.DISCOVERY_BACKOFF_MAX_MS, self.discovery_broadcast_ms))
 
-      try:
-        self.send(ambilight_pb2.MessageType.DISCOVERY, (self.UDP_BROADCAST_IP, self.UDP_BROADCAST_PORT))
-      except (socket.timeout):
-        print("Discovery socket send timeout")
-      except:
-        print("Failed discovery socket send")
-
-      # Listen for messages on the discovery port and the data port
+      # Listen until the next broadcast is due, so that receiver reports from
+      # several clients are not limited to one message per broadcast interval
+      self.sock_discovery.settimeout(max(next_broadcast_s - time.perf_counter(), 0.001))
       try:
         data, addr = self.sock_discovery.recvfrom(self.MAX_MESSAGE_BYTES)
         if (len(data) > 0):
-          print(f"Received message from {addr}")
-          message.ParseFromString(data)
-          if message.type == ambilight_pb2.MessageType.CONFIG:
-            print(f"Received config message")
-            client_ip = message.config.ipv4
-            client_port = message.config.port
-            print(f"Adding client {client_ip}:{client_port}")
-            
-            timestamp = self.get_time_ms()
-            self.client_lock.acquire()
-            self.clients[self.addr_to_str((client_ip, client_port))] = Client(message.config, timestamp)
-            self.client_lock.release()
-
-            print("Sending config ack")
-            self.send(ambilight_pb2.MessageType.ACK_DISCOVERY, (client_ip, client_port))
-          if message.type == ambilight_pb2.MessageType.HEARTBEAT:
-            print("Sending heartbeat ack")
-            # pull the client ip/addr from the recvfrom returned addr
-            client_ip = addr[0]
-            client_port = addr[1]
-            self.send(ambilight_pb2.MessageType.ACK_HEARTBEAT, (client_ip, client_port))
-            
-            # update last_seen
-            last_seen = self.get_time_ms()
-            self.client_lock.acquire()
-            self.clients[self.addr_to_str((client_ip, client_port))].last_seen = last_seen
-            self.client_lock.release()
+          self.handle_message(data, addr)
       except (socket.timeout):
-        print("Discovery socket read timeout")
+        pass
       except:
-        print("Failed discovery socket read")
+        log.exception("Failed discovery socket read", extra={"rate_limit": True})
+
+  '''
+  Parses and handles a single message received from a client.
+  '''
+  def handle_message(self, data: bytes, addr: Tuple[str, int]):
+    message = ambilight_pb2.Message()
+    message.ParseFromString(data)
+
+    if message.type == ambilight_pb2.MessageType.CONFIG:
+      log.info("Received config message from %s", addr)
+      client_ip = message.config.ipv4
+      client_port = message.config.port
+      log.info("Adding client %s:%s", client_ip, client_port)
+
+      # Negotiate the DATA format: the client advertises the highest format it
+      # can decode, we pick the highest one both sides support
+      client = Client(message.config, 0)
+      client.data_format = min(message.config.data_format, self.MAX_DATA_FORMAT)
+      if client.data_format == ambilight_pb2.DataFormat.RAW_RGB and \
+         message.config.num_leds * 3 > self.MAX_MESSAGE_BYTES - fast_packet.HEADER.size:
+        # too many LEDs for a single fast-path packet and the client can't do chunks
+        client.data_format = ambilight_pb2.DataFormat.PROTOBUF
+      self.registry.add((client_ip, client_port), client, self.clock_ms())
+
+      log.info("Sending config ack, data format %s", ambilight_pb2.DataFormat.Name(client.data_format))
+      ack = ambilight_pb2.Message()
+      ack.type = ambilight_pb2.MessageType.ACK_DISCOVERY
+      ack.sender = ambilight_pb2.Sender.SERVER
+      ack.sequence_number = self.sequence_number
+      ack.config.data_format = client.data_format
+      self.send_message_with_timestamp(ack, (client_ip, client_port))
+    elif message.type == ambilight_pb2.MessageType.HEARTBEAT:
+      # pull the client ip/addr from the recvfrom returned addr
+      self.send(ambilight_pb2.MessageType.ACK_HEARTBEAT, addr)
+
+      # update last_seen
+      if self.registry.touch(addr, self.clock_ms()) is None:
+        log.info("Heartbeat from unregistered client %s", self.addr_to_str(addr), extra={"rate_limit": True})
+    elif message.type == ambilight_pb2.MessageType.RECEIVER_REPORT:
+      # a report is as good as a heartbeat
+      client = self.registry.touch(addr, self.clock_ms())
+      if client is None:
+        log.info("Ignoring receiver report from unregistered client %s", self.addr_to_str(addr),
+                 extra={"rate_limit": True})
+        return
+      rate_changed = client.apply_report(message.report)
+      if rate_changed:
+        log.info("Client %s: loss %.1f%%, jitter %.1f ms, send rate now %.0f Hz", self.addr_to_str(addr),
+                 client.loss_fraction * 100, client.jitter_ms, client.send_rate_hz)
+
+  '''
+  Starts the resume latency measurement when the first client registers,
+  resets the discovery backoff and schedules the registry to be saved.
+  '''
+  def on_registry_change(self, snapshot):
+    if not snapshot:
+      self.demand_since_s = None
+    elif not self.had_clients:
+      self.demand_since_s = time.perf_counter()
+    self.had_clients = bool(snapshot)
+    self.registry_changed = True
+    self.registry_dirty.set()
+
+  '''
+  Returns the contents of the saved registry file, or an empty dict if there
+  is none.
+  '''
+  def read_registry_file(self) -> dict:
+    if not self.registry_path:
+      return {}
+    try:
+      with open(self.registry_path) as f:
+        return json.load(f)
+    except OSError:
+      return {}
+    except ValueError:
+      log.warning("Ignoring corrupt client registry %s", self.registry_path)
+      return {}
+
+  '''
+  Registers the clients saved by the last run as if they had just sent their
+  CONFIG. They are sent DATA right away and expire like any other client if
+  they don't heartbeat within the timeout.
+  '''
+  def restore_clients(self, saved_clients):
+    for saved in saved_clients:
+      try:
+        config = json_format.ParseDict(saved["config"], ambilight_pb2.Message.Config())
+        client = Client(config, 0)
+        client.data_format = min(saved.get("data_format", ambilight_pb2.DataFormat.PROTOBUF), self.MAX_DATA_FORMAT)
+      except (KeyError, TypeError, json_format.ParseError):
+        log.warning("Ignoring invalid saved client %s", saved)
+        continue
+      log.info("Restoring client %s, waiting for its heartbeat", self.addr_to_str(client.addr))
+      self.registry.add(client.addr, client, self.clock_ms())
+
+  '''
+  Writes the registry to registry_path whenever it changes. Runs in a loop in
+  its own thread, so the disk write never holds up the thread that changed the
+  registry. The write is atomic.
+  '''
+  def persist_clients(self):
+    while True:
+      self.registry_dirty.wait()
+      self.registry_dirty.clear()
+      saved = {
+        "server_port": self.sock_discovery.getsockname()[1],
+        "clients": [{"config": json_format.MessageToDict(client.config, preserving_proto_field_name=True),
+                     "data_format": client.data_format} for client in self.registry.snapshot],
+      }
+      tmp_path = self.registry_path + ".tmp"
+      try:
+        with open(tmp_path, "w") as f:
+          json.dump(saved, f)
+        os.replace(tmp_path, self.registry_path)
+      except OSError:
+        log.exception("Failed to save client registry", extra={"rate_limit": True})
+
+  '''
+  Returns a dict of link statistics for each registered client, keyed by
+  "ipv4:port".
+  '''
+  def get_client_stats(self) -> Dict[str, dict]:
+    return {self.addr_to_str(client.addr): client.stats() for client in self.registry.snapshot}
 
-      time.sleep(self.discovery_broadcast_ms / 1000)
+  '''
+  Logs the link statistics of every client that sends receiver reports, every
+  STATS_PERIOD_MS. Runs in a loop in its own thread.
+  '''
+  def log_client_stats(self):
+    while True:
+      time.sleep(self.STATS_PERIOD_MS / 1000)
+      for addr, stats in self.get_client_stats().items():
+        if stats["send_rate_hz"] is None:
+          continue
+        log.info("Client %s: loss %.1f%%, jitter %.1f ms, send rate %.0f Hz, %d frames sent, %d paced", addr,
+                 stats["loss_fraction"] * 100, stats["jitter_ms"], stats["send_rate_hz"], stats["frames_sent"],
+                 stats["frames_paced"])
 
   '''
-  Removes clients from whom we have not received a heartbeat
+  Removes clients from whom we have not received a heartbeat. Sleeps until the
+  earliest heartbeat deadline instead of scanning every client periodically.
   '''
   def cleanup_clients(self):
     while True:
-      cur_time_ms = self.get_time_ms()
-      to_remove = []
-      self.client_lock.acquire()
-      for client_name, client in self.clients.items():
-        if (cur_time_ms - client.last_seen) > self.client_heartbeat_timeout_ms:
-          print(f"Missed heartbeats, removing {client.config.ipv4}:{client.config.port}")
-          to_remove.append(client_name)
-      for client_name in to_remove:
-        del self.clients[client_name]
-      self.client_lock.release()
-      time.sleep(self.client_heartbeat_timeout_ms / 1000)
+      for client in self.registry.expire(self.clock_ms()):
+        log.info("Missed heartbeats, removing %s:%s", client.config.ipv4, client.config.port)
+
+      next_deadline_ms = self.registry.next_deadline_ms()
+      if next_deadline_ms is None:
+        sleep_ms = self.client_heartbeat_timeout_ms
+      else:
+        sleep_ms = min(max(next_deadline_ms - self.clock_ms(), 1), self.client_heartbeat_timeout_ms)
+      time.sleep(sleep_ms / 1000)
 
   '''
   Runs the server's discovery broadcast.
@@ -164,38 +423,100 @@ class AmbilightServer:
       self.discovery_thread = threading.Thread(target=self.discovery_broadcast)
       self.discovery_thread.start()
     else:
-      print("Discovery thread is already running!")
+      log.warning("Discovery thread is already running!")
     if self.ntp_thread is None:
       self.ntp_thread = threading.Thread(target=self.update_time)
       self.ntp_thread.start()
     else:
-      print("NTP thread is already running!")  
+      log.warning("NTP thread is already running!")  
     if self.cleanup_thread is None:
       self.cleanup_thread = threading.Thread(target=self.cleanup_clients)
       self.cleanup_thread.start()
+    if self.persist_thread is None and self.registry_path:
+      self.persist_thread = threading.Thread(target=self.persist_clients, daemon=True)
+      self.persist_thread.start()
+    if self.stats_thread is None:
+      self.stats_thread = threading.Thread(target=self.log_client_stats, daemon=True)
+      self.stats_thread.start()
   
   '''
   Sends a message. If the to_client field is empty, defaults to sending the
-  message to all clients. 
+  message to all clients, or only to the clients in the given groups. DATA goes
+  out as a fast-path binary packet to clients that negotiated RAW_RGB, and as a
+  protobuf Message to everyone else.
   '''
-  def send(self, type: ambilight_pb2.MessageType, to_client: Tuple[str, int]=ALL_CLIENTS, payload: bytes=b"") -> bool:
+  def send(self, type: ambilight_pb2.MessageType, to_client: Tuple[str, int]=ALL_CLIENTS, payload: bytes=b"",
+           groups: Tuple[str, ...]=None) -> bool:
+    if to_client == self.ALL_CLIENTS:
+      with self.send_lock:
+        self.send_to_all(type, payload, groups)
+    else:
+      self.send_message_with_timestamp(self.new_message(type, payload), to_client)
+    
+    return True
+
+  '''
+  Sends a message to all clients in groups (all clients if None). Called with
+  send_lock held.
+  '''
+  def send_to_all(self, type: ambilight_pb2.MessageType, payload: bytes, groups: Tuple[str, ...]) -> None:
+    now_s = time.perf_counter()
+    message = None
+    packet = None
+    chunks = None
+    for client in self.registry.snapshot:
+      if groups is not None and client.group not in groups:
+        continue
+      # DATA is paced per client according to its receiver reports
+      if type == ambilight_pb2.MessageType.DATA:
+        if not client.due(now_s):
+          continue
+        client.frames_sent += 1
+        if client.data_format == ambilight_pb2.DataFormat.RAW_RGB:
+          # num_leds is only what the client declared, so check the frame
+          # itself; one too large for a packet goes out as protobuf instead
+          if getattr(payload, "nbytes", len(payload)) <= self.MAX_MESSAGE_BYTES - fast_packet.HEADER.size:
+            if packet is None:    # encode once per frame, shared by all fast-path clients
+              packet = self.fast_encoder.encode(self.sequence_number, self.get_time_ms(), payload)
+            self.send_packet(packet, client.addr)
+            continue
+          log.warning("Frame too large for a RAW_RGB packet to %s (declared %d LEDs), sending protobuf",
+                      self.addr_to_str(client.addr), client.config.num_leds, extra={"rate_limit": True})
+        if client.data_format == ambilight_pb2.DataFormat.RAW_RGB_CHUNKED:
+          if chunks is None:
+            chunks = self.chunked_encoder.encode(self.sequence_number, self.get_time_ms(), payload)
+          for chunk in chunks:
+            self.send_packet(chunk, client.addr)
+          continue
+      # protobuf clients share one Message, only built if there are any
+      if message is None:
+        message = self.new_message(type, payload)
+      self.send_message_with_timestamp(message, client.addr)
+
+  '''
+  Called after DATA for a frame published at frame_s (time.perf_counter()) went
+  out. The first one published after the first client registered ends the
+  resume latency measurement; resends of a frame from before don't count.
+  '''
+  def data_sent(self, frame_s: float) -> None:
+    demand_since_s = self.demand_since_s
+    if demand_since_s is not None and frame_s >= demand_since_s and self.registry.snapshot:
+      self.resume_latency_ms = (time.perf_counter() - demand_since_s) * 1000
+      self.demand_since_s = None
+      log.info("First DATA from a new frame sent %.1f ms after first CONFIG", self.resume_latency_ms)
+
+  '''
+  Returns a new Message of the given type from the server. DATA messages carry
+  payload as their LED data.
+  '''
+  def new_message(self, type: ambilight_pb2.MessageType, payload: bytes=b""):
     message = ambilight_pb2.Message()
     message.type = type
     message.sender = ambilight_pb2.Sender.SERVER
     message.sequence_number = self.sequence_number
-
     if type == ambilight_pb2.MessageType.DATA:
-      message.data.led_data = payload
-
-    if to_client == self.ALL_CLIENTS:
-      self.client_lock.acquire()
-      for _, client in self.clients.items():
-        self.send_message_with_timestamp(message, (client.config.ipv4, client.config.port))
-      self.client_lock.release()
-    else:
-      self.send_message_with_timestamp(message, to_client)
-    
-    return True
+      message.data.led_data = bytes(payload)
+    return message
 
   '''
   Computes a timestamp and sends the message with it.
@@ -211,12 +532,24 @@ class AmbilightServer:
     try:
       sock.sendto(message.SerializeToString(), ip_and_port)
       if (self.sequence_number % 100 == 0):
-        print(f"Sent 100 messages to {self.addr_to_str(ip_and_port)} at {message.timestamp}")
+        log.debug("Sent 100 messages to %s at %s", self.addr_to_str(ip_and_port), message.timestamp)
+      self.sequence_number += 1
+    except (socket.timeout):
+      log.warning("Data socket send timeout", extra={"rate_limit": True})
+    except:
+      log.exception("Failed data socket send", extra={"rate_limit": True})
+
+  '''
+  Sends an already encoded fast-path packet on the data socket.
+  '''
+  def send_packet(self, packet, ip_and_port):
+    try:
+      self.sock_data.sendto(packet, ip_and_port)
       self.sequence_number += 1
     except (socket.timeout):
-      print("Data socket send timeout")
+      log.warning("Data socket send timeout", extra={"rate_limit": True})
     except:
-      print("Failed data socket send")
+      log.exception("Failed data socket send", extra={"rate_limit": True})
 
   '''
   Returns the string representation of a (ipv4, port) tuple as "ipv4:port".
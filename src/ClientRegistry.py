@@ -0,0 +1,104 @@
+import heapq
+import itertools
+import threading
+from typing import Dict, List, Optional, Tuple
+
+class ClientRegistry:
+  '''
+  Registry of clients keyed by (ipv4, port).
+
+  Writers (discovery and cleanup threads) serialize on a lock and publish an
+  immutable tuple of clients in `snapshot` after every change. Readers on the
+  hot send path just read `snapshot`, which is a single reference load and
+  needs no lock.
+
+  Heartbeat expiry is tracked with a heap holding one deadline entry per
+  client. A heartbeat only updates the client's last_seen; when the client's
+  entry comes due it is either re-pushed with its real deadline or expired, so
+  cleanup work is proportional to the deadlines that came due rather than to
+  the number of clients.
+
+  Other components can subscribe() to be called with the new snapshot whenever
+  the set of clients changes.
+  '''
+  def __init__(self, heartbeat_timeout_ms: int) -> None:
+    self.heartbeat_timeout_ms = heartbeat_timeout_ms
+    self.snapshot: Tuple = ()
+
+    self._lock = threading.Lock()
+    self._clients: Dict[Tuple[str, int], object] = {}
+    self._deadlines: List = []            # heap of (deadline_ms, tiebreak, addr, client)
+    self._tiebreak = itertools.count()
+    self._subscribers = []
+
+  '''
+  Adds or replaces the client registered at addr.
+  '''
+  def add(self, addr: Tuple[str, int], client, now_ms: int) -> None:
+    with self._lock:
+      client.last_seen = now_ms
+      self._clients[addr] = client
+      heapq.heappush(self._deadlines, (now_ms + self.heartbeat_timeout_ms, next(self._tiebreak), addr, client))
+      self._publish()
+
+  '''
+  Refreshes last_seen for the client at addr. Returns the client, or None if
+  no client is registered at that address.
+  '''
+  def touch(self, addr: Tuple[str, int], now_ms: int):
+    with self._lock:
+      client = self._clients.get(addr)
+      if client is not None:
+        client.last_seen = now_ms
+      return client
+
+  '''
+  Returns the client registered at addr, or None.
+  '''
+  def get(self, addr: Tuple[str, int]):
+    return self._clients.get(addr)
+
+  '''
+  Removes and returns all clients whose heartbeat deadline has passed.
+  '''
+  def expire(self, now_ms: int) -> List:
+    expired = []
+    with self._lock:
+      while self._deadlines and self._deadlines[0][0] <= now_ms:
+        _, _, addr, client = heapq.heappop(self._deadlines)
+        if self._clients.get(addr) is not client:
+          continue    # stale entry for a client that was replaced
+        deadline_ms = client.last_seen + self.heartbeat_timeout_ms
+        if deadline_ms > now_ms:
+          heapq.heappush(self._deadlines, (deadline_ms, next(self._tiebreak), addr, client))
+        else:
+          del self._clients[addr]
+          expired.append(client)
+      if expired:
+        self._publish()
+    return expired
+
+  '''
+  Returns the earliest pending deadline in ms, or None if there are no clients.
+  '''
+  def next_deadline_ms(self) -> Optional[int]:
+    with self._lock:
+      return self._deadlines[0][0] if self._deadlines else None
+
+  '''
+  Calls callback(snapshot) now and after every change to the set of clients.
+  Callbacks run on the writer's thread with the registry locked, so they must
+  be quick and must not call back into the registry.
+  '''
+  def subscribe(self, callback) -> None:
+    with self._lock:
+      self._subscribers.append(callback)
+      callback(self.snapshot)
+
+  def __len__(self) -> int:
+    return len(self.snapshot)
+
+  def _publish(self) -> None:
+    self.snapshot = tuple(self._clients.values())
+    for callback in self._subscribers:
+      callback(self.snapshot)
@@ -1,6 +1,9 @@
 import socket
 import struct
 import time
+import logging
+
+log = logging.getLogger(__name__)
 
 REF_TIME_1970 = 2208988800  # Reference time
 US_POOL_NTP_ADDR = "us.pool.ntp.org"
@@ -16,10 +19,10 @@ def get_ntp_time_ms(addr=US_POOL_NTP_ADDR):
     try:
         client.sendto(NTP_REQUEST_DATA, (addr, NTP_PORT))
     except (socket.timeout):
-        print("NTP socket send timeout")
+        log.warning("NTP socket send timeout")
         return None
     except:
-        print("Failed NTP socket send")
+        log.exception("Failed NTP socket send")
         return None
 
     buf_size = 1024
@@ -33,9 +36,9 @@ def get_ntp_time_ms(addr=US_POOL_NTP_ADDR):
             milliseconds = int(round((seconds + fraction / (2**32))*1000))
             return milliseconds
     except (socket.timeout):
-      print("NTP socket read timeout")
+      log.warning("NTP socket read timeout")
     except:
-        print("Failed NTP socket read")
+        log.exception("Failed NTP socket read")
 
         
     return None
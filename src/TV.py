@@ -1,6 +1,9 @@
 from pywebostv.controls import MediaControl, SystemControl, ApplicationControl, InputControl, TvControl, SourceControl
 from pywebostv.connection import WebOSClient
 import json, time, os, socket, binascii
+import logging
+
+log = logging.getLogger(__name__)
 
 TV_CREDS_FILE = "/home/pi/repos/ambilight-server/src/tv_creds.json"
 BLANK_URL = "https://www.blank.org/"
@@ -13,11 +16,16 @@ WOL_TIMEOUT_S = 10
 WOL_PING_TIMEOUT_S = 30
 
 class TV:
-    def __init__(self):
+    def __init__(self, connect=True):
+        """
+        Reads the stored credentials and, unless connect is False, connects to
+        the TV. Status checks with is_on() only need the stored address.
+        """
         self.client = None
         self._reset_controls()
         self.creds = self._read_creds()
-        self.connect()
+        if connect:
+            self.connect()
 
     def _reset_controls(self):
         """
@@ -37,7 +45,7 @@ class TV:
             with open(TV_CREDS_FILE, "r") as f:
                 data = json.load(f)
         except FileNotFoundError:
-            print(f"{TV_CREDS_FILE} not found, will be written on first connect()")
+            log.info("%s not found, will be written on first connect()", TV_CREDS_FILE)
             return {}
 
         return data
@@ -63,7 +71,7 @@ class TV:
     
         if not self.media or not self.system or not self.app \
         or not self.inp or not self.tv_control or not self.source_control:
-            print("Failed to initialize a control!")
+            log.error("Failed to initialize a control!")
             self._reset_controls()
             return False
         
@@ -82,7 +90,7 @@ class TV:
         self.last_source = self._get_current_source()
         for s in self.sources:
             if s.label == name:
-                print(f"Setting source to {s}")
+                log.info("Setting source to %s", s)
                 self.source_control.set_source(s)
                 return True
         return False
@@ -128,21 +136,21 @@ class TV:
         if self.creds.get("ip"):
             self.client = WebOSClient(self.creds["ip"])
             if not self.is_on():
-                print("TV is not on! Try turning it on manually with turn_on()")
+                log.warning("TV is not on! Try turning it on manually with turn_on()")
                 return False
         else:
-            print("Discovering TV...")
+            log.info("Discovering TV...")
             discovered = WebOSClient.discover()
         
             if not discovered or len(discovered) < 1:
                 self.client = None
                 return False
             else:
-                print(f"Found {len(discovered)} clients")
+                log.info("Found %d clients", len(discovered))
                 self.client = discovered[0]
                 #print(f"Connecting to client at {self.client.local_address[0]}:{self.client.local_address[1]}")
 
-        print(f"Connecting to client at {self.client.host}:{self.client.port}")
+        log.info("Connecting to client at %s:%s", self.client.host, self.client.port)
         self.creds["ip"] = self.client.host
 
         while True:
@@ -150,14 +158,14 @@ class TV:
                 self.client.connect()
                 break
             except ConnectionRefusedError:
-                print("Failed to connect, trying again...")
+                log.warning("Failed to connect, trying again...")
                 pass
 
         for status in self.client.register(self.creds):
             if status == WebOSClient.PROMPTED:
-                    print("Please accept the connect on the TV!")
+                    log.warning("Please accept the connect on the TV!")
             elif status == WebOSClient.REGISTERED:
-                    print("Registration successful!")
+                    log.info("Registration successful!")
         
         self._init_controls()
         self.creds["mac"] = self.system.info()["device_id"]
@@ -188,7 +196,7 @@ class TV:
             self._go_to_source("PS5")
 
     def turn_on(self):
-        print("Attempting to turn on with WOL...")
+        log.info("Attempting to turn on with WOL...")
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         sock.bind(("", 0))
@@ -201,9 +209,9 @@ class TV:
 
         for i in range((int)(WOL_PING_TIMEOUT_S / PING_TIMEOUT_S)):
             if self.is_on():
-                print("Successfully turned on using WOL!")
+                log.info("Successfully turned on using WOL!")
                 return self.connect()
-        print("Failed to turn on using WOL!")
+        log.error("Failed to turn on using WOL!")
         return False
 
     def is_on(self):
@@ -211,5 +219,5 @@ class TV:
     
     def turn_off(self):
         if self.connect():
-            print("Turning off...")
+            log.info("Turning off...")
             self.system.power_off()
\ No newline at end of file
@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 
 ## Imports ###
-from picamera2 import Picamera2, Preview
-from libcamera import Transform
-import pantilthat as pth
+# Heavy, process-specific modules (picamera2, pantilthat, pywebostv via TV,
+# matplotlib) are imported inside the functions that use them, so each process
+# only pays for what it needs and the server comes up quickly.
 import time
+import gc
+import logging
+import signal
+from startup_timeline import StartupTimeline
+STARTUP = StartupTimeline()     # t0 for the startup report, before the slow imports
+
 import cv2
 import numpy as np
 import json
@@ -12,44 +18,47 @@ import os
 import pid_utils
 import sys
 import AmbilightServer
-from proto import ambilight_pb2
-from multiprocessing import Process, Queue
+from multiprocessing import Process, Queue, Event
 import queue   # for the Empty exception
-from matplotlib import pyplot as plt
-import TV
+import threading
+import processing
+import pipelines
+import sd_notify
+from governor import governor_from_setup, governor_settings_from_setup
+from supervisor import Supervisor, Watchdog
+from frame_channel import FrameChannel
+import sched_profile
+import log_utils
+from output_scheduler import OutputScheduler, output_settings_from_setup
+from sinks import FrameSlot, sinks_from_setup
+from config_watcher import ConfigWatcher
 from enum import Enum
 
 ### Defines ###
 DEBUG = False               # set to True to display each frame
 
-NUM_ROWS = 22               # layout of LEDs defines a rectangular grid
-NUM_COLS = 36
-ZONE_SIZE = 6               # how many grid elements to average (see: https://docs.google.com/spreadsheets/d/1SJUuVqygsfONSyFsHIomGW3i-9cAV04BaVC1PwiqIyY/edit#gid=0)
-
-GAMMA_R = 3.0               # gamma to use for color channels (see: https://drive.google.com/file/d/1v7AEu2hqfFiiNiP1ngT0oPzDP944fT0s/view?usp=sharing)
-GAMMA_G = 3.3
-GAMMA_B = 4.0
-
-LUT_R = (((np.arange(256)/255) ** GAMMA_R) * 255).astype('uint8')
-LUT_G = (((np.arange(256)/255) ** GAMMA_G) * 255).astype('uint8')
-LUT_B = (((np.arange(256)/255) ** GAMMA_B) * 255).astype('uint8')
-
-RESOLUTION = (160,128)          # downscale to this resolution for all other processing
-FPS = 90
-DEFAULT_ASPECT = 16/9
-WIDE_ASPECT = 2.39/1
+EXPOSURE_TIME_US = 10000
+ANALOGUE_GAIN = 6.0             # 6x gain + 10ms exposure empirically seems ok
+CAMERA_SETTLE_TIMEOUT_S = 2.0   # upper bound on waiting for manual exposure/gain to take effect
+CAMERA_READY_TIMEOUT_S = 30     # how long to wait for the camera before reporting ready anyway
+CALIBRATION_TIMEOUT_S = 120     # the white-screen routine connects to the TV and waits for the screen
 
 SCRIPT_NAME = os.path.splitext(__file__)[0]
 
 CAMERA_SETUP_PATH = '/home/pi/repos/ambilight-server/src/setup.json'
+CLIENTS_PATH = '/home/pi/repos/ambilight-server/src/clients.json'   # registered clients, restored on restart
 
 TV_STATUS_INTERVAL_S = 5   # how often to check the TV status
 FADE_TIME_S = 1.5   # how quickly to fade in after tv turns on
+SKIP_STATS_INTERVAL_S = 60  # how often to report how many static frames were skipped
+IDLE_POLL_S = 0.5           # how long the camera loop blocks per iteration while idle
+CAMERA_STOP_AFTER_IDLE_S = 60   # stop streaming entirely after this long without demand
+
+log = logging.getLogger("ambilight")
 
 class QMsgCamera:
-    def __init__(self, frame, roi):
+    def __init__(self, frame):
         self.frame = frame
-        self.roi = roi
 
 class QMsgTV:
     class TVStatus(Enum):
@@ -59,18 +68,21 @@ class QMsgTV:
     def __init__(self, status):
         self.status = status
 
-def read_setup_json():
+def read_setup_json(setup_filename=CAMERA_SETUP_PATH):
     """
-    Reads the calibration values stored in the setup.json file and returns a
-    3-element tuple with (pan, tilt, roi).
+    Reads the calibration values stored in the setup.json file and returns them
+    as a dict. Besides pan, tilt and roi the file may set "resolution",
+    "camera_fps" (both written by autotune.py), "gamma" ([r, g, b]),
+    "zone_size", "num_rows", "num_cols", "fade_time_s",
+    "recalibrate_on_drift" and "pipelines" (see pipelines.py); these default to
+    the values in processing.py, FADE_TIME_S, False and a single screen.
     """
     ### Read JSON settings file ###
-    setup_filename = CAMERA_SETUP_PATH   # this file defines the camera setup (pan/tilt and roi)
+    # this file defines the camera setup (pan/tilt and roi)
     try:
         open(setup_filename)
     except OSError:
-        print('Could not open setup file: ' + setup_filename)
-        print('Make sure to run setup_camera.py first.')
+        log.error("Could not open setup file: %s. Make sure to run setup_camera.py first.", setup_filename)
         sys.exit(1)
 
     with open(setup_filename) as json_file:
@@ -80,105 +92,332 @@ def read_setup_json():
     tilt = data['tilt']
     roi = data['roi']
 
-    print('Pan: ' + str(pan))
-    print('Tilt: ' + str(tilt))
-    print('ROI: ' + str(roi))
+    log.info("Pan: %s, tilt: %s, ROI: %s", pan, tilt, roi)
+
+    return data
+
+def pipeline_params_from_setup(data, params=None):
+    """
+    Returns processing.PipelineParams for the given setup.json contents. If the
+    current params are given, only the tables affected by changed settings
+    are recomputed. The processing resolution is only taken from setup.json
+    at startup, since the camera has to be restarted to change it; a ROI saved
+    for a different resolution is scaled to the running one.
+    """
 
-    return (pan, tilt, roi)
+    resolution = processing.resolution_from_setup(data)
+    roi = data['roi']
+    if params is not None and resolution != params.resolution:
+        roi = processing.scale_roi(roi, resolution, params.resolution)
+
+    settings = {
+        'roi': roi,
+        'gamma': tuple(data.get('gamma', (processing.GAMMA_R, processing.GAMMA_G, processing.GAMMA_B))),
+        'zone_size': data.get('zone_size', processing.ZONE_SIZE),
+        'num_rows': data.get('num_rows', processing.NUM_ROWS),
+        'num_cols': data.get('num_cols', processing.NUM_COLS),
+    }
+    if params is None:
+        return processing.PipelineParams(resolution=resolution, **settings)
+    return params.replace(**settings)
+
+
+def move_pan_tilt(pan, tilt):
+    """
+    Moves the pan-tilt head to the given position.
+    """
+    import pantilthat as pth
 
+    pt = pth.PanTilt()
+    pt.pan(pan)
+    pt.tilt(tilt)
 
-def setup_camera():
+def setup_camera(timeline, camera_num=0, standby=None):
     """
     Initializes the camera and pan-tilt head, and applies the proper settings. 
-    Returns the camera object and the ROI (region of interest).
+    The pan-tilt head moves in a separate thread while the camera initializes.
+    Only camera 0 sits on the pan-tilt head.
+    A standby worker (see supervisor.py) imports picamera2, then waits for the
+    standby event before opening the camera. It takes over from a failed
+    worker that the supervisor has already reaped, with the head still in
+    position, so it neither kills the previous PID nor moves the head.
+    Returns the camera object and the setup.json contents.
     """
+    from picamera2 import Picamera2
+    from libcamera import Transform
+    timeline.mark("camera: imported picamera2")
+    if standby is not None:
+        standby.wait()
 
     # Lock camera usage via pid
-    pid_utils.update_pid_file("camera.pid")
+    pid_utils.update_pid_file(f"camera{camera_num}.pid" if camera_num else "camera.pid", kill_previous=standby is None)
+
+    ### Adjust pantilt head ###
+    setup = read_setup_json()
+    pan_tilt_thread = threading.Thread(target=move_pan_tilt, args=(setup['pan'], setup['tilt']))
+    move_head = camera_num == 0 and standby is None
+    if move_head:
+        pan_tilt_thread.start()
 
     ### Setup PiCamera ###
-    camera = Picamera2()
-    time.sleep(2.0) # sleep just after setting up camera to ensure the following param sets work properly
+    camera = Picamera2(camera_num)
+    timeline.mark("camera: opened")
 
-    camera.preview_configuration.main.size = RESOLUTION
+    resolution = processing.resolution_from_setup(setup)
+    camera.preview_configuration.main.size = resolution
     camera.preview_configuration.main.format = "BGR888"
     camera.preview_configuration.queue = False
-    camera.preview_configuration.controls.FrameRate = FPS
+    camera.preview_configuration.controls.FrameRate = processing.fps_from_setup(setup)
     camera.preview_configuration.controls.AeEnable = False
-    camera.preview_configuration.controls.ExposureTime = 10000
-    camera.preview_configuration.controls.AnalogueGain = 6.0          # 6x gain + 10ms exposure empirically seems ok
+    camera.preview_configuration.controls.ExposureTime = EXPOSURE_TIME_US
+    camera.preview_configuration.controls.AnalogueGain = ANALOGUE_GAIN
     camera.preview_configuration.controls.ColourGains = (1.95, 1.25)  # empirically found to match "gray" on TV
     camera.preview_configuration.transform = Transform(vflip=1, hflip=1)
     camera.preview_configuration.align()  # adjust resolution if needed
-    if camera.preview_configuration.main.size != RESOLUTION:
-        print(f"picamera2 changed the configured resolution from {RESOLUTION} to {camera.preview_configuration.main.size}!")
+    if camera.preview_configuration.main.size != resolution:
+        log.warning("picamera2 changed the configured resolution from %s to %s!", resolution, camera.preview_configuration.main.size)
 
-    ### Adjust pantilt head ###
-    pan, tilt, roi = read_setup_json()
-    pt = pth.PanTilt()
-    pt.pan(pan)
-    pt.tilt(tilt)
+    if move_head:
+        pan_tilt_thread.join()
+        timeline.mark("camera: pan-tilt in position")
 
-    return camera, roi
+    return camera, setup
 
-def apply_gamma(led_data):
+def wait_for_camera_settled(camera):
     """
-    Applies the gamma LUT to the given array of led data. Returns the
-    gamma-applied array.
+    Waits until frame metadata shows the manual exposure and gain in effect,
+    instead of sleeping for a fixed time. Returns False on timeout.
     """
 
-    led_data[:,0] = np.transpose(cv2.LUT(led_data[:,0].astype('uint8'),LUT_R))
-    led_data[:,1] = np.transpose(cv2.LUT(led_data[:,1].astype('uint8'),LUT_G))
-    led_data[:,2] = np.transpose(cv2.LUT(led_data[:,2].astype('uint8'),LUT_B))
-    
-    return led_data
+    deadline = time.monotonic() + CAMERA_SETTLE_TIMEOUT_S
+    while time.monotonic() < deadline:
+        metadata = camera.capture_metadata()
+        if abs(metadata.get("ExposureTime", 0) - EXPOSURE_TIME_US) <= 0.05 * EXPOSURE_TIME_US and \
+           abs(metadata.get("AnalogueGain", 0) - ANALOGUE_GAIN) <= 0.1 * ANALOGUE_GAIN:
+            return True
+
+    log.warning("Camera controls did not settle within %s s, continuing anyway", CAMERA_SETTLE_TIMEOUT_S)
+    return False
 
-def camera_loop(q_camera, q_tv):
+def run_calibration(camera, resolution):
     """
-    Sets up the camera and pan-tilt head and kicks off the image capture loop.
+    Finds the screen with the TV white-screen routine and saves it to
+    setup.json as the ROI, from where the processing process reloads it.
     """
+    import TV
+    import calibrate
+
+    try:
+        roi = calibrate.calibrate(camera.capture_array, TV.TV())
+    except (OSError, cv2.error) as e:
+        log.error("Calibration failed: %s", e)
+        return
+    if roi is not None:
+        try:
+            calibrate.save_roi(CAMERA_SETUP_PATH, roi, resolution)
+        except (OSError, ValueError) as e:
+            log.error("Could not save the calibrated ROI: %s", e)
+
+def camera_loop(q_cameras, q_tv, camera_ready, q_timeline, clients_present, profile, calibrate_requested, camera_num=0,
+                watchdog=None, standby=None, open_camera=setup_camera):
+    """
+    Sets up the camera and pan-tilt head and kicks off the image capture loop,
+    putting each frame on every FrameChannel in q_cameras (one per pipeline
+    using this camera). Sets camera_ready once frames are available. Pan/tilt changes
+    in setup.json are applied between frames.
+
+    While capturing, a sparse sample of frames is checked for the camera
+    having moved off the screen (see calibrate.DriftMonitor). Setting
+    calibrate_requested runs the white-screen calibration the next time the TV
+    is on, as does detected drift if setup.json sets "recalibrate_on_drift".
+    Both only apply to a single screen, so pass None for calibrate_requested
+    when running several pipelines.
+
+    Frames are only captured while the TV is on and clients_present is set.
+    Otherwise the loop blocks instead of spinning, and after
+    CAMERA_STOP_AFTER_IDLE_S the camera stops streaming. Capture resumes as soon
+    as clients_present is set again.
+
+    The loop kicks watchdog every iteration and counts frames on it, so a
+    Supervisor can restart a worker that died or hung. A standby worker waits
+    for the standby event before opening the camera (see setup_camera) and
+    resumes with the TV status its predecessor last saw. open_camera is
+    called like setup_camera, e.g. to inject a fake camera.
+    """
+    import calibrate
+
+    sched_profile.apply("camera", profile)
+    timeline = StartupTimeline(STARTUP.t0, q_timeline)
+    watchdog = watchdog or Watchdog()   # nobody reads it when unsupervised
 
     ### Start camera ###
-    camera, roi = setup_camera() 
+    camera, setup = open_camera(timeline, camera_num, standby)
+    watcher = ConfigWatcher(CAMERA_SETUP_PATH)
     camera.start()
+    wait_for_camera_settled(camera)
+    if standby is None:
+        timeline.mark("camera: started and settled")
+    else:
+        log.info("Standby camera worker took over")
+    camera_ready.set()
 
     ### Main loop ###
     last_time = time.perf_counter()   # for tracking duration of loop
-    should_capture = False
+    should_capture = bool(watchdog.tv_on.value)
+    streaming = True
+    idle_since = None
+    drift = calibrate.DriftMonitor()
 
     while True:
-        # Check if there is a new status message from the TV queue
+        watchdog.kick()
+
+        # Check if there is a new status message from the TV queue. Block for a
+        # while if the TV is off, since there is nothing else to do.
         try:
-            qmsg = q_tv.get(block=False)  # non-blocking
+            if should_capture:
+                qmsg = q_tv.get(block=False)  # non-blocking
+            else:
+                qmsg = q_tv.get(block=True, timeout=IDLE_POLL_S)
             
             if qmsg == QMsgTV.TVStatus.ON:
                 should_capture = True
             else:
                 should_capture = False
+            watchdog.tv_on.value = should_capture
         except queue.Empty:
             pass
-        
-        # Only capture and push a frame if the TV is on
-        if should_capture:
+
+        # Apply a new pan/tilt between frames. The drift check below needs the
+        # ROI and resolution, so a setup without them is rejected as a whole.
+        new_setup = watcher.poll()
+        if new_setup:
+            try:
+                pan_tilt = (new_setup['pan'], new_setup['tilt'])
+                processing.scale_roi(new_setup['roi'], processing.resolution_from_setup(new_setup), processing.DEFAULT_RESOLUTION)
+                if camera_num == 0 and pan_tilt != (setup['pan'], setup['tilt']):
+                    log.info("Moving pan-tilt head to pan %s, tilt %s", *pan_tilt)
+                    move_pan_tilt(*pan_tilt)   # ValueError if out of range, OSError on an I2C error
+                setup = new_setup
+            except (KeyError, TypeError, ValueError, OSError) as e:
+                log.warning("Ignoring invalid setup: %s", e)
+
+        # Only capture and push a frame if the TV is on and someone is listening
+        if should_capture and clients_present.is_set():
+            if not streaming:
+                log.info("Clients registered, restarting camera")
+                camera.start()
+                streaming = True
+            idle_since = None
             frame = camera.capture_array()
+            watchdog.frame()
             # print(f"KLG,capture,{time.perf_counter()}")
-            q_camera.put(QMsgCamera(frame, roi))
+            for q_camera in q_cameras:
+                q_camera.put(QMsgCamera(frame))
+
+            resolution = (frame.shape[1], frame.shape[0])
+            if calibrate_requested is None:
+                continue
+            if calibrate_requested.is_set():
+                calibrate_requested.clear()
+                watchdog.kick(CALIBRATION_TIMEOUT_S)
+                run_calibration(camera, resolution)
+            elif drift.add(frame, time.perf_counter()):
+                roi = processing.scale_roi(setup['roi'], processing.resolution_from_setup(setup), resolution)
+                moved = drift.check(roi)
+                if moved:
+                    log.warning("Camera seems to have moved, screen now at %s (ROI %s)", moved, roi)
+                    if setup.get('recalibrate_on_drift'):
+                        calibrate_requested.set()
+            continue
+
+        if idle_since is None:
+            log.info("No TV or no clients, pausing capture")
+            idle_since = time.perf_counter()
+        elif streaming and time.perf_counter() - idle_since > CAMERA_STOP_AFTER_IDLE_S:
+            log.info("Idle, stopping camera")
+            camera.stop()
+            streaming = False
+        if should_capture:
+            clients_present.wait(IDLE_POLL_S)   # wakes up on the first CONFIG
+
+def supervise_camera(args, camera_num=0):
+    """
+    Starts camera_loop(*args, camera_num=camera_num) under a Supervisor (see
+    supervisor.py), which hands over to a standby worker if it dies or stops
+    capturing. The channels, queues and events in args are shared by every
+    worker, so the server, its clients and the processing side never notice a
+    restart. Frames go over lock-free FrameChannels, which a killed worker
+    can't leave locked or half written.
+    """
+    watchdog = Watchdog()
+
+    def start_worker(standby):
+        process = Process(target=camera_loop, args=args,
+                          kwargs={"camera_num": camera_num, "watchdog": watchdog, "standby": standby})
+        process.start()
+        return process
+
+    supervisor = Supervisor(f"camera{camera_num}", start_worker, watchdog, CAMERA_READY_TIMEOUT_S)
+    supervisor.start()
+    return supervisor
 
-def tv_status_loop(q_tv):
+def tv_status_loop(q_tvs, q_timeline, profile):
     """
-    Checks the status of the TV and provides it to the camera process.
+    Provides the TV status to the camera processes, one queue each in q_tvs.
+    Status comes from the device-state daemon (device_state.py) as soon as it
+    changes; a PS5 waking up starts capture right away, since ps5_status.py is
+    turning the TV on.
+    While the daemon is not running, falls back to pinging the TV every
+    TV_STATUS_INTERVAL_S. Only a ping is needed for that, so if the TV address
+    is already known we skip WebOS discovery and connect.
     """
+    import TV
+    import device_state
 
-    tv = TV.TV()
+    sched_profile.apply("tv_status", profile)
+    timeline = StartupTimeline(STARTUP.t0, q_timeline)
+
+    client = device_state.DeviceStateClient()
+    tv = None
+    first = True
     while True:
-        if tv.is_on():
-            q_tv.put(QMsgTV.TVStatus.ON)
-            print("TV is ON!")
+        if not client.connected() and not client.connect():
+            # No daemon, poll the TV ourselves
+            if tv is None:
+                log.warning("Device-state daemon not running, polling the TV directly")
+                tv = TV.TV(connect=False)
+                if not tv.creds.get("ip"):
+                    tv.connect()    # first run, discover the TV to learn its address
+            status = QMsgTV.TVStatus.ON if tv.is_on() else QMsgTV.TVStatus.OFF
+            for q_tv in q_tvs:
+                q_tv.put(status)
+            log.debug("TV is %s!", status.name)
+            if first:
+                timeline.mark("tv: first status reported (polled)")
+                first = False
+            time.sleep(TV_STATUS_INTERVAL_S)
+            continue
+
+        try:
+            event = client.read_event()
+        except ConnectionError as e:
+            log.warning("%s", e)
+            continue
+
+        if event["device"] == device_state.DEVICE_TV:
+            status = QMsgTV.TVStatus.ON if event["state"] == device_state.ON else QMsgTV.TVStatus.OFF
+        elif event["device"] == device_state.DEVICE_PS5 and not event["initial"]:
+            status = QMsgTV.TVStatus.ON if event["state"] == device_state.ON else QMsgTV.TVStatus.OFF
         else:
-            q_tv.put(QMsgTV.TVStatus.OFF)
-            print("TV is OFF!")
-        time.sleep(TV_STATUS_INTERVAL_S)
-    
+            continue
+
+        for q_tv in q_tvs:
+            q_tv.put(status)
+        log.info("TV is %s! (%s %s)", status.name, event['device'], event['state'])
+        if first:
+            timeline.mark("tv: first status reported")
+            first = False
+
 
 def debug_show(frame):
     """
@@ -186,113 +425,336 @@ def debug_show(frame):
     """
 
     if DEBUG:
+        from matplotlib import pyplot as plt
         plt.imshow(frame)
         plt.show()
     
-def process_and_serve(q_camera, aspect_ratio):
+def notify_when_ready(camera_ready, q_timeline):
     """
-    Kicks off the ambilight servers, then waits for frames to arrive from the 
-    camera process. Processes each frame and sends it via the server.
+    Waits for the camera process, then tells systemd we are ready and prints
+    the startup timeline.
     """
 
-    server = AmbilightServer.AmbilightServer()
-    server.run()
+    if not camera_ready.wait(CAMERA_READY_TIMEOUT_S):
+        log.error("Camera not ready after %s s", CAMERA_READY_TIMEOUT_S)
+    sd_notify.notify("READY=1")
+    STARTUP.mark("ready")
+    STARTUP.collect(q_timeline)
+    log.info("%s", STARTUP.report())
+
+def process_frames(q_camera, name, publish, on_reload=None, on_level=None, aspect_ratio="", setup_path=CAMERA_SETUP_PATH):
+    """
+    Waits for frames to arrive from the camera process and processes each one
+    with the settings of the named pipeline (see pipelines.py), calling
+    publish(led_array) with the result. led_array is reused for the next
+    frame, so publish must copy it. Frames that match the last processed one
+    are skipped, the output fades in after the camera starts, and a blank
+    frame is published if the camera stops. Changes to setup.json are swapped
+    in between frames (except resolution and camera_fps, which need a
+    restart), and on_reload is called with the new contents.
+
+    Under thermal or load pressure the governor (see governor.py) lowers the
+    processing resolution and the share of frames processed, and on_level is
+    called with the stage settings and a status line whenever the level
+    changes.
+    """
+
+    setup = pipelines.pipeline_setup(read_setup_json(setup_path), name)
+    params = pipeline_params_from_setup(setup)
+    processor = processing.FrameProcessor(params)    # reuses its buffers from frame to frame
+    fade_time_s = setup.get('fade_time_s', FADE_TIME_S)
+    camera_fps = processing.fps_from_setup(setup)
+    watcher = ConfigWatcher(setup_path)
+    first_frame = True
 
     # Create the data array to write results to
-    led_array = np.zeros((114, 3),dtype='uint8')
+    led_array = np.zeros((params.num_leds, 3),dtype='uint8')
 
     last_time_ms = time.perf_counter() * 1000
-    
+    missed_frames = log_utils.Aggregator(log, "Missed a frame")
+
+    # Skip processing of frames that match the last processed one (paused
+    # playback, static menus) and resend the previous result instead
+    fingerprint = processing.FrameFingerprint()
+    last_stats_time = time.perf_counter()
+
+    governor = governor_from_setup(setup)
+    frame_divider = 1
+    frame_index = 0
+
+    # Everything allocated so far lives for the life of the process, so keep
+    # the garbage collector from rescanning it; the loop below allocates
+    # almost nothing
+    gc.collect()
+    gc.freeze()
+
     gain = 0
+    last_gain = None
     while True:
-        # Get an image and roi from the camera process
+        # Get an image from the camera process
         try:
             msg = q_camera.get(block=True, timeout=TV_STATUS_INTERVAL_S)
-            gain += (FADE_TIME_S / FPS) # fade in from zero
+            gain += (fade_time_s / camera_fps) # fade in from zero
         except queue.Empty:
             # Send a blank frame if we time out, to prevent stuck lighting
             gain = 0
-            led_array = np.zeros((114, 3),dtype='uint8')
-            server.send(type=ambilight_pb2.MessageType.DATA, payload=led_array.tobytes())
+            last_gain = None
+            fingerprint.reset()
+            led_array = np.zeros((params.num_leds, 3),dtype='uint8')
+            publish(led_array)
             continue
 
         # print(f"KLG,process1,{time.perf_counter()}")
 
-        gain = np.clip(gain, 0, 1)
-        frame = msg.frame * gain
-        roi = msg.roi
+        gain = min(max(gain, 0), 1)
+
+        # Swap in new settings between frames, only recomputing affected tables
+        new_setup = watcher.poll()
+        if new_setup:
+            try:
+                pipeline = pipelines.pipeline_setup(new_setup, name)
+                params = pipeline_params_from_setup(pipeline, params)
+                processor.params = params
+                fade_time_s = pipeline.get('fade_time_s', FADE_TIME_S)
+                governor.configure(**governor_settings_from_setup(pipeline))
+                if on_reload:
+                    on_reload(new_setup)
+                fingerprint.reset()     # make sure a static scene picks up the change
+                log.info("Reloaded setup%s: ROI %s, gamma %s, zone size %s", f" of {name}" if name else "",
+                         params.roi, params.gamma, params.zone_size)
+            except (KeyError, TypeError, ValueError, cv2.error) as e:
+                log.warning("Ignoring invalid setup: %s", e)
 
         curr_time_ms = time.perf_counter() * 1000
 
-        if ((curr_time_ms - last_time_ms) > (2 / FPS) * 1000):
-            print(f"Missed a frame! {curr_time_ms - last_time_ms} ms")
+        late = (curr_time_ms - last_time_ms) > (2 / camera_fps) * 1000
+        if late:
+            missed_frames.count(curr_time_ms - last_time_ms)
+        else:
+            missed_frames.flush()
         last_time_ms = curr_time_ms
 
+        # Step down or back up under thermal or load pressure
+        governor.frame(late)
+        if governor.update():
+            stage = governor.settings()
+            processor.scale = stage["scale"]
+            frame_divider = stage["frame_divider"]
+            if on_level:
+                on_level(stage, governor.status())
+
+        if time.perf_counter() - last_stats_time > SKIP_STATS_INTERVAL_S:
+            log.info("Skipped %d of %d frames as unchanged, %s", fingerprint.skipped, fingerprint.total, governor.status())
+            last_stats_time = time.perf_counter()
+
+        frame_index += 1
+        if frame_index % frame_divider:
+            continue
+
+        # Only a frame seen at the same gain can reuse the last result, so the
+        # fade in is never skipped. The output scheduler keeps sending it.
+        if gain == last_gain and fingerprint.matches(msg.frame):
+            continue
+        if gain != last_gain:
+            fingerprint.reset()
+            fingerprint.matches(msg.frame)  # take this frame as the reference
+        last_gain = gain
+
         # print(f"KLG,process2,{time.perf_counter()}")
-        # Do the perspective transform        
-        dst = [[0, 0], [RESOLUTION[0], 0], [RESOLUTION[0], RESOLUTION[1]], [0, RESOLUTION[1]]] # define corners of rectangle (UL, UR, LR, LL)
-        M = cv2.getPerspectiveTransform(np.float32(roi), np.float32(dst))     # 0.1ms
-        crop = cv2.warpPerspective(frame, M, RESOLUTION)                      # 1.8ms
-        # print(f"KLG,process3,{time.perf_counter()}")
-
-        if aspect_ratio == 'wide':
-            crop_portion = int((1 - DEFAULT_ASPECT / WIDE_ASPECT)/2 * crop.shape[0])  # amount to crop from top/bottom
-            crop = crop[crop_portion:crop.shape[0]-crop_portion,:]
-
-        debug_show(crop)
-
-        # Resize to the LED grid size
-        led_array_resize = cv2.resize(crop,(NUM_COLS,NUM_ROWS))
-        # print(f"KLG,process4,{time.perf_counter()}")
-
-        debug_show(led_array_resize)
-        
-        # Average across 6 rows/cols into the frame
-        led_array_resize2 = np.zeros(led_array_resize.shape, dtype='uint8')
-        led_array_resize2[:,0] = np.mean(led_array_resize[:,:ZONE_SIZE],axis=1)   # left side
-        led_array_resize2[:,-1] = np.mean(led_array_resize[:,-ZONE_SIZE:],axis=1)   # right side
-        led_array_resize2[0,1:-1] = np.mean(led_array_resize[:ZONE_SIZE,1:-1],axis=0)   # top side
-        led_array_resize2[-1,1:-1] = np.mean(led_array_resize[-ZONE_SIZE:,1:-1],axis=0)   # bottom side
-        
-        # print(f"KLG,process5,{time.perf_counter()}")
-
-        debug_show(led_array_resize2)
-        
-        # Need to make this frame size agnostic
-        led_array[0:17] = led_array_resize2[-1,16::-1]          # bottom left (center to corner)
-        led_array[17:39] = led_array_resize2[::-1,0]             # left (bottom to top)
-        led_array[39:75] = led_array_resize2[0,:]                # top (left to right)
-        led_array[75:97] = led_array_resize2[:,-1]               # right (top to bottom)
-        led_array[97:114] = led_array_resize2[-1,35:18:-1]       # bottom right (corner to center)
-        
-        # print(f"KLG,process6,{time.perf_counter()}")
-
-        # Apply gamma luts
-        led_array = apply_gamma(led_array)
+        led_array = processor.process(msg.frame, gain, aspect_ratio, show=debug_show if DEBUG else None)
 
         # print(f"KLG,process7,{time.perf_counter()}")
 
-        server.send(type=ambilight_pb2.MessageType.DATA, payload=led_array.tobytes())
+        publish(led_array)
+        if time.perf_counter() * 1000 - curr_time_ms > 1000 / camera_fps:
+            governor.overran()
+        if first_frame:
+            log.info("First LED frame processed %.1f ms after start", STARTUP.elapsed_ms())
+            first_frame = False
         # print(f"KLG,process8,{time.perf_counter()}")
 
+def process_and_serve(q_camera, aspect_ratio, camera_ready, q_timeline, clients_present, profile):
+    """
+    Kicks off the ambilight servers, then processes frames from the camera
+    process (see process_frames) and publishes each one to the output sinks,
+    which each run on their own thread: the output scheduler sends to
+    the clients at its own refresh rate, and any sinks listed in setup.json
+    take frames at their own pace. Output settings reload with setup.json,
+    sinks need a restart.
+    clients_present is set while any clients are registered or local sinks
+    are configured, so the camera can idle without demand.
+    """
+
+    setup = read_setup_json()
+
+    slot = FrameSlot()
+    local_sinks = sinks_from_setup(setup, slot)
+
+    server = AmbilightServer.AmbilightServer(registry_path=CLIENTS_PATH)
+    server.registry.subscribe(lambda snapshot: clients_present.set() if snapshot or local_sinks else clients_present.clear())
+
+    # The server threads inherit the "server" profile, off the processing
+    # core; this thread and the output and sink threads get "processing"
+    sched_profile.apply("server", profile)
+    server.run()
+    STARTUP.mark("server running")
+    sched_profile.apply("processing", profile)
+
+    # Send to clients at a fixed refresh rate, blending between processed frames
+    output = OutputScheduler(slot, server, **output_settings_from_setup(setup))
+    output.start()
+    for sink in local_sinks:
+        sink.start()
+
+    threading.Thread(target=notify_when_ready, args=(camera_ready, q_timeline), daemon=True).start()
+
+    process_frames(q_camera, pipelines.DEFAULT_GROUP, slot.publish, aspect_ratio=aspect_ratio,
+                   on_reload=lambda new_setup: output.configure(**output_settings_from_setup(new_setup)),
+                   on_level=lambda stage, status: apply_governor_level(output, stage, status))
+
+def apply_governor_level(output, stage, status):
+    """
+    Applies a new governor stage to the output and shows the status in
+    systemctl status. Only the main process may notify systemd (NotifyAccess
+    defaults to main for Type=notify), so pipeline workers don't call this.
+    """
+    output.limit_refresh(stage["refresh_hz"])
+    sd_notify.notify(f"STATUS={status}")
+
+def pipeline_worker(q_camera, q_leds, name, profile):
+    """
+    Runs one pipeline of a multi-screen setup in its own process: processes
+    its frames on its own core and puts (name, led_array) on q_leds for the
+    server process.
+    """
+    sched_profile.apply("processing", profile)
+    process_frames(q_camera, name, lambda led_array: q_leds.put((name, led_array.copy())))
+
+def serve_pipelines(q_leds, camera_ready, q_timeline, clients_present, profile):
+    """
+    Kicks off the ambilight servers for a multi-screen setup and publishes the
+    LED frames arriving from the pipeline workers on q_leds. Each pipeline has
+    its own slot, output scheduler and sinks, all sharing one server, and its
+    output scheduler only sends to the pipeline's client groups. This process
+    and all its threads get the "server" scheduling profile, leaving the
+    processing cores to the workers.
+    """
+
+    sched_profile.apply("server", profile)
+    setup = read_setup_json()
+    screens = pipelines.pipelines_from_setup(setup)
+
+    server = AmbilightServer.AmbilightServer(registry_path=CLIENTS_PATH)
+    slots = {}
+    outputs = []
+    local_sinks = []
+    for index, screen in enumerate(screens):
+        slot = slots[screen["name"]] = FrameSlot()
+        outputs.append(OutputScheduler(slot, server, groups=pipelines.groups(screens, index),
+                                       **output_settings_from_setup(setup)))
+        local_sinks += sinks_from_setup(screen, slot)
+
+    server.registry.subscribe(lambda snapshot: clients_present.set() if snapshot or local_sinks else clients_present.clear())
+    server.run()
+    STARTUP.mark("server running")
+
+    for sink in outputs + local_sinks:
+        sink.start()
+
+    threading.Thread(target=notify_when_ready, args=(camera_ready, q_timeline), daemon=True).start()
+    log.info("Serving %d screens: %s", len(screens), ", ".join(screen["name"] for screen in screens))
+
+    watcher = ConfigWatcher(CAMERA_SETUP_PATH)
+    while True:
+        try:
+            name, led_array = q_leds.get(block=True, timeout=IDLE_POLL_S)
+            slots[name].publish(led_array, copy=False)     # a fresh array from the queue
+        except queue.Empty:
+            pass
+
+        new_setup = watcher.poll()
+        if new_setup:
+            try:
+                settings = output_settings_from_setup(new_setup)
+            except (TypeError, ValueError) as e:
+                log.warning("Ignoring invalid output settings: %s", e)
+                continue
+            for output in outputs:
+                output.configure(**settings)
 
 def ambilight():
     """
     Runs the ambilight program by kicking off a child camera process that sends
     frames over a queue to the process_and_serve function, which processes each
     frame and sends the resulting color data to the AmbilightServer object.
+    The camera process is restarted if it dies or hangs (see supervise_camera).
+    With "pipelines" in setup.json, see ambilight_pipelines() instead.
     """
 
-    q_camera = Queue()
+    STARTUP.mark("imports done")
+
+    # Each process pins itself and sets its own priority (see sched_profile.py)
+    setup = read_setup_json()
+    profile = sched_profile.profile_from_setup(setup)
+    if setup.get("pipelines"):
+        ambilight_pipelines(setup, profile)
+        return
+
+    # Camera, TV status and server all initialize in parallel
+    q_camera = FrameChannel(processing.resolution_from_setup(setup))
     q_tv = Queue()
-    camera_process = Process(target=camera_loop, args=(q_camera, q_tv))
-    camera_process.start()
+    q_timeline = Queue()
+    camera_ready = Event()
+    clients_present = Event()
+    calibrate_requested = Event()
+
+    # SIGUSR1 recalibrates the ROI, e.g. systemctl kill -s USR1 ambilight.service
+    signal.signal(signal.SIGUSR1, lambda signum, frame: calibrate_requested.set())
 
-    tv_status_process = Process(target=tv_status_loop, args=(q_tv,))
+    supervise_camera(([q_camera], q_tv, camera_ready, q_timeline, clients_present, profile, calibrate_requested))
+
+    tv_status_process = Process(target=tv_status_loop, args=([q_tv], q_timeline, profile))
     tv_status_process.start()
+    STARTUP.mark("child processes started")
+
+    process_and_serve(q_camera, "", camera_ready, q_timeline, clients_present, profile)
+
+def ambilight_pipelines(setup, profile):
+    """
+    Runs a multi-screen setup: one camera process per camera, feeding one
+    worker process per pipeline, each on its own core. The workers send their
+    LED frames back to this process, which runs the shared server.
+    """
+
+    # Calibration only handles a single screen. Ignore SIGUSR1 rather than let
+    # it terminate the service, in the child processes too.
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+
+    screens = pipelines.pipelines_from_setup(setup)
+    q_cameras = {screen["name"]: FrameChannel(processing.resolution_from_setup(setup)) for screen in screens}
+    q_leds = Queue()
+    q_timeline = Queue()
+    camera_ready = Event()
+    clients_present = Event()
+
+    q_tvs = []
+    for camera_num in pipelines.cameras(screens):
+        q_tv = Queue()
+        q_tvs.append(q_tv)
+        fed = [q_cameras[screen["name"]] for screen in screens if screen["camera"] == camera_num]
+        supervise_camera((fed, q_tv, camera_ready, q_timeline, clients_present, profile, None), camera_num)
+
+    for index, screen in enumerate(screens):
+        worker_profile = pipelines.worker_profile(profile, screens, index)
+        Process(target=pipeline_worker, args=(q_cameras[screen["name"]], q_leds, screen["name"], worker_profile)).start()
+
+    Process(target=tv_status_loop, args=(q_tvs, q_timeline, profile)).start()
+    STARTUP.mark("child processes started")
+
+    serve_pipelines(q_leds, camera_ready, q_timeline, clients_present, profile)
 
-    process_and_serve(q_camera, "")
 
 if __name__ == '__main__':
+    log_utils.setup_logging()
     ambilight()
-    print('Exiting')
+    log.info("Exiting")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Tunes the processing resolution and camera frame rate for this machine.
+Benchmarks the per-frame work of process_frames at each candidate
+resolution, then picks the highest frame rate and, within it, the highest
+resolution whose 95th percentile frame time fits the frame period with
+headroom to spare. The choice is saved to setup.json with the ROI scaled to
+the new resolution. Restart the ambilight service to apply it.
+
+    python3 autotune.py [--dry-run] [--setup PATH]
+"""
+
+## Imports ###
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+import pipelines
+import processing
+from ambilight import CAMERA_SETUP_PATH
+
+# All 5:4 like the default, so the ROI scales without a change of field of view
+RESOLUTIONS = [(480, 384), (400, 320), (320, 256), (240, 192), (160, 128), (80, 64)]
+FPS_CANDIDATES = [90, 60, 45, 30]
+HEADROOM = 0.5              # processing may use at most this fraction of the frame period
+WARMUP_FRAMES = 20
+BENCH_FRAMES = 300
+PERCENTILE = 95
+NUM_SYNTHETIC_FRAMES = 8
+
+def machine_model():
+    """
+    Returns the board model (e.g. "Raspberry Pi 4 Model B Rev 1.4"), or the
+    CPU architecture when not on a Pi.
+    """
+    try:
+        with open("/proc/device-tree/model") as f:
+            return f.read().strip("\0\n")
+    except OSError:
+        return platform.machine()
+
+def synthetic_frames(resolution):
+    """
+    Returns a few distinct blocky frames, so the fingerprint never skips one.
+    """
+    rng = np.random.default_rng(0)
+    shape = (NUM_SYNTHETIC_FRAMES, resolution[1] // 16 + 1, resolution[0] // 16 + 1, 3)
+    blocks = rng.integers(0, 256, shape, dtype=np.uint8)
+    return np.repeat(np.repeat(blocks, 16, axis=1), 16, axis=2)[:, :resolution[1], :resolution[0]]
+
+def benchmark(resolution, roi, setup_resolution):
+    """
+    Returns the PERCENTILE frame time in ms of the per-frame work of
+    process_frames (fingerprint, then FrameProcessor.process with the gain) at
+    the given resolution.
+    """
+    params = processing.PipelineParams(processing.scale_roi(roi, setup_resolution, resolution), resolution)
+    processor = processing.FrameProcessor(params)
+    fingerprint = processing.FrameFingerprint()
+    frames = synthetic_frames(resolution)
+    gain = 1.0
+
+    times_ms = []
+    for i in range(WARMUP_FRAMES + BENCH_FRAMES):
+        frame = frames[i % len(frames)]
+        start = time.perf_counter()
+        fingerprint.matches(frame)
+        processor.process(frame, gain)
+        times_ms.append((time.perf_counter() - start) * 1000)
+    return float(np.percentile(times_ms[WARMUP_FRAMES:], PERCENTILE))
+
+def choose(timings_ms):
+    """
+    Returns the (resolution, fps) to use for the given {resolution: ms}.
+    Falls back to the smallest resolution at the lowest frame rate.
+    """
+    for fps in FPS_CANDIDATES:
+        budget_ms = 1000 / fps * HEADROOM
+        for resolution in RESOLUTIONS:
+            if timings_ms[resolution] <= budget_ms:
+                return resolution, fps
+    return RESOLUTIONS[-1], FPS_CANDIDATES[-1]
+
+def save(path, setup, resolution, fps, timings_ms):
+    """
+    Writes the choice to setup.json atomically, since a running ambilight.py
+    reloads the file on change. Every ROI, including those of the pipelines,
+    is scaled to the new resolution.
+    """
+    setup = pipelines.rescale_rois(setup, resolution)
+    setup["camera_fps"] = fps
+    setup["autotune"] = {
+        "machine": machine_model(),
+        "headroom": HEADROOM,
+        f"p{PERCENTILE}_ms": {f"{w}x{h}": round(ms, 3) for (w, h), ms in timings_ms.items()},
+    }
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(setup, f)
+    os.replace(tmp_path, path)
+
+def main():
+    dry_run = "--dry-run" in sys.argv
+    path = sys.argv[sys.argv.index("--setup") + 1] if "--setup" in sys.argv else CAMERA_SETUP_PATH
+
+    try:
+        with open(path) as f:
+            setup = json.load(f)
+    except OSError:
+        print(f"{path} not found, benchmarking with a full-frame ROI")
+        setup = {}
+    setup_resolution = processing.resolution_from_setup(setup)
+    w, h = setup_resolution
+    roi = setup.get("roi", [[0, 0], [w, 0], [w, h], [0, h]])
+
+    print(f"{machine_model()}: p{PERCENTILE} frame time, budget {HEADROOM:.0%} of the frame period")
+    timings_ms = {}
+    for resolution in RESOLUTIONS:
+        timings_ms[resolution] = benchmark(resolution, roi, setup_resolution)
+        fits = [fps for fps in FPS_CANDIDATES if timings_ms[resolution] <= 1000 / fps * HEADROOM]
+        print(f"  {resolution[0]:4d}x{resolution[1]:<4d} {timings_ms[resolution]:7.3f} ms  "
+              f"fits: {', '.join(f'{fps} fps' for fps in fits) or 'none'}")
+
+    resolution, fps = choose(timings_ms)
+    print(f"Choosing {resolution[0]}x{resolution[1]} at {fps} fps "
+          f"(was {w}x{h} at {processing.fps_from_setup(setup)} fps)")
+
+    if dry_run:
+        return
+    if not setup:
+        print("Not saving, run setup_camera.py first")
+        return
+    save(path, setup, resolution, fps, timings_ms)
+    print(f"Saved to {path}, restart ambilight.service to apply")
+
+if __name__ == '__main__':
+    main()
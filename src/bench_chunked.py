@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+## Imports ###
+import socket
+import sys
+import time
+import numpy as np
+import AmbilightServer
+import fast_packet
+from proto import ambilight_pb2
+
+NUM_LEDS = 5000
+NUM_FRAMES = 200
+LOSS_RATE = 0.1         # fraction of chunks the receiver drops on purpose
+
+def check_understated_raw_client(server):
+    """
+    A RAW_RGB client that declares too few LEDs gets frames too large for one
+    packet as protobuf, instead of breaking the send for everyone.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(0.5)
+    addr = sock.getsockname()
+
+    config = ambilight_pb2.Message()
+    config.type = ambilight_pb2.MessageType.CONFIG
+    config.config.ipv4 = addr[0]
+    config.config.port = addr[1]
+    config.config.data_format = ambilight_pb2.DataFormat.RAW_RGB     # num_leds left out
+    server.handle_message(config.SerializeToString(), addr)
+    sock.recv(server.MAX_MESSAGE_BYTES)    # ACK_DISCOVERY
+
+    frame = np.zeros(600 * 3, dtype='uint8')
+    try:
+        server.send(ambilight_pb2.MessageType.DATA, payload=frame)
+        message = ambilight_pb2.Message()
+        message.ParseFromString(sock.recv(65536))
+        ok = len(message.data.led_data) == frame.nbytes
+    except (ValueError, OSError) as e:
+        print(f"understated RAW_RGB client: {e}")
+        ok = False
+    print(f"understated RAW_RGB client: {'fell back to protobuf' if ok else 'FAILED'}")
+    return ok
+
+def main():
+    rng = np.random.default_rng(0)
+
+    server = AmbilightServer.AmbilightServer()
+    server.ntp_time_ms = 0      # no NTP thread, just use the local clock
+    server.perf_counter_at_last_ntp = time.perf_counter()
+
+    # Register a loopback client that supports chunked frames
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.settimeout(0.5)
+    addr = sock.getsockname()
+
+    config = ambilight_pb2.Message()
+    config.type = ambilight_pb2.MessageType.CONFIG
+    config.config.ipv4 = addr[0]
+    config.config.port = addr[1]
+    config.config.num_leds = NUM_LEDS
+    config.config.data_format = ambilight_pb2.DataFormat.RAW_RGB_CHUNKED
+    server.handle_message(config.SerializeToString(), addr)
+    sock.recv(server.MAX_MESSAGE_BYTES)    # ACK_DISCOVERY
+
+    assembler = fast_packet.Assembler(NUM_LEDS)
+    chunks_per_frame = -(-NUM_LEDS // server.chunked_encoder.leds_per_chunk)
+    sent = dropped = errors = 0
+    max_packet = 0
+    send_ms = []
+
+    for _ in range(NUM_FRAMES):
+        frame = rng.integers(0, 256, NUM_LEDS * 3, dtype='uint8')
+        before = time.perf_counter()
+        server.send(ambilight_pb2.MessageType.DATA, payload=frame)
+        send_ms.append((time.perf_counter() - before) * 1000)
+
+        for _ in range(chunks_per_frame):
+            packet = sock.recv(65536)
+            sent += 1
+            max_packet = max(max_packet, len(packet))
+            if rng.random() < LOSS_RATE:
+                dropped += 1
+                continue
+            if assembler.apply(packet) is None:
+                errors += 1
+                continue
+
+            # whatever chunk arrived must match the frame it came from
+            _, _, _, _, _, _, _, _, led_offset, _, num_leds = fast_packet.CHUNKED_HEADER.unpack_from(packet, 0)
+            start, end = led_offset * 3, (led_offset + num_leds) * 3
+            if assembler.leds[start:end] != frame[start:end].tobytes():
+                errors += 1
+
+    print(f"leds: {NUM_LEDS}, frames: {NUM_FRAMES}, chunks/frame: {chunks_per_frame}")
+    print(f"largest datagram: {max_packet} bytes (limit {server.MAX_MESSAGE_BYTES})")
+    print(f"chunks sent: {sent}, dropped: {dropped}, applied: {assembler.chunks_applied}, errors: {errors}")
+    print(f"avg send ms: {np.average(send_ms):.3f}, max send ms: {np.max(send_ms):.3f}")
+
+    server = AmbilightServer.AmbilightServer()
+    server.ntp_time_ms = 0
+    server.perf_counter_at_last_ntp = time.perf_counter()
+    understated_ok = check_understated_raw_client(server)
+
+    if errors or sent != NUM_FRAMES * chunks_per_frame or max_packet > server.MAX_MESSAGE_BYTES or not understated_ok:
+        print("FAILED")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+## Imports ###
+import time
+import numpy as np
+from proto import ambilight_pb2
+import fast_packet
+
+NUM_LEDS = 114
+ITERATIONS = 100000
+
+def encode_protobuf(sequence, payload):
+    """
+    Encodes a DATA message the way AmbilightServer does for protobuf clients.
+    """
+    message = ambilight_pb2.Message()
+    message.type = ambilight_pb2.MessageType.DATA
+    message.sender = ambilight_pb2.Sender.SERVER
+    message.sequence_number = sequence
+    message.data.led_data = bytes(payload)
+    message.timestamp = int(time.time() * 1000)
+    return message.SerializeToString()
+
+def bench(name, encode, payload):
+    """
+    Times ITERATIONS calls of encode and prints the per-frame cost.
+    """
+    encode(0, payload)  # warm up
+    before = time.perf_counter()
+    for i in range(ITERATIONS):
+        packet = encode(i, payload)
+    after = time.perf_counter()
+    us = (after - before) / ITERATIONS * 1e6
+    print(f"{name}: {us:.2f} us/frame, {len(packet)} bytes")
+    return us
+
+def main():
+    led_array = np.random.randint(0, 256, (NUM_LEDS, 3), dtype='uint8')
+
+    encoder = fast_packet.Encoder(NUM_LEDS * 3)
+    fast_encode = lambda seq, payload: encoder.encode(seq, int(time.time() * 1000), payload)
+
+    print(f"leds: {NUM_LEDS}, iterations: {ITERATIONS}")
+    pb_us = bench("protobuf", encode_protobuf, led_array.tobytes())
+    fast_us = bench("fast path (bytes)", fast_encode, led_array.tobytes())
+    bench("fast path (ndarray)", fast_encode, led_array.reshape(-1))
+    print(f"speedup: {pb_us / fast_us:.1f}x")
+
+    # sanity check that the fast path round-trips
+    seq, _, led_data = fast_packet.decode(encoder.encode(7, 0, led_array.tobytes()))
+    assert seq == 7 and led_data == led_array.tobytes()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Compares frame-interval jitter of a synthetic 90 fps processing loop with the
+scheduling profile off and on, while other processes load every core.
+
+    python3 bench_jitter.py               # affinity + nice only
+    python3 bench_jitter.py --realtime    # also SCHED_FIFO (needs privileges)
+"""
+
+## Imports ###
+import os
+import sys
+import time
+import numpy as np
+from multiprocessing import Process, Queue
+import processing
+import sched_profile
+
+RESOLUTION = processing.DEFAULT_RESOLUTION
+FPS = processing.DEFAULT_FPS
+DURATION_S = 10
+ROI = [[29, 29], [144, 27], [143, 110], [29, 98]]
+
+def load(stop_at):
+    """
+    Burns CPU with a mix of computation and small syscalls, like a busy
+    journald or apt run would.
+    """
+    a = np.random.rand(200, 200)
+    with open(os.devnull, 'w') as devnull:
+        while time.monotonic() < stop_at:
+            a = a @ a.T / 200
+            devnull.write("x" * 1000)
+
+def frame_loop(profile, q):
+    """
+    Processes a synthetic frame every 1/FPS seconds and reports the intervals
+    between wakeups in ms.
+    """
+    if profile:
+        sched_profile.apply("processing", profile)
+
+    params = processing.PipelineParams(ROI, RESOLUTION)
+    frame = np.random.randint(0, 256, (RESOLUTION[1], RESOLUTION[0], 3), dtype='uint8')
+    period = 1 / FPS
+    deltas = []
+
+    next_frame = time.perf_counter() + period
+    last = time.perf_counter()
+    stop_at = last + DURATION_S
+    while last < stop_at:
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        now = time.perf_counter()
+        deltas.append((now - last) * 1000)
+        last = now
+        next_frame += period
+        processing.process_frame(frame, params)
+
+    q.put(deltas[1:])
+
+def run(profile):
+    """
+    Runs the frame loop next to one load process per core. Returns the frame
+    intervals in ms.
+    """
+    stop_at = time.monotonic() + DURATION_S + 1
+    loaders = [Process(target=load, args=(stop_at,)) for _ in range(os.cpu_count())]
+    for p in loaders:
+        p.start()
+
+    q = Queue()
+    p = Process(target=frame_loop, args=(profile, q))
+    p.start()
+    deltas = np.array(q.get())
+    p.join()
+
+    for loader in loaders:
+        loader.join()
+    return deltas
+
+def report(name, deltas):
+    missed = np.sum(deltas > 2 / FPS * 1000)
+    print(f"{name:12s} frames: {len(deltas)}  avg ms: {np.average(deltas):.3f}  stdev ms: {np.std(deltas):.3f}  "
+          f"p99 ms: {np.percentile(deltas, 99):.3f}  max ms: {np.max(deltas):.3f}  missed: {missed}")
+
+def main():
+    profile = sched_profile.profile_from_setup({})
+    if "--realtime" in sys.argv:
+        profile["processing"]["realtime_priority"] = 50
+
+    print(f"expected ms: {1 / FPS * 1000:.3f}, cores: {os.cpu_count()}, {DURATION_S} s per run")
+    report("profile off", run(None))
+    report("profile on", run(profile))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Compares what clients see when LED frames are sent as soon as they are
+processed (the old behavior) against the output scheduler, for a camera
+running below the client refresh rate with occasional late frames. Also
+checks that a frame already settled when first picked up is still sent,
+that a failing send doesn't stop the output, and that the resume latency is
+taken at the first frame published after a client registers.
+
+    python3 bench_output.py [camera_fps]
+"""
+
+## Imports ###
+import sys
+import threading
+import time
+import numpy as np
+from proto import ambilight_pb2
+import AmbilightServer
+import processing
+import output_scheduler
+from output_scheduler import OutputScheduler
+from sinks import FrameSlot
+
+CAMERA_FPS = 30
+REFRESH_HZ = 90
+DURATION_S = 5
+LATE_FRAME_EVERY = 20       # every Nth camera frame is late...
+LATE_FRAME_S = 0.06         # ...by this much
+FADE_PERIOD_S = 2           # the content fades between black and white with this period
+
+def content(t):
+    """
+    Brightness of the synthetic content at time t, as an LED frame.
+    """
+    level = 127.5 * (1 - np.cos(2 * np.pi * t / FADE_PERIOD_S))
+    return np.full((processing.NUM_LEDS, 3), level).astype('uint8')
+
+class Recorder:
+    """
+    Records the time and contents of every frame sent to the clients.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, payload):
+        with self.lock:
+            self.sent.append((time.perf_counter(), np.array(payload, dtype=np.float32).reshape(-1)))
+
+def camera(fps, deliver):
+    """
+    Delivers processed frames at the camera rate for DURATION_S, with every
+    LATE_FRAME_EVERY-th frame delayed.
+    """
+    start = time.perf_counter()
+    n = 0
+    while True:
+        due = start + n / fps + (LATE_FRAME_S if n % LATE_FRAME_EVERY == LATE_FRAME_EVERY - 1 else 0)
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        t = time.perf_counter() - start
+        if t > DURATION_S:
+            return
+        deliver(content(t))
+        n += 1
+
+def run(mode, fps):
+    recorder = Recorder()
+    if mode == "direct":
+        camera(fps, recorder.send)
+    else:
+        slot = FrameSlot()
+        scheduler = OutputScheduler(slot, None, REFRESH_HZ, mode, send=recorder.send)
+        scheduler.clients_present.set()
+        threading.Thread(target=scheduler.run, daemon=True).start()
+        camera(fps, slot.publish)
+    return recorder.sent
+
+def report(name, sent):
+    times = np.array([t for t, _ in sent])
+    levels = np.array([frame.mean() for _, frame in sent])
+    steps = np.abs(np.diff(levels))
+    # a stall is the longest time the output did not move while the content was changing
+    moving = np.flatnonzero(steps > 0)
+    stall_ms = np.max(np.diff(times[moving])) * 1000 if len(moving) > 1 else float("nan")
+    print(f"{name:12s} updates/s: {len(sent) / DURATION_S:6.1f}  mean step: {np.mean(steps):5.2f}  "
+          f"max step: {np.max(steps):5.2f}  longest stall ms: {stall_ms:6.1f}")
+
+def check_stale_first_frame():
+    """
+    A frame published before any client registered is already settled and
+    older than the idle resend interval when the scheduler first picks it up.
+    It must still be sent, then resent at the idle interval.
+    """
+    recorder = Recorder()
+    slot = FrameSlot()
+    scheduler = OutputScheduler(slot, None, REFRESH_HZ, send=recorder.send)
+    slot.publish(np.zeros((processing.NUM_LEDS, 3), dtype=np.uint8))
+    now_s = time.perf_counter() + output_scheduler.IDLE_RESEND_S + 0.2
+    sent = [scheduler.tick(now_s, 1 / REFRESH_HZ),
+            scheduler.tick(now_s + 1 / REFRESH_HZ, 1 / REFRESH_HZ),
+            scheduler.tick(now_s + output_scheduler.IDLE_RESEND_S, 1 / REFRESH_HZ)]
+    ok = sent == [True, False, True]
+    print(f"stale first frame: {'sent' if ok else f'FAILED, sent {sent}'}")
+    return ok
+
+def check_failed_send():
+    """
+    One send that raises must not stop the output thread.
+    """
+    sent = []
+
+    def send(payload):
+        sent.append(len(sent))
+        if len(sent) == 3:
+            raise OSError("injected send failure")
+
+    slot = FrameSlot()
+    scheduler = OutputScheduler(slot, None, REFRESH_HZ, send=send)
+    scheduler.clients_present.set()
+    thread = threading.Thread(target=scheduler.run, daemon=True)
+    thread.start()
+    for i in range(20):
+        slot.publish(np.full((processing.NUM_LEDS, 3), i, dtype=np.uint8))
+        time.sleep(1 / CAMERA_FPS)
+    ok = thread.is_alive() and len(sent) > 10
+    print(f"failed send: {'output kept running' if ok else 'FAILED, output stopped'}")
+    return ok
+
+def check_resume_latency():
+    """
+    The resume latency must be taken at the first frame published after a
+    client registers, not at the resend of the frame left over from before.
+    """
+    server = AmbilightServer.AmbilightServer()
+    slot = FrameSlot()
+    scheduler = OutputScheduler(slot, server, REFRESH_HZ)
+    slot.publish(np.zeros((processing.NUM_LEDS, 3), dtype=np.uint8))
+    config = ambilight_pb2.Message.Config(ipv4="127.0.0.1", port=9, num_leds=processing.NUM_LEDS)
+    client = AmbilightServer.Client(config, 0)
+    server.registry.add(client.addr, client, server.clock_ms())
+
+    now_s = time.perf_counter()
+    scheduler.tick(now_s, 1 / REFRESH_HZ)
+    after_stale = server.resume_latency_ms
+    slot.publish(np.full((processing.NUM_LEDS, 3), 255, dtype=np.uint8))
+    scheduler.tick(now_s + 1 / REFRESH_HZ, 1 / REFRESH_HZ)
+    ok = after_stale is None and server.resume_latency_ms is not None
+    print(f"resume latency: {'taken at the first new frame' if ok else 'FAILED'}")
+    return ok
+
+def main():
+    fps = float(sys.argv[1]) if len(sys.argv) > 1 else CAMERA_FPS
+    print(f"camera {fps:.0f} fps, refresh {REFRESH_HZ} Hz, every {LATE_FRAME_EVERY}th frame {LATE_FRAME_S * 1000:.0f} ms late")
+    report("direct", run("direct", fps))
+    report(output_scheduler.MODE_INTERPOLATE, run(output_scheduler.MODE_INTERPOLATE, fps))
+    report(output_scheduler.MODE_SMOOTH, run(output_scheduler.MODE_SMOOTH, fps))
+    ok = check_stale_first_frame()
+    ok &= check_failed_send()
+    ok &= check_resume_latency()
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
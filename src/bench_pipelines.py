@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Measures how multi-screen throughput scales with the number of pipelines.
+Runs 1 to MAX_PIPELINES pipeline workers, each in its own process pinned to
+its own core and fed by a synthetic camera that never waits, and counts the
+LED frames that reach the server process over DURATION_S. Ideally the total
+grows linearly up to the number of cores. Each pipeline uses its own LED
+layout, so the check also catches frames published to the wrong screen.
+
+    python3 bench_pipelines.py [max_pipelines]
+"""
+
+## Imports ###
+import json
+import os
+import queue
+import sys
+import tempfile
+import time
+from multiprocessing import Process, Queue
+import ambilight
+import autotune
+import pipelines
+import processing
+import sched_profile
+
+MAX_PIPELINES = 4
+DURATION_S = 5
+WARMUP_S = 1
+RESOLUTION = processing.DEFAULT_RESOLUTION
+ROI = [[29, 29], [144, 27], [143, 110], [29, 98]]
+
+class SyntheticCamera:
+    """
+    Stands in for a pipeline's camera queue: every get() returns the next of a
+    few distinct frames right away, so the fingerprint never skips one.
+    """
+    def __init__(self):
+        self.frames = autotune.synthetic_frames(RESOLUTION)
+        self.count = 0
+
+    def get(self, block=True, timeout=None):
+        self.count += 1
+        return ambilight.QMsgCamera(self.frames[self.count % len(self.frames)])
+
+def write_setup(path, num_pipelines):
+    """
+    Writes a setup.json declaring num_pipelines screens with different
+    layouts, and returns their settings.
+    """
+    setup = {
+        "pan": 0, "tilt": 0, "roi": ROI, "resolution": list(RESOLUTION),
+        "governor": {"enabled": False},     # measure at full quality
+        "pipelines": [{"name": f"screen{i}", "num_rows": processing.NUM_ROWS - 2 * i,
+                       "num_cols": processing.NUM_COLS - 2 * i} for i in range(num_pipelines)],
+    }
+    with open(path, "w") as f:
+        json.dump(setup, f)
+    return pipelines.pipelines_from_setup(setup)
+
+def worker(name, q_leds, profile, setup_path):
+    """
+    Runs one pipeline like ambilight.pipeline_worker, on a synthetic camera.
+    """
+    sched_profile.apply("processing", profile)
+    ambilight.process_frames(SyntheticCamera(), name, lambda led_array: q_leds.put((name, led_array.copy())),
+                             setup_path=setup_path)
+
+def run(num_pipelines, setup_path):
+    """
+    Returns the LED frames per second that reached this process from each of
+    num_pipelines workers, and whether all of them had the right size.
+    """
+    screens = write_setup(setup_path, num_pipelines)
+    num_leds = {screen["name"]: len(processing.perimeter_indices(screen["num_rows"], screen["num_cols"])[0])
+                for screen in screens}
+    profile = sched_profile.profile_from_setup({})
+    q_leds = Queue()
+    workers = [Process(target=worker, args=(screen["name"], q_leds, pipelines.worker_profile(profile, screens, i), setup_path),
+                       daemon=True) for i, screen in enumerate(screens)]
+    for p in workers:
+        p.start()
+
+    counts = {name: 0 for name in num_leds}
+    sizes_ok = True
+    start = time.perf_counter()
+    measure_from = start + WARMUP_S
+    while True:
+        now = time.perf_counter()
+        if now > measure_from + DURATION_S:
+            break
+        try:
+            name, led_array = q_leds.get(timeout=1)
+        except queue.Empty:
+            continue
+        sizes_ok &= led_array.shape == (num_leds[name], 3)
+        if now >= measure_from:
+            counts[name] += 1
+
+    for p in workers:
+        p.terminate()
+        p.join()
+    return {name: count / DURATION_S for name, count in counts.items()}, sizes_ok
+
+def main():
+    max_pipelines = int(sys.argv[1]) if len(sys.argv) > 1 else MAX_PIPELINES
+    setup_path = os.path.join(tempfile.mkdtemp(), "setup.json")
+    print(f"{len(os.sched_getaffinity(0))} cores available, {RESOLUTION[0]}x{RESOLUTION[1]} frames")
+
+    ok = True
+    single_fps = None
+    for n in range(1, max_pipelines + 1):
+        fps, sizes_ok = run(n, setup_path)
+        total = sum(fps.values())
+        single_fps = single_fps or total
+        print(f"{n} pipelines: {total:7.0f} frames/s total  ({', '.join(f'{v:.0f}' for v in fps.values())})  "
+              f"scaling {total / single_fps:.2f}x of {n}x")
+        ok &= sizes_ok and all(v > 0 for v in fps.values())
+
+    print("OK" if ok else "FAILED: a pipeline stalled or published the wrong layout")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
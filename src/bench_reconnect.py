@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Checks that a server restart keeps its clients. A first server registers a
+loopback client and saves the registry. A second server started from the
+same file must send DATA to the client right away, on the same port. The
+client's heartbeat must keep it registered, and without heartbeats it must
+expire.
+
+    python3 bench_reconnect.py
+"""
+
+## Imports ###
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import Process
+import AmbilightServer
+from proto import ambilight_pb2
+
+NUM_LEDS = 114
+
+def first_run(registry_path, client_addr):
+    """
+    Registers the client with a server and waits until the registry is saved.
+    """
+    server = AmbilightServer.AmbilightServer(registry_path=registry_path)
+    threading.Thread(target=server.persist_clients, daemon=True).start()
+
+    config = ambilight_pb2.Message()
+    config.type = ambilight_pb2.MessageType.CONFIG
+    config.config.ipv4 = client_addr[0]
+    config.config.port = client_addr[1]
+    config.config.num_leds = NUM_LEDS
+    config.config.data_format = ambilight_pb2.DataFormat.RAW_RGB
+    server.handle_message(config.SerializeToString(), client_addr)
+    while not os.path.exists(registry_path) or server.registry_dirty.is_set():
+        time.sleep(0.01)
+    time.sleep(0.1)
+
+def main():
+    registry_path = os.path.join(tempfile.mkdtemp(), "clients.json")
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind(("127.0.0.1", 0))
+    client.settimeout(1)
+    client_addr = client.getsockname()
+
+    p = Process(target=first_run, args=(registry_path, client_addr))
+    p.start()
+    p.join()
+    client.recv(AmbilightServer.AmbilightServer.MAX_MESSAGE_BYTES)    # ACK_DISCOVERY from the first run
+    with open(registry_path) as f:
+        print(f"saved registry: {f.read()}")
+
+    # Restart: the restored client gets DATA before it has said anything
+    start = time.perf_counter()
+    server = AmbilightServer.AmbilightServer(registry_path=registry_path)
+    server.ntp_time_ms = 0      # no NTP thread, just use the local clock
+    server.perf_counter_at_last_ntp = time.perf_counter()
+    server.send(type=ambilight_pb2.MessageType.DATA, payload=bytes(NUM_LEDS * 3))
+    data = client.recv(server.MAX_MESSAGE_BYTES)
+    first_data_ms = (time.perf_counter() - start) * 1000
+    print(f"first DATA {first_data_ms:.1f} ms after restart ({len(data)} bytes)")
+
+    # The client keeps heartbeating to the port it knows
+    port = server.sock_discovery.getsockname()[1]
+    heartbeat = ambilight_pb2.Message()
+    heartbeat.type = ambilight_pb2.MessageType.HEARTBEAT
+    client.sendto(heartbeat.SerializeToString(), ("127.0.0.1", port))
+    message, addr = server.sock_discovery.recvfrom(server.MAX_MESSAGE_BYTES)
+    server.handle_message(message, addr)
+    confirmed = server.registry.get(client_addr) is not None
+    print(f"heartbeat on port {port} confirmed the client: {confirmed}")
+
+    # Without further heartbeats it expires like any other client
+    expired = server.registry.expire(server.clock_ms() + server.client_heartbeat_timeout_ms + 1)
+    print(f"expired without heartbeats: {len(expired) == 1}")
+
+    sys.exit(0 if confirmed and len(expired) == 1 else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Measures how quickly a failed camera worker is replaced. Runs the real
+camera_loop under its Supervisor with a fake camera that injects faults: the
+worker exits (as on a libcamera error) or hangs in capture (as on a stuck
+driver) after FAULT_AFTER_FRAMES frames. For each fault, reports the time from
+the fault to the first frame from the replacement worker on the shared
+FrameChannel, and checks it against a budget: the detection time (a poll for an exit,
+the stall timeout for a hang) plus RESTART_BUDGET_S.
+
+    python3 bench_recovery.py
+"""
+
+## Imports ###
+import queue
+import sys
+import time
+from multiprocessing import Event, Process, Queue, RawValue
+import numpy as np
+import ambilight
+from frame_channel import FrameChannel
+import processing
+import sched_profile
+import supervisor
+
+FAULTS = ("exit", "hang", "exit", "hang")     # one per worker, the last worker runs clean
+FAULT_AFTER_FRAMES = 30
+CAMERA_FPS = processing.DEFAULT_FPS
+RESTART_BUDGET_S = 1.0      # from detecting the fault to the first frame of the standby
+RESOLUTION = processing.DEFAULT_RESOLUTION
+ROI = [[29, 29], [144, 27], [143, 110], [29, 98]]
+
+workers = RawValue('i', 0)          # workers that opened the fake camera, across processes
+fault_s = RawValue('d', 0.0)        # time.perf_counter() of the last fault
+
+class FakeCamera:
+    """
+    Stands in for Picamera2 at CAMERA_FPS. Each frame carries the number of
+    the worker that captured it in its first byte. The fault, if any, hits
+    after FAULT_AFTER_FRAMES frames.
+    """
+    def __init__(self, worker, fault):
+        self.worker = worker
+        self.fault = fault
+        self.frames = 0
+        self.frame = np.full((RESOLUTION[1], RESOLUTION[0], 3), 128, dtype=np.uint8)
+        self.frame[0, 0, 0] = worker
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def capture_metadata(self):
+        return {"ExposureTime": ambilight.EXPOSURE_TIME_US, "AnalogueGain": ambilight.ANALOGUE_GAIN}
+
+    def capture_array(self):
+        time.sleep(1 / CAMERA_FPS)
+        self.frames += 1
+        if self.fault and self.frames > FAULT_AFTER_FRAMES:
+            fault_s.value = time.perf_counter()
+            if self.fault == "exit":
+                sys.exit(1)
+            time.sleep(3600)
+        return self.frame.copy()
+
+def open_fake_camera(timeline, camera_num, standby):
+    """
+    Called like ambilight.setup_camera, in the worker process.
+    """
+    if standby is not None:
+        standby.wait()
+    worker = workers.value
+    workers.value += 1
+    fault = FAULTS[worker] if worker < len(FAULTS) else None
+    return FakeCamera(worker, fault), {"pan": 0, "tilt": 0, "roi": ROI, "resolution": list(RESOLUTION)}
+
+def main():
+    q_camera = FrameChannel(RESOLUTION)
+    q_tv = Queue()
+    clients_present = Event()
+    clients_present.set()
+    q_tv.put(ambilight.QMsgTV.TVStatus.ON)
+    profile = sched_profile.profile_from_setup({})
+    watchdog = supervisor.Watchdog()
+
+    def start_worker(standby):
+        process = Process(target=ambilight.camera_loop, daemon=True,
+                          args=([q_camera], q_tv, Event(), Queue(), clients_present, profile, None),
+                          kwargs={"watchdog": watchdog, "standby": standby, "open_camera": open_fake_camera})
+        process.start()
+        return process
+
+    sup = supervisor.Supervisor("camera", start_worker, watchdog, ambilight.CAMERA_READY_TIMEOUT_S)
+    sup.start()
+
+    ok = True
+    current = 0
+    deadline = time.perf_counter() + 30
+    while current < len(FAULTS) and time.perf_counter() < deadline:
+        try:
+            msg = q_camera.get(timeout=1)
+        except queue.Empty:
+            continue
+        worker = int(msg.frame[0, 0, 0])
+        if worker <= current:
+            continue
+        recovery_s = time.perf_counter() - fault_s.value
+        detection_s = supervisor.STALL_TIMEOUT_S if FAULTS[current] == "hang" else supervisor.POLL_INTERVAL_S
+        within = recovery_s <= detection_s + RESTART_BUDGET_S
+        print(f"worker {current} {FAULTS[current]:4}: first frame from worker {worker} {recovery_s * 1000:6.0f} ms "
+              f"after the fault  (budget {(detection_s + RESTART_BUDGET_S) * 1000:.0f} ms)")
+        ok &= within and worker == current + 1
+        current = worker
+
+    time.sleep(2 * supervisor.POLL_INTERVAL_S)    # let the supervisor see the last recovery
+    stats = sup.stats()
+    print(f"{stats['restarts']} restarts, fault detected to first frame: "
+          f"{', '.join(f'{ms:.0f}' for ms in stats['recovery_ms'])} ms")
+    ok &= current == len(FAULTS) and stats["restarts"] == len(FAULTS)
+
+    for process in (sup.process, sup.standby_process):
+        if process is not None:
+            process.kill()
+    print("OK" if ok else "FAILED: a fault was not recovered from within budget")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Publishes LED frames at 90 fps into a FrameSlot read by a file recorder, a
+pipe with a slow reader and a pipe whose reader never reads. Checks that the
+publisher never waits on the sinks, that each slow sink drops its own frames
+and that the recording reads back intact.
+
+    python3 bench_sinks.py
+"""
+
+## Imports ###
+import os
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import processing
+import sinks
+
+FPS = processing.DEFAULT_FPS
+DURATION_S = 3
+SLOW_READER_INTERVAL_S = 0.1    # the slow pipe reader takes one frame per interval
+FRAME_BYTES = processing.NUM_LEDS * 3
+
+def slow_reader(path, stop):
+    """
+    Reads one frame from the pipe every SLOW_READER_INTERVAL_S.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    while not stop.is_set():
+        os.read(fd, FRAME_BYTES)
+        time.sleep(SLOW_READER_INTERVAL_S)
+    os.close(fd)
+
+def main():
+    tmp = tempfile.mkdtemp()
+    slot = sinks.FrameSlot()
+    recorder = sinks.FileSink(slot, os.path.join(tmp, "frames.rec"))
+    slow_pipe = sinks.PipeSink(slot, os.path.join(tmp, "slow.fifo"))
+    stuck_pipe = sinks.PipeSink(slot, os.path.join(tmp, "stuck.fifo"))
+
+    # Attach the readers before publishing, so the pipes open on the first frame
+    stop = threading.Event()
+    os.mkfifo(slow_pipe.path)
+    os.mkfifo(stuck_pipe.path)
+    threading.Thread(target=slow_reader, args=(slow_pipe.path, stop), daemon=True).start()
+    stuck_fd = os.open(stuck_pipe.path, os.O_RDONLY | os.O_NONBLOCK)    # never read
+
+    for sink in (recorder, slow_pipe, stuck_pipe):
+        sink.start()
+
+    publish_us = []
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, (FPS * DURATION_S, processing.NUM_LEDS, 3), dtype=np.uint8)
+    next_frame = time.perf_counter()
+    for frame in frames:
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        next_frame += 1 / FPS
+        before = time.perf_counter()
+        slot.publish(frame)
+        publish_us.append((time.perf_counter() - before) * 1e6)
+
+    time.sleep(0.5)     # let the sinks catch up with the last frame
+    stop.set()
+    recorder.close()
+    os.close(stuck_fd)
+
+    publish_us = np.array(publish_us)
+    print(f"published {len(frames)} frames  publish us: avg {np.mean(publish_us):.1f}  max {np.max(publish_us):.1f}")
+    for name, sink in (("file", recorder), ("slow pipe", slow_pipe), ("stuck pipe", stuck_pipe)):
+        print(f"{name:10s} {sink.stats()}")
+
+    recorded = list(sinks.read_recording(recorder.path))
+    errors = sum(not np.array_equal(data, frames[i]) for i, (_, data) in enumerate(recorded))
+    print(f"recording: {len(recorded)} frames, {errors} mismatches")
+
+    ok = errors == 0 and len(recorded) == recorder.written and slow_pipe.dropped > 0 and stuck_pipe.dropped > 0
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Measures CPU saved by skipping unchanged frames. Pass a clip recorded with
+`test_camera_fps.py --save clip.npy` (e.g. with playback paused), or run
+without arguments to use a synthetic static clip with sensor-like noise.
+"""
+
+## Imports ###
+import sys
+import time
+import numpy as np
+import processing
+
+RESOLUTION = processing.DEFAULT_RESOLUTION
+NUM_FRAMES = 900            # 10 s at 90 fps
+NOISE_STDEV = 1.0           # synthetic sensor noise, in 8-bit levels
+ROI = [[29, 29], [144, 27], [143, 110], [29, 98]]
+
+def synthetic_clip():
+    """
+    Returns a static scene with independent noise added to every frame.
+    """
+    rng = np.random.default_rng(0)
+    scene = rng.integers(0, 256, (RESOLUTION[1], RESOLUTION[0], 3)).astype('float32')
+    scene = np.repeat(np.repeat(scene[::16, ::16], 16, axis=0), 16, axis=1)   # blocky, like real content
+    noise = rng.normal(0, NOISE_STDEV, (NUM_FRAMES,) + scene.shape)
+    return np.clip(scene + noise, 0, 255).astype('uint8')
+
+def run(clip, fingerprint):
+    """
+    Runs the pipeline over the clip and returns the CPU seconds used.
+    """
+    before = time.process_time()
+    params = processing.PipelineParams(ROI, RESOLUTION)
+    led_array = None
+    for frame in clip:
+        if fingerprint and led_array is not None and fingerprint.matches(frame):
+            continue
+        if fingerprint and led_array is None:
+            fingerprint.matches(frame)
+        led_array = processing.process_frame(frame, params)
+    return time.process_time() - before
+
+def main():
+    if len(sys.argv) > 1:
+        clip = np.load(sys.argv[1])
+        print(f"clip: {sys.argv[1]}")
+    else:
+        clip = synthetic_clip()
+        print(f"clip: synthetic static, noise stdev {NOISE_STDEV}")
+    print(f"frames: {len(clip)}, shape: {clip.shape[1:]}")
+
+    full_s = run(clip, None)
+    fingerprint = processing.FrameFingerprint()
+    skip_s = run(clip, fingerprint)
+
+    print(f"full pipeline: {full_s / len(clip) * 1000:.3f} ms/frame CPU")
+    print(f"with skipping: {skip_s / len(clip) * 1000:.3f} ms/frame CPU")
+    print(f"skipped: {fingerprint.skipped} of {fingerprint.total} frames")
+    print(f"CPU saved: {(1 - skip_s / full_s) * 100:.1f}%")
+
+if __name__ == '__main__':
+    main()
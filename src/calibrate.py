@@ -0,0 +1,256 @@
+"""
+Finds the TV screen in camera frames, so the ROI can be set without clicking
+its corners. The TV shows a white screen and then the previous source again;
+the screen is where the two sets of frames differ. The result is written to
+setup.json, which the running service reloads without a restart.
+
+While the TV plays, DriftMonitor watches for the camera having been bumped:
+the screen is where the picture keeps changing, so the per-pixel variance over
+a few minutes of frames outlines it without showing anything on the TV.
+"""
+
+## Imports ###
+import json
+import logging
+import os
+import time
+import cv2
+import numpy as np
+import pipelines
+
+log = logging.getLogger(__name__)
+
+### Defines ###
+CALIBRATION_FRAMES = 5          # frames to average per screen state
+SCREEN_SETTLE_S = 3.0           # time for the TV to switch what it shows
+MIN_SCREEN_FRACTION = 0.05      # smallest plausible screen, as a fraction of the frame
+MIN_CONTRAST = 20               # smallest threshold (in 8-bit levels) between screen and background
+APPROX_EPSILON = 0.02           # polygon fit tolerance, as a fraction of the outline length
+
+DRIFT_SAMPLE_INTERVAL_S = 2.0   # how often DriftMonitor takes a frame
+DRIFT_SAMPLES = 150             # frames per drift check, so one check every 5 minutes
+DRIFT_TOLERANCE_PX = 3.0        # corner movement treated as drift, in processing pixels
+DRIFT_CONFIRMATIONS = 3         # consecutive checks that must find the same moved screen, so 15 minutes
+
+def order_corners(points):
+    """
+    Returns the four given (x, y) points ordered UL, UR, LR, LL, the order the
+    ROI is stored in.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(4, 2)
+    s = points.sum(axis=1)
+    d = points[:, 0] - points[:, 1]
+    return points[[np.argmin(s), np.argmax(d), np.argmax(s), np.argmin(d)]]
+
+def quad_from_mask(mask):
+    """
+    Returns the corners (UL, UR, LR, LL) of the largest four-sided blob in the
+    given binary mask, or None if there is none big enough. Each side is fitted
+    as a line through its outline, so the corners are subpixel accurate.
+    """
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    if not contours:
+        return None
+    contour = max(contours, key=cv2.contourArea)
+    if cv2.contourArea(contour) < MIN_SCREEN_FRACTION * mask.size:
+        return None
+
+    hull = cv2.convexHull(contour)      # ignores bright content touching the edge of the screen
+    approx = cv2.approxPolyDP(hull, APPROX_EPSILON * cv2.arcLength(hull, True), True)
+    if len(approx) != 4:
+        return None
+    corners = order_corners(approx)
+
+    # Fit a line to the outline points near each side and intersect neighbouring sides
+    outline = contour.reshape(-1, 2).astype(np.float64)
+    lines = []
+    for a, b in zip(corners, np.roll(corners, -1, axis=0)):
+        side = b - a
+        length = np.hypot(*side)
+        rel = outline - a
+        t = rel @ side / length**2                                            # position along the side
+        dist = np.abs(side[0] * rel[:, 1] - side[1] * rel[:, 0]) / length    # distance from the side
+        near = outline[(t > 0.1) & (t < 0.9) & (dist < 2)]                   # skip the rounded corners
+        if len(near) < 2:
+            return None
+        vx, vy, x0, y0 = cv2.fitLine(near.astype(np.float32), cv2.DIST_L2, 0, 0.01, 0.01).ravel()
+        # The outline runs through the centers of the outermost screen pixels,
+        # the edge itself is half a pixel further out
+        outward = np.array([side[1], -side[0]]) / length
+        lines.append((np.array([x0, y0]) + 0.5 * outward, np.array([vx, vy])))
+
+    refined = []
+    for (p, u), (q, v) in zip(lines[-1:] + lines[:-1], lines):
+        # p + s*u == q + t*v
+        A = np.column_stack([u, -v])
+        if abs(np.linalg.det(A)) < 1e-6:
+            return None
+        s, _ = np.linalg.solve(A, q - p)
+        refined.append(p + s * u)
+    return order_corners(refined)
+
+def threshold_quad(image):
+    """
+    Thresholds a single-channel image that is bright on the screen and dark
+    elsewhere (Otsu) and returns the quad found in it, or None if the image has
+    too little contrast.
+    """
+    image = cv2.GaussianBlur(image, (5, 5), 0)
+    threshold, mask = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if threshold < MIN_CONTRAST:
+        return None
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    return quad_from_mask(mask)
+
+def find_screen(white_frames, source_frames):
+    """
+    Returns the screen corners (UL, UR, LR, LL, in pixels) from frames of the
+    TV showing white and frames of it showing its usual source, or None if no
+    screen was found.
+    """
+    white = np.mean(np.stack(white_frames), axis=0)
+    source = np.mean(np.stack(source_frames), axis=0)
+    diff = np.clip(white - source, 0, 255).max(axis=2).astype(np.uint8)
+    return threshold_quad(diff)
+
+def corner_drift(roi, other):
+    """
+    Returns how far the corners of two ROIs are apart, in pixels (the largest
+    distance of any corner).
+    """
+    return float(np.max(np.hypot(*(np.asarray(roi, dtype=np.float64) - np.asarray(other, dtype=np.float64)).T)))
+
+def calibrate(capture, tv, num_frames=CALIBRATION_FRAMES, settle_s=SCREEN_SETTLE_S):
+    """
+    Shows a white screen on the TV, then the previous source, capturing
+    num_frames with capture() each time. Returns the screen corners as a list
+    of [x, y] rounded to 2 decimals, or None if no screen was found.
+    """
+    log.info("Calibrating: showing a white screen")
+    tv.show_white_screen()
+    time.sleep(settle_s)
+    white_frames = [capture() for _ in range(num_frames)]
+
+    log.info("Calibrating: going back to the previous source")
+    tv.go_to_last_source()
+    time.sleep(settle_s)
+    source_frames = [capture() for _ in range(num_frames)]
+
+    roi = find_screen(white_frames, source_frames)
+    if roi is None:
+        log.warning("Calibration found no screen")
+        return None
+    roi = [[round(float(x), 2), round(float(y), 2)] for x, y in roi]
+    log.info("Calibration found the screen at %s", roi)
+    return roi
+
+def save_roi(path, roi, resolution, pipeline=None):
+    """
+    Writes the ROI (in pixels of resolution) into setup.json, keeping all
+    other settings, as the ROI of the named pipeline if given. The other ROIs
+    are scaled to resolution. Raises ValueError without a pipeline name if
+    setup.json lists several screens, or for an unknown name. Writes
+    atomically, since a running ambilight.py reloads the file on change.
+    """
+    try:
+        with open(path) as f:
+            setup = json.load(f)
+    except OSError:
+        setup = {}
+    setup = pipelines.rescale_rois(setup, resolution)
+    if pipeline is None:
+        if setup.get("pipelines"):
+            raise ValueError(f"{path} lists several screens, name the one to calibrate")
+        setup["roi"] = roi
+    else:
+        entry = next((entry for entry in setup.get("pipelines") or [] if entry.get("name") == pipeline), None)
+        if entry is None:
+            raise ValueError(f"no pipeline named {pipeline!r} in {path}")
+        entry["roi"] = roi
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(setup, f)
+    os.replace(tmp_path, path)
+
+class DriftMonitor:
+    """
+    Finds the screen from the per-pixel variance of frames sampled every
+    sample_interval_s while the TV plays. After num_samples frames, check()
+    compares it with the current ROI. Static pictures give no usable outline,
+    in which case the check is inconclusive and starts over.
+
+    A letterboxed or partly dark picture only outlines part of the screen, so
+    an outline that lies within the ROI is not drift. A moved screen is only
+    reported once `confirmations` checks in a row found it in the same place,
+    so a scene that happens to outline something else isn't either.
+    """
+
+    def __init__(self, sample_interval_s=DRIFT_SAMPLE_INTERVAL_S, num_samples=DRIFT_SAMPLES,
+                 tolerance_px=DRIFT_TOLERANCE_PX, confirmations=DRIFT_CONFIRMATIONS):
+        self.sample_interval_s = sample_interval_s
+        self.num_samples = num_samples
+        self.tolerance_px = tolerance_px
+        self.confirmations = confirmations
+        self.moved = None           # where the last checks found the screen, if not at the ROI
+        self.moved_count = 0
+        self.sum = None
+        self.sum_sq = None
+        self.count = 0
+        self.next_sample_s = 0
+
+    def add(self, frame, now_s):
+        """
+        Adds the frame if a sample is due. Returns True once num_samples frames
+        have been collected and check() can be called.
+        """
+        if now_s < self.next_sample_s:
+            return False
+        self.next_sample_s = now_s + self.sample_interval_s
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY).astype(np.float32)
+        if self.sum is None or self.sum.shape != gray.shape:
+            self.sum = np.zeros_like(gray)
+            self.sum_sq = np.zeros_like(gray)
+            self.count = 0
+        self.sum += gray
+        self.sum_sq += gray * gray
+        self.count += 1
+        return self.count >= self.num_samples
+
+    def check(self, roi):
+        """
+        Returns the screen corners found so far if they moved more than
+        tolerance_px from roi, and did so in the last `confirmations` checks,
+        otherwise None. Starts collecting again.
+        """
+        mean = self.sum / self.count
+        std = np.sqrt(np.maximum(self.sum_sq / self.count - mean * mean, 0))
+        self.count = 0
+        self.sum[:] = 0
+        self.sum_sq[:] = 0
+
+        found = threshold_quad(np.clip(std * 4, 0, 255).astype(np.uint8))
+        if found is None:
+            log.debug("Drift check inconclusive, the picture did not change enough")
+            return None
+        drift = corner_drift(roi, found)
+        log.debug("Drift check: corners within %.1f px", drift)
+        if drift <= self.tolerance_px:
+            self.moved = None
+            return None
+        contour = np.float32(roi).reshape(-1, 1, 2)
+        if all(cv2.pointPolygonTest(contour, (float(x), float(y)), True) >= -self.tolerance_px for x, y in found):
+            log.debug("Drift check inconclusive, the picture only covers part of the screen")
+            return None
+
+        if self.moved is not None and corner_drift(self.moved, found) <= self.tolerance_px:
+            self.moved_count += 1
+        else:
+            self.moved_count = 1
+        self.moved = found
+        log.debug("Drift check: screen moved, %d of %d checks", self.moved_count, self.confirmations)
+        if self.moved_count < self.confirmations:
+            return None
+        self.moved = None
+        return [[round(float(x), 2), round(float(y), 2)] for x, y in found]
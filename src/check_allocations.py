@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Allocation regression check for the steady-state frame loop. Runs the
+per-frame work of process_and_serve (fingerprint, processing with gain,
+publishing to the sinks, one output tick sending a fast-path packet to a
+loopback client) under tracemalloc. Exits nonzero if the peak memory
+allocated while handling any one frame exceeds PER_FRAME_BUDGET_BYTES, or if
+memory grows across frames. Also checks that applying the gain to the zone
+means stays within MAX_GAIN_DIFF of scaling the whole frame first.
+
+    python3 check_allocations.py
+"""
+
+## Imports ###
+import socket
+import sys
+import time
+import tracemalloc
+import numpy as np
+import AmbilightServer
+import processing
+from output_scheduler import OutputScheduler
+from proto import ambilight_pb2
+from sinks import FrameSlot
+
+RESOLUTION = processing.DEFAULT_RESOLUTION
+ROI = [[29, 29], [144, 27], [143, 110], [29, 98]]
+WARMUP_FRAMES = 100
+NUM_FRAMES = 500
+PER_FRAME_BUDGET_BYTES = 4096   # small objects only: views, scalars, the published copy
+GROWTH_BUDGET_BYTES = 4096      # across all NUM_FRAMES
+GAIN = 0.8
+MAX_GAIN_DIFF = 1               # LED levels before gamma, from truncating the float frame instead of rounding
+
+def setup():
+    """
+    Returns the server, slot, output scheduler and a registered loopback
+    client socket, wired up like process_and_serve but without threads.
+    """
+    server = AmbilightServer.AmbilightServer()
+    server.ntp_time_ms = 0      # no NTP thread, just use the local clock
+    server.perf_counter_at_last_ntp = time.perf_counter()
+
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind(("127.0.0.1", 0))
+    addr = client.getsockname()
+    config = ambilight_pb2.Message()
+    config.type = ambilight_pb2.MessageType.CONFIG
+    config.config.ipv4 = addr[0]
+    config.config.port = addr[1]
+    config.config.num_leds = processing.NUM_LEDS
+    config.config.data_format = ambilight_pb2.DataFormat.RAW_RGB
+    server.handle_message(config.SerializeToString(), addr)
+
+    slot = FrameSlot()
+    output = OutputScheduler(slot, server)
+    return server, slot, output, client
+
+def check_gain(frames):
+    """
+    Compares FrameProcessor.process(frame, gain) with process_frame() of the
+    frame scaled by gain, both without gamma. Returns True if no LED differs
+    by more than MAX_GAIN_DIFF, and none at all when not scaling.
+    """
+    params = processing.PipelineParams(ROI, RESOLUTION, gamma=(1, 1, 1))
+    processor = processing.FrameProcessor(params)
+    worst = 0
+    for gain in (1.0, GAIN, 0.5, 0.1):
+        for frame in frames:
+            diff = np.abs(processor.process(frame, gain).astype(int) - processing.process_frame(frame * gain, params)).max()
+            worst = max(worst, diff)
+    exact = all(np.array_equal(processor.process(frame), processing.process_frame(frame, params)) for frame in frames)
+    print(f"gain on zone means vs scaled frame: max diff {worst} levels (budget {MAX_GAIN_DIFF}), "
+          f"{'identical' if exact else 'DIFFERENT'} without gain")
+    return worst <= MAX_GAIN_DIFF and exact
+
+def main():
+    server, slot, output, client = setup()
+    processor = processing.FrameProcessor(processing.PipelineParams(ROI, RESOLUTION))
+    fingerprint = processing.FrameFingerprint()
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (RESOLUTION[1], RESOLUTION[0], 3), dtype=np.uint8) for _ in range(4)]
+
+    def frame_step(i):
+        frame = frames[i % len(frames)]
+        if fingerprint.matches(frame):
+            raise RuntimeError("synthetic frames must never be skipped")
+        led_array = processor.process(frame, GAIN)
+        slot.publish(led_array)
+        now_s = time.perf_counter()
+        output.tick(now_s, 1 / 90)
+
+    for i in range(WARMUP_FRAMES):
+        frame_step(i)
+
+    peaks = np.zeros(NUM_FRAMES, dtype=np.int64)   # preallocated, so recording doesn't count as growth
+    tracemalloc.start()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    for i in range(NUM_FRAMES):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        frame_step(i)
+        peaks[i] = tracemalloc.get_traced_memory()[1] - before
+    growth = tracemalloc.get_traced_memory()[0] - start_bytes
+    tracemalloc.stop()
+
+    received = 0
+    client.setblocking(False)
+    try:
+        while True:
+            client.recv(server.MAX_MESSAGE_BYTES)
+            received += 1
+    except BlockingIOError:
+        pass
+
+    worst = max(peaks)
+    print(f"per-frame peak bytes: median {int(np.median(peaks))}  max {worst}  (budget {PER_FRAME_BUDGET_BYTES})")
+    print(f"growth over {NUM_FRAMES} frames: {growth} bytes (budget {GROWTH_BUDGET_BYTES})")
+    print(f"packets received by the client: {received}")
+
+    ok = worst <= PER_FRAME_BUDGET_BYTES and growth <= GROWTH_BUDGET_BYTES and received > 0
+    ok &= check_gain(frames)
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
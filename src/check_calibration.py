@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Checks the automatic ROI calibration on synthetic camera frames with known
+screen corners: a lit wall with a lamp, a TV showing blocky content or white,
+blur and sensor noise. Runs both the white-screen calibration (with a fake TV)
+and the passive drift check, and exits nonzero if any corner is off by more
+than MAX_ERROR_PX. The drift check must not report a static or letterboxed
+picture as drift. Also checks that saving a ROI at a new resolution, or
+autotuning to one, keeps the ROI of every screen in a multi-screen setup in
+place.
+
+    python3 check_calibration.py
+"""
+
+## Imports ###
+import json
+import os
+import sys
+import tempfile
+import cv2
+import numpy as np
+import autotune
+import calibrate
+import processing
+
+RESOLUTION = processing.DEFAULT_RESOLUTION
+SCREENS = [
+    [[29, 29], [144, 27], [143, 110], [29, 98]],            # the ROI in setup.json
+    [[20.5, 15.2], [140.3, 20.8], [138.9, 105.4], [22.1, 110.7]],
+    [[40, 35], [120, 35], [120, 80], [40, 80]],
+]
+MAX_ERROR_PX = 1.0
+NOISE_LEVELS = 4.0          # std of the sensor noise in 8-bit levels
+SUPERSAMPLE = 8             # draw the screen this much finer, for fractional corners
+
+class FakeTV:
+    """
+    Stands in for TV.TV: tells the fake camera what the screen shows.
+    """
+    def __init__(self):
+        self.white = False
+
+    def show_white_screen(self):
+        self.white = True
+
+    def go_to_last_source(self):
+        self.white = False
+
+class FakeCamera:
+    """
+    Renders frames of a TV with the given corners in a room.
+    """
+    def __init__(self, corners, tv, seed=0):
+        self.tv = tv
+        self.rng = np.random.default_rng(seed)
+        w, h = RESOLUTION
+        x, y = np.meshgrid(np.arange(w), np.arange(h))
+        self.room = np.dstack([60 + 40 * x / w] * 3) + 10 * (y / h)[..., None]    # unevenly lit wall
+        cv2.circle(self.room, (w - 12, 12), 8, (250, 250, 250), -1)                 # a lamp, bright in every frame
+
+        # Antialiased screen mask from a supersampled polygon. Pixel centers are
+        # at integer coordinates, as in cv2.warpPerspective.
+        big = np.zeros((h * SUPERSAMPLE, w * SUPERSAMPLE), np.uint8)
+        big_corners = (np.float32(corners) + 0.5) * SUPERSAMPLE - 0.5
+        cv2.fillConvexPoly(big, np.round(big_corners * 16).astype(np.int32), 255, shift=4)
+        self.mask = cv2.resize(big, (w, h), interpolation=cv2.INTER_AREA)[..., None] / 255
+
+    def capture(self):
+        h, w = RESOLUTION[1], RESOLUTION[0]
+        if self.tv.white:
+            screen = np.full((h, w, 3), 235.0)
+        else:
+            blocks = self.rng.integers(10, 200, (h // 16 + 1, w // 16 + 1, 3)).astype(np.float64)
+            screen = np.repeat(np.repeat(blocks, 16, axis=0), 16, axis=1)[:h, :w]
+        frame = self.room * (1 - self.mask) + screen * self.mask
+        frame = cv2.GaussianBlur(frame, (3, 3), 0.7) + self.rng.normal(0, NOISE_LEVELS, frame.shape)
+        return np.clip(frame, 0, 255).astype(np.uint8)
+
+def report(name, corners, found):
+    if found is None:
+        print(f"{name}: no screen found")
+        return False
+    error = calibrate.corner_drift(corners, found)
+    print(f"{name}: max corner error {error:.2f} px")
+    return error <= MAX_ERROR_PX
+
+def check_multi_screen_save():
+    """
+    Saves a calibrated ROI, then an autotune result, to a two-screen
+    setup.json at other resolutions. Every ROI must keep covering the same
+    part of the camera view.
+    """
+    path = os.path.join(tempfile.mkdtemp(), "setup.json")
+    setup = {"pan": 0, "tilt": 0, "roi": SCREENS[0], "resolution": list(RESOLUTION),
+             "pipelines": [{"name": "tv"}, {"name": "mon", "roi": SCREENS[2]}]}
+    with open(path, "w") as f:
+        json.dump(setup, f)
+
+    def rois():
+        with open(path) as f:
+            saved = json.load(f)
+        scale = RESOLUTION[0] / saved["resolution"][0]
+        return [[[x * scale, y * scale] for x, y in roi] for roi in (saved["roi"], saved["pipelines"][1]["roi"])]
+
+    ok = True
+    try:
+        calibrate.save_roi(path, SCREENS[1], RESOLUTION)
+        ok = False      # must name the screen
+    except ValueError:
+        pass
+    new_roi = [[2 * x, 2 * y] for x, y in SCREENS[1]]
+    calibrate.save_roi(path, new_roi, (2 * RESOLUTION[0], 2 * RESOLUTION[1]), pipeline="mon")
+    top, mon = rois()
+    ok &= calibrate.corner_drift(top, SCREENS[0]) < 0.01 and calibrate.corner_drift(mon, SCREENS[1]) < 0.01
+
+    with open(path) as f:
+        autotune.save(path, json.load(f), (RESOLUTION[0] // 2, RESOLUTION[1] // 2), 90, {})
+    top, mon = rois()
+    ok &= calibrate.corner_drift(top, SCREENS[0]) < 0.05 and calibrate.corner_drift(mon, SCREENS[1]) < 0.05
+    print(f"multi-screen save: {'ROIs kept in place' if ok else 'FAILED, a ROI moved'}")
+    return ok
+
+def drift_checks(camera, roi, count):
+    """
+    Runs count drift checks against roi on frames from camera. Returns the
+    result of each.
+    """
+    monitor = calibrate.DriftMonitor(sample_interval_s=0, num_samples=60)
+    results = []
+    t = 0
+    for _ in range(count):
+        while not monitor.add(camera.capture(), t):
+            t += 1
+        t += 1
+        results.append(monitor.check(roi))
+    return results
+
+def main():
+    ok = True
+    for i, corners in enumerate(SCREENS):
+        tv = FakeTV()
+        camera = FakeCamera(corners, tv, seed=i)
+        found = calibrate.calibrate(camera.capture, tv, settle_s=0)
+        ok &= report(f"screen {i} white-screen", corners, found)
+
+        shifted = [[x + 5, y] for x, y in corners]      # the ROI before the camera was bumped
+        drifts = drift_checks(camera, shifted, calibrate.DRIFT_CONFIRMATIONS)
+        ok &= all(drift is None for drift in drifts[:-1])
+        ok &= report(f"screen {i} drift check", corners, drifts[-1])
+
+    # A static picture must not be mistaken for drift
+    tv = FakeTV()
+    tv.white = True
+    static = drift_checks(FakeCamera(SCREENS[0], tv), SCREENS[1], 2 * calibrate.DRIFT_CONFIRMATIONS)
+    print(f"static picture: {'inconclusive' if all(drift is None for drift in static) else 'reported drift'}")
+    ok &= all(drift is None for drift in static)
+
+    # Nor a letterboxed film, whose picture is the middle of the screen
+    ul, ur, lr, ll = np.float32(SCREENS[0])
+    bars = 0.15
+    picture = [ul + bars * (ll - ul), ur + bars * (lr - ur), lr + bars * (ur - lr), ll + bars * (ul - ll)]
+    letterboxed = drift_checks(FakeCamera(picture, FakeTV()), SCREENS[0], 2 * calibrate.DRIFT_CONFIRMATIONS)
+    print(f"letterboxed picture: {'inconclusive' if all(drift is None for drift in letterboxed) else 'reported drift'}")
+    ok &= all(drift is None for drift in letterboxed)
+
+    ok &= check_multi_screen_save()
+
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
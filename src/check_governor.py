@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Checks the thermal and load governor against a fake sysfs tree: it must step
+down one stage at a time while hot, throttled or missing frames, hold between
+the thresholds, and step back up only after staying clear. Also checks that
+the reduced processing resolution of the lower stages stays close to the full
+one and is cheaper.
+
+    python3 check_governor.py
+"""
+
+## Imports ###
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import autotune
+import governor
+import processing
+
+ROI = [[29, 29], [144, 27], [143, 110], [29, 98]]
+MAX_SCALED_DIFF = 8         # mean abs LED difference (8-bit levels) allowed at the reduced scale
+
+class FakeSysfs:
+    """
+    A sysfs tree with just the files the governor reads.
+    """
+    def __init__(self):
+        self.root = tempfile.mkdtemp()
+        for path in (governor.TEMP_PATH, governor.THROTTLED_PATH):
+            os.makedirs(os.path.dirname(os.path.join(self.root, path)), exist_ok=True)
+        self.set(temp_c=50, throttled=0)
+
+    def set(self, temp_c, throttled):
+        with open(os.path.join(self.root, governor.TEMP_PATH), "w") as f:
+            f.write(f"{int(temp_c * 1000)}\n")
+        with open(os.path.join(self.root, governor.THROTTLED_PATH), "w") as f:
+            f.write(f"0x{throttled:x}\n")
+
+def run(gov, sysfs, now_s, duration_s, temp_c=50, throttled=0, miss_rate=0.0, fps=90):
+    """
+    Feeds the governor duration_s of frames at the given conditions. Returns
+    the time at the end and the levels seen at each sensor update.
+    """
+    sysfs.set(temp_c, throttled)
+    levels = []
+    for _ in range(int(duration_s / governor.UPDATE_INTERVAL_S)):
+        for i in range(fps):
+            gov.frame(i < miss_rate * fps)
+        now_s += governor.UPDATE_INTERVAL_S
+        gov.update(now_s)
+        levels.append(gov.level)
+    return now_s, levels
+
+def check(name, ok):
+    print(f"{'ok    ' if ok else 'FAILED'} {name}")
+    return ok
+
+def main():
+    sysfs = FakeSysfs()
+    gov = governor.Governor(sysfs.root)
+    top = len(governor.LEVELS) - 1
+    ok = True
+
+    t, levels = run(gov, sysfs, 0, 30)
+    ok &= check("stays at level 0 while cool", set(levels) == {0})
+
+    t, levels = run(gov, sysfs, t, 30, temp_c=78)
+    steps = [i for i in range(1, len(levels)) if levels[i] != levels[i - 1]]
+    ok &= check("steps down one stage at a time while hot", levels[0] == 1 and levels[-1] == top and
+                all(b - a == 1 for a, b in zip(levels, levels[1:]) if a != b) and
+                all(b - a >= governor.STEP_DOWN_HOLD_S / governor.UPDATE_INTERVAL_S for a, b in zip(steps, steps[1:])))
+
+    t, levels = run(gov, sysfs, t, 300, temp_c=72)
+    ok &= check("holds between the thresholds", set(levels) == {top})
+
+    t, levels = run(gov, sysfs, t, governor.STEP_UP_HOLD_S - 2, temp_c=65)
+    ok &= check("does not step up before the hold time", set(levels) == {top})
+    t, levels = run(gov, sysfs, t, governor.STEP_UP_HOLD_S * top + 2, temp_c=65)
+    ok &= check("steps back up to level 0 once clear", levels[-1] == 0 and len(set(levels)) == top + 1)
+
+    t, levels = run(gov, sysfs, t, 3, throttled=0x4)
+    ok &= check("steps down when the firmware throttles", levels[-1] == 1)
+    t, levels = run(gov, sysfs, t, 3, throttled=0x40000)
+    ok &= check("ignores throttling that is over", levels[-1] == 1)
+
+    gov = governor.Governor(sysfs.root)
+    t, levels = run(gov, sysfs, 0, 3, miss_rate=0.1)
+    ok &= check("steps down when frames are missed", levels[-1] == 1 and gov.miss_rate >= 0.09)
+
+    gov = governor.Governor(tempfile.mkdtemp())
+    t, levels = run(gov, sysfs, 0, 10)
+    ok &= check(f"runs without sensors ({gov.status()})", set(levels) == {0} and gov.temp_c is None)
+
+    gov = governor.Governor(sysfs.root, enabled=False)
+    t, levels = run(gov, sysfs, 0, 10, temp_c=90)
+    ok &= check("stays at level 0 when disabled", set(levels) == {0})
+
+    # Reduced processing resolution
+    params = processing.PipelineParams(ROI, processing.DEFAULT_RESOLUTION)
+    frames = autotune.synthetic_frames(processing.DEFAULT_RESOLUTION)
+    full = processing.FrameProcessor(params)
+    reduced = processing.FrameProcessor(params, scale=governor.LEVELS[-1]["scale"])
+    diffs = []
+    times = {full: 0.0, reduced: 0.0}
+    for _ in range(50):
+        for frame in frames:
+            for processor in (full, reduced):
+                start = time.perf_counter()
+                processor.process(frame)
+                times[processor] += time.perf_counter() - start
+            diffs.append(np.abs(full.out.astype(int) - reduced.out).mean())
+    print(f"       reduced scale: mean LED diff {np.mean(diffs):.2f} levels, "
+          f"{times[reduced] / times[full]:.0%} of the full-scale time")
+    ok &= check("reduced scale stays close and is cheaper", np.mean(diffs) <= MAX_SCALED_DIFF and times[reduced] < times[full])
+
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Checks the per-client DATA pacing against synthetic receiver reports: the send
+rate must back off while a client reports loss, stop at the minimum rate, and
+climb back to the client's max refresh rate once the link is clean. Also
+checks that due() lets through about send_rate_hz frames per second.
+
+    python3 check_pacing.py
+"""
+
+## Imports ###
+import sys
+from proto import ambilight_pb2
+from AmbilightServer import Client
+
+MAX_REFRESH_HZ = 60
+REPORT_FRAMES = 100         # frames covered by each report
+CAMERA_FPS = 90             # rate due() is asked at
+
+class FakeLink:
+    """
+    Builds cumulative receiver reports for a link with the given loss.
+    """
+    def __init__(self):
+        self.received = 0
+        self.lost = 0
+
+    def report(self, loss):
+        lost = round(REPORT_FRAMES * loss)
+        self.received += REPORT_FRAMES - lost
+        self.lost += lost
+        report = ambilight_pb2.Message().report
+        report.received = self.received
+        report.lost = self.lost
+        report.jitter_ms = 2.0
+        report.max_refresh_hz = MAX_REFRESH_HZ
+        return report
+
+def reports(client, link, loss, count):
+    """
+    Applies count reports with the given loss. Returns the send rate after each.
+    """
+    rates = []
+    for _ in range(count):
+        client.apply_report(link.report(loss))
+        rates.append(client.send_rate_hz)
+    return rates
+
+def sent_per_second(client):
+    now_s = 0.0
+    sent = 0
+    for _ in range(CAMERA_FPS):
+        sent += client.due(now_s)
+        now_s += 1 / CAMERA_FPS
+    return sent
+
+def check(name, ok):
+    print(f"{'ok    ' if ok else 'FAILED'} {name}")
+    return ok
+
+def main():
+    client = Client(ambilight_pb2.Message.Config(ipv4="127.0.0.1", port=1), 0)
+    link = FakeLink()
+    ok = True
+
+    ok &= check("never paces a client before its first report", client.send_rate_hz is None and
+                sent_per_second(client) == CAMERA_FPS)
+
+    rates = reports(client, link, 0.0, 1)
+    ok &= check("starts at the reported max refresh rate", rates == [MAX_REFRESH_HZ])
+
+    rates = reports(client, link, 0.2, 20)
+    ok &= check("backs off while the link is lossy", all(b < a for a, b in zip([MAX_REFRESH_HZ] + rates, rates)
+                                                          if a > Client.MIN_SEND_RATE_HZ))
+    ok &= check("stops at the minimum rate", rates[-1] == Client.MIN_SEND_RATE_HZ)
+    sent = sent_per_second(client)
+    ok &= check(f"sends about the minimum rate ({sent} frames in 1 s)", abs(sent - Client.MIN_SEND_RATE_HZ) <= 1)
+
+    rates = reports(client, link, 0.03, 5)
+    ok &= check("holds between the loss thresholds", set(rates) == {Client.MIN_SEND_RATE_HZ})
+
+    rates = reports(client, link, 0.0, 20)
+    ok &= check("recovers to the max refresh rate once clean", rates[-1] == MAX_REFRESH_HZ and
+                all(b - a <= Client.RATE_STEP_UP_HZ for a, b in zip(rates, rates[1:])))
+    client.next_send_s = 0.0
+    sent = sent_per_second(client)
+    ok &= check(f"sends about the max refresh rate ({sent} frames in 1 s)", abs(sent - MAX_REFRESH_HZ) <= 1)
+
+    link.received = link.lost = 0
+    rates = reports(client, link, 0.2, 1)
+    ok &= check("treats a restarted client's counts as fresh", rates[-1] < MAX_REFRESH_HZ and client.loss_fraction > 0.1)
+
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Polls a JSON config file for changes so settings can be reloaded without a
+restart.
+"""
+
+import json
+import logging
+import os
+import time
+
+log = logging.getLogger(__name__)
+
+CONFIG_POLL_INTERVAL_S = 1.0    # how often to stat the file
+
+class ConfigWatcher:
+    def __init__(self, path, poll_interval_s=CONFIG_POLL_INTERVAL_S):
+        self.path = path
+        self.poll_interval_s = poll_interval_s
+        self.mtime_ns = self._mtime_ns()
+        self.next_poll = time.monotonic() + poll_interval_s
+
+    def _mtime_ns(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def poll(self):
+        """
+        Cheap enough to call every frame: stats the file at most once per poll
+        interval. Returns the parsed contents if the file changed since the last
+        successful load, otherwise None. A file that fails to parse (e.g. caught
+        halfway through a write) is retried on the next poll, and the previous
+        settings stay in effect until then.
+        """
+        now = time.monotonic()
+        if now < self.next_poll:
+            return None
+        self.next_poll = now + self.poll_interval_s
+
+        mtime_ns = self._mtime_ns()
+        if mtime_ns is None or mtime_ns == self.mtime_ns:
+            return None
+
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Could not reload %s: %s", self.path, e)
+            return None
+
+        self.mtime_ns = mtime_ns
+        return data
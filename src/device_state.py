@@ -0,0 +1,195 @@
+"""
+Device-state daemon: the single owner of the TV and PS5 probes. Consumers
+(ambilight.py, ps5_status.py) subscribe on a local Unix socket and receive
+state changes as they happen instead of each polling the devices themselves.
+
+Events are JSON objects, one per line:
+    {"device": "tv", "state": "on", "initial": false}
+    {"device": "ps5", "state": "standby", "initial": false}
+
+On connect, a subscriber first receives the current state of every device that
+has been probed so far, with "initial": true. The first probe of each device
+is also sent with "initial": true, since it reports a state that was already
+there rather than a change (the PS5 being in standby at boot must not turn the
+TV off).
+
+See https://github.com/iharosi/ps5-wake for the PS5 probe.
+"""
+
+import json
+import os
+import select
+import socket
+import subprocess
+import threading
+import time
+import logging
+import log_utils
+
+log = logging.getLogger("device_state")
+
+DEVICE_STATE_SOCKET = "/tmp/ambilight-device-state.sock"
+
+TV_STATUS_INTERVAL_S = 5      # how often to ping the TV
+PS5_STATUS_INTERVAL_S = 2     # how often to query the PS5
+PS5_WAKE_CMD = "/home/pi/repos/ambilight-server/tools/ps5-wake -jP -B"
+PS5_STATUS_STANDBY = 620
+PS5_STATUS_ON = 200
+SUBSCRIBER_SEND_TIMEOUT_S = 1   # drop subscribers that stop reading
+
+DEVICE_TV = "tv"
+DEVICE_PS5 = "ps5"
+ON = "on"
+OFF = "off"
+STANDBY = "standby"
+
+class DeviceStateServer:
+    """
+    Runs one probe thread per device and publishes state changes to all
+    connected subscribers.
+    """
+
+    def __init__(self, path=DEVICE_STATE_SOCKET):
+        self.path = path
+        self.states = {}
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def publish(self, device, state):
+        """
+        Records the state of a device and, if it changed, sends an event to
+        every subscriber. The first state seen for a device is sent as initial.
+        Subscribers that can't keep up are dropped.
+        """
+        with self.lock:
+            previous = self.states.get(device)
+            if previous == state:
+                return
+            self.states[device] = state
+            line = self._event(device, state, previous is None)
+            log.info("%s is %s", device, state)
+
+            for sock in list(self.subscribers):
+                try:
+                    sock.sendall(line)
+                except OSError:
+                    self.subscribers.remove(sock)
+                    sock.close()
+
+    def _event(self, device, state, initial):
+        return (json.dumps({"device": device, "state": state, "initial": initial}) + "\n").encode()
+
+    def probe_tv(self):
+        """
+        Pings the TV every TV_STATUS_INTERVAL_S.
+        """
+        import TV
+
+        tv = TV.TV(connect=False)
+        if not tv.creds.get("ip"):
+            tv.connect()    # first run, discover the TV to learn its address
+        while True:
+            self.publish(DEVICE_TV, ON if tv.is_on() else OFF)
+            time.sleep(TV_STATUS_INTERVAL_S)
+
+    def probe_ps5(self):
+        """
+        Queries the PS5 with ps5-wake every PS5_STATUS_INTERVAL_S.
+        """
+        while True:
+            output = subprocess.run(PS5_WAKE_CMD, shell=True, capture_output=True)
+            output_str = output.stdout.strip().decode("utf-8")
+            try:
+                code = json.loads(output_str)["code"]
+            except (json.decoder.JSONDecodeError, KeyError, TypeError):
+                log.warning("Could not decode string: %s", output_str, extra={"rate_limit": True})
+                code = None
+
+            if code == PS5_STATUS_ON:
+                self.publish(DEVICE_PS5, ON)
+            elif code == PS5_STATUS_STANDBY:
+                self.publish(DEVICE_PS5, STANDBY)
+            time.sleep(PS5_STATUS_INTERVAL_S)
+
+    def serve(self):
+        """
+        Starts the probes and accepts subscribers forever.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        server.listen()
+
+        threading.Thread(target=self.probe_tv, daemon=True).start()
+        threading.Thread(target=self.probe_ps5, daemon=True).start()
+
+        while True:
+            sock, _ = server.accept()
+            sock.settimeout(SUBSCRIBER_SEND_TIMEOUT_S)
+            with self.lock:
+                try:
+                    for device, state in self.states.items():
+                        sock.sendall(self._event(device, state, True))
+                except OSError:
+                    sock.close()
+                    continue
+                self.subscribers.append(sock)
+
+class DeviceStateClient:
+    """
+    Subscriber side of the device-state socket.
+    """
+
+    def __init__(self, path=DEVICE_STATE_SOCKET):
+        self.path = path
+        self.sock = None
+        self.buffer = b""
+
+    def connect(self):
+        """
+        Connects to the daemon. Returns False if it is not running.
+        """
+        self.close()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            return False
+        self.sock = sock
+        return True
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+        self.sock = None
+        self.buffer = b""
+
+    def connected(self):
+        return self.sock is not None
+
+    def read_event(self, timeout=None):
+        """
+        Returns the next event as a dict, or None if none arrived within
+        timeout seconds. Raises ConnectionError if the daemon went away.
+        """
+        while b"\n" not in self.buffer:
+            if self.sock is None:
+                raise ConnectionError("not connected to device-state daemon")
+            readable, _, _ = select.select([self.sock], [], [], timeout)
+            if not readable:
+                return None
+            data = self.sock.recv(4096)
+            if not data:
+                self.close()
+                raise ConnectionError("device-state daemon closed the connection")
+            self.buffer += data
+
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        return json.loads(line)
+
+if __name__ == "__main__":
+    log_utils.setup_logging()
+    DeviceStateServer().serve()
+    log.info("Exiting")
@@ -0,0 +1,160 @@
+"""
+Fixed-layout binary DATA packets, used instead of a protobuf Message for
+clients that negotiate DataFormat.RAW_RGB or RAW_RGB_CHUNKED in their CONFIG
+message.
+
+Version 1 (RAW_RGB), one packet per frame, network byte order:
+    magic       2 bytes     b"AL"
+    version     uint8       1
+    flags       uint8       reserved, 0
+    sequence    uint32
+    timestamp   int64       ms, same clock as the protobuf timestamp
+    num_leds    uint16
+    led_data    num_leds * 3 bytes of RGB
+
+Version 2 (RAW_RGB_CHUNKED) splits a frame into chunks that each fit in one
+datagram, so strips larger than MAX_MESSAGE_BYTES do not rely on IP
+fragmentation and a lost chunk only loses its own LEDs:
+    magic       2 bytes     b"AL"
+    version     uint8       2
+    flags       uint8       reserved, 0
+    sequence    uint32
+    timestamp   int64
+    frame_id    uint32      same for every chunk of a frame
+    chunk_index uint16
+    chunk_count uint16
+    led_offset  uint32      index of the first LED in this chunk
+    total_leds  uint32      LEDs in the whole frame
+    num_leds    uint16      LEDs in this chunk
+    led_data    num_leds * 3 bytes of RGB
+"""
+
+import struct
+
+MAGIC = b"AL"
+VERSION = 1
+HEADER = struct.Struct("!2sBBIqH")
+
+CHUNKED_VERSION = 2
+CHUNKED_HEADER = struct.Struct("!2sBBIqIHHIIH")
+
+class Encoder:
+    """
+    Writes packets into a single preallocated buffer. The returned memoryview
+    is only valid until the next call to encode().
+    """
+
+    def __init__(self, max_payload_bytes):
+        self.buffer = bytearray(HEADER.size + max_payload_bytes)
+        self.view = memoryview(self.buffer)
+
+    def encode(self, sequence, timestamp_ms, led_data):
+        """
+        Packs the header and copies led_data (any bytes-like object) in place.
+        Returns a memoryview over the encoded packet.
+        """
+        n = len(led_data)
+        if n > len(self.buffer) - HEADER.size:
+            raise ValueError(f"LED payload of {n} bytes does not fit in the packet buffer")
+
+        HEADER.pack_into(self.buffer, 0, MAGIC, VERSION, 0, sequence & 0xFFFFFFFF, timestamp_ms, n // 3)
+        self.view[HEADER.size:HEADER.size + n] = led_data
+
+        return self.view[:HEADER.size + n]
+
+def decode(packet):
+    """
+    Decodes a packet. Returns a 3-element tuple with (sequence, timestamp_ms,
+    led_data), or None if the packet is not a valid version 1 packet.
+    """
+    if len(packet) < HEADER.size:
+        return None
+
+    magic, version, _, sequence, timestamp_ms, num_leds = HEADER.unpack_from(packet, 0)
+    if magic != MAGIC or version != VERSION or len(packet) < HEADER.size + num_leds * 3:
+        return None
+
+    return (sequence, timestamp_ms, bytes(packet[HEADER.size:HEADER.size + num_leds * 3]))
+
+class ChunkedEncoder:
+    """
+    Splits a frame into version 2 chunks of at most max_packet_bytes each. One
+    buffer per chunk is allocated the first time a frame needs it and reused
+    after that. The returned memoryviews are only valid until the next call to
+    encode().
+    """
+
+    def __init__(self, max_packet_bytes):
+        self.leds_per_chunk = (max_packet_bytes - CHUNKED_HEADER.size) // 3
+        self.chunk_bytes = CHUNKED_HEADER.size + self.leds_per_chunk * 3
+        self.buffers = []
+        self.frame_id = 0
+
+    def encode(self, sequence, timestamp_ms, led_data):
+        """
+        Encodes led_data (any bytes-like object) into chunks. Returns a list of
+        memoryviews, one per chunk. Each chunk uses its own sequence number,
+        starting at sequence.
+        """
+        src = memoryview(led_data).cast('B')
+        total_leds = len(src) // 3
+        chunk_count = max(1, -(-total_leds // self.leds_per_chunk))
+
+        while len(self.buffers) < chunk_count:
+            self.buffers.append(memoryview(bytearray(self.chunk_bytes)))
+
+        self.frame_id = (self.frame_id + 1) & 0xFFFFFFFF
+        packets = []
+        for chunk_index in range(chunk_count):
+            led_offset = chunk_index * self.leds_per_chunk
+            num_leds = min(self.leds_per_chunk, total_leds - led_offset)
+            buf = self.buffers[chunk_index]
+            CHUNKED_HEADER.pack_into(buf, 0, MAGIC, CHUNKED_VERSION, 0, (sequence + chunk_index) & 0xFFFFFFFF,
+                                     timestamp_ms, self.frame_id, chunk_index, chunk_count, led_offset,
+                                     total_leds, num_leds)
+            end = CHUNKED_HEADER.size + num_leds * 3
+            buf[CHUNKED_HEADER.size:end] = src[led_offset * 3:(led_offset + num_leds) * 3]
+            packets.append(buf[:end])
+
+        return packets
+
+class Assembler:
+    """
+    Client-side reference for applying version 2 chunks. Chunks are written
+    straight into the LED buffer as they arrive, so a lost chunk leaves only
+    its own LEDs at their previous values. Chunks from frames older than the
+    newest one seen are dropped.
+    """
+
+    def __init__(self, total_leds):
+        self.leds = bytearray(total_leds * 3)
+        self.frame_id = None
+        self.chunks_applied = 0
+        self.chunks_stale = 0
+
+    def apply(self, packet):
+        """
+        Applies a chunk. Returns the frame id it belonged to, or None if the
+        packet was invalid or stale.
+        """
+        if len(packet) < CHUNKED_HEADER.size:
+            return None
+
+        (magic, version, _, _, _, frame_id, _, _, led_offset,
+         _, num_leds) = CHUNKED_HEADER.unpack_from(packet, 0)
+        if magic != MAGIC or version != CHUNKED_VERSION or len(packet) < CHUNKED_HEADER.size + num_leds * 3:
+            return None
+
+        # frame ids wrap at 2^32, so compare with serial number arithmetic
+        if self.frame_id is not None and ((frame_id - self.frame_id) & 0xFFFFFFFF) >= 0x80000000:
+            self.chunks_stale += 1
+            return None
+        self.frame_id = frame_id
+
+        start = led_offset * 3
+        end = min(start + num_leds * 3, len(self.leds))
+        if end > start:
+            self.leds[start:end] = packet[CHUNKED_HEADER.size:CHUNKED_HEADER.size + end - start]
+        self.chunks_applied += 1
+
+        return frame_id
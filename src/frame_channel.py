@@ -0,0 +1,109 @@
+"""
+Camera frames from a camera process to one consumer process. FrameChannel
+stands in for a multiprocessing.Queue of QMsgCamera messages (put() and get()
+work the same way) but holds only the newest frame, in shared memory, and
+takes no locks. A Queue has locks and a pipe that a camera worker killed by
+its supervisor (see supervisor.py) can leave held or half written, blocking
+or corrupting the standby that replaces it. Here a worker killed mid-frame
+only leaves a half-written back buffer that was never published, and the
+next worker overwrites it.
+
+The frame is double buffered: put() announces the frame it is about to
+write, writes the buffer the newest frame is not in, then bumps a sequence
+number and signals an eventfd that get() waits on. A reader that finds a
+write to its buffer announced after copying it retries.
+"""
+
+## Imports ###
+import logging
+import os
+import queue   # for the Empty exception
+import select
+import time
+import types
+from multiprocessing import RawArray, RawValue
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+### Defines ###
+WIDTH_ALIGN = 64        # libcamera may round the configured size up to these
+HEIGHT_ALIGN = 16
+
+def _round_up(value, multiple):
+    return -(-value // multiple) * multiple
+
+class FrameChannel:
+    """
+    Latest-value channel for uint8 frames of up to the given resolution (w,
+    h), plus alignment padding. Create it before forking the processes that
+    use it. There must be only one writer at a time and one reader.
+    get() returns a message whose frame is overwritten by the next get().
+    """
+
+    def __init__(self, resolution, channels=3):
+        width, height = resolution
+        self.capacity = _round_up(width, WIDTH_ALIGN) * _round_up(height, HEIGHT_ALIGN) * channels
+        self.buffers = (RawArray('B', self.capacity), RawArray('B', self.capacity))
+        self.shapes = RawArray('i', 6)      # frame shape of each buffer
+        self.seq = RawValue('Q', 0)         # frames published; the newest is in buffers[seq % 2]
+        self.writing = RawValue('Q', 0)     # seq of the frame being written, if any
+        self.fd = os.eventfd(0, os.EFD_NONBLOCK)
+
+        # Reader side, only used in the reading process
+        self.last_seq = 0
+        self.frames = {}                    # shape -> reader's copy of the frame
+        self.message = types.SimpleNamespace(frame=None)
+
+    def _view(self, index, shape):
+        return np.frombuffer(self.buffers[index], dtype=np.uint8, count=int(np.prod(shape))).reshape(shape)
+
+    def put(self, msg):
+        """
+        Publishes msg.frame as the newest frame, replacing any the reader
+        hasn't taken yet. A frame that doesn't fit is dropped with an error,
+        since restarting the camera wouldn't change its size.
+        """
+        frame = msg.frame
+        if frame.dtype != np.uint8 or frame.ndim != 3 or frame.nbytes > self.capacity:
+            log.error("Dropping frame %s %s, the channel only fits %d bytes", frame.shape, frame.dtype, self.capacity,
+                      extra={"rate_limit": True})
+            return
+        seq = self.seq.value + 1
+        index = seq % 2
+        self.writing.value = seq
+        np.copyto(self._view(index, frame.shape), frame)
+        self.shapes[3 * index:3 * index + 3] = frame.shape
+        self.seq.value = seq
+        os.eventfd_write(self.fd, 1)
+
+    def get(self, block=True, timeout=None):
+        """
+        Returns a message with the newest frame not returned yet, waiting up
+        to timeout seconds for one if block is set. Raises queue.Empty if
+        there is none.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            seq = self.seq.value
+            if seq != self.last_seq:
+                index = seq % 2
+                shape = tuple(self.shapes[3 * index:3 * index + 3])
+                frame = self.frames.get(shape)
+                if frame is None:
+                    frame = self.frames[shape] = np.empty(shape, dtype=np.uint8)
+                np.copyto(frame, self._view(index, shape))
+                if self.writing.value < seq + 2:    # otherwise the writer reused the buffer while we copied
+                    self.last_seq = seq
+                    self.message.frame = frame
+                    return self.message
+                continue
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if not block or (remaining is not None and remaining <= 0):
+                raise queue.Empty
+            if select.select([self.fd], [], [], remaining)[0]:
+                try:
+                    os.eventfd_read(self.fd)
+                except BlockingIOError:
+                    pass
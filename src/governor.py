@@ -0,0 +1,190 @@
+"""
+Thermal and load governor. A Pi in a closed TV cabinet heats up during a long
+movie and throttles, and the 90 fps pipeline then misses frames in bursts.
+The governor watches the CPU temperature and the firmware throttle flags in
+sysfs, plus the pipeline's own deadline-miss rate. As limits approach it steps
+down through LEVELS, one stage at a time, and steps back up once everything
+has stayed clear for a while (hysteresis).
+
+Settings come from an optional "governor" object in setup.json, e.g.
+    "governor": {"enabled": true, "temp_high_c": 75, "temp_low_c": 68}
+"sysfs_root" points the sensors somewhere else, e.g. a fake tree for tests.
+"""
+
+## Imports ###
+import logging
+import os
+import time
+
+log = logging.getLogger(__name__)
+
+### Defines ###
+SYSFS_ROOT = "/sys"
+TEMP_PATH = "class/thermal/thermal_zone0/temp"                      # millidegrees C
+THROTTLED_PATH = "devices/platform/soc/soc:firmware/get_throttled"  # Pi firmware flags, hex
+THROTTLED_NOW_MASK = 0xf        # under-voltage, frequency capped, throttled, soft temperature limit
+
+DEFAULT_TEMP_HIGH_C = 75        # step down at or above this temperature
+DEFAULT_TEMP_LOW_C = 68         # only step back up at or below this one
+DEFAULT_MISS_HIGH = 0.05        # step down at or above this fraction of missed frames
+DEFAULT_MISS_LOW = 0.01         # only step back up at or below this one
+
+UPDATE_INTERVAL_S = 1.0         # how often to read the sensors
+STEP_DOWN_HOLD_S = 5.0          # minimum time between two steps down
+STEP_UP_HOLD_S = 60.0           # how long everything must stay clear before each step up
+
+# Cumulative stages, cheapest to notice last: processing resolution scale for
+# the warp, process every Nth camera frame, cap on the output refresh rate
+LEVELS = (
+    {"scale": 1.0, "frame_divider": 1, "refresh_hz": None},
+    {"scale": 0.5, "frame_divider": 1, "refresh_hz": None},
+    {"scale": 0.5, "frame_divider": 2, "refresh_hz": None},
+    {"scale": 0.5, "frame_divider": 2, "refresh_hz": 45},
+)
+
+def governor_settings_from_setup(setup):
+    """
+    Returns the keyword arguments for Governor.configure() from the
+    "governor" object in the given setup.json contents. Raises ValueError if
+    a low threshold is above its high one.
+    """
+    governor = setup.get("governor", {})
+    settings = {
+        "enabled": bool(governor.get("enabled", True)),
+        "temp_high_c": float(governor.get("temp_high_c", DEFAULT_TEMP_HIGH_C)),
+        "temp_low_c": float(governor.get("temp_low_c", DEFAULT_TEMP_LOW_C)),
+        "miss_high": float(governor.get("miss_high", DEFAULT_MISS_HIGH)),
+        "miss_low": float(governor.get("miss_low", DEFAULT_MISS_LOW)),
+    }
+    if settings["temp_low_c"] > settings["temp_high_c"] or settings["miss_low"] > settings["miss_high"]:
+        raise ValueError("governor low thresholds must not be above the high ones")
+    return settings
+
+def governor_from_setup(setup):
+    """
+    Returns a Governor configured from the given setup.json contents.
+    """
+    sysfs_root = setup.get("governor", {}).get("sysfs_root", SYSFS_ROOT)
+    return Governor(sysfs_root, **governor_settings_from_setup(setup))
+
+class Governor:
+    """
+    Picks the degradation level. Call frame() for every camera frame,
+    overran() for every processed frame that took longer than the frame
+    period, and update() as often as convenient; update() reads the sensors at most every
+    UPDATE_INTERVAL_S and returns True when the level changed. settings() are
+    the stage settings of the current level.
+    """
+
+    def __init__(self, sysfs_root=SYSFS_ROOT, **settings):
+        self.temp_path = os.path.join(sysfs_root, TEMP_PATH)
+        self.throttled_path = os.path.join(sysfs_root, THROTTLED_PATH)
+        self.configure(**settings)
+
+        self.level = 0
+        self.temp_c = None
+        self.throttled = 0
+        self.miss_rate = 0.0
+        self.frames = 0
+        self.missed = 0
+        self.next_update_s = 0
+        self.last_step_down_s = None
+        self.clear_since_s = None
+
+    def configure(self, enabled=True, temp_high_c=DEFAULT_TEMP_HIGH_C, temp_low_c=DEFAULT_TEMP_LOW_C,
+                  miss_high=DEFAULT_MISS_HIGH, miss_low=DEFAULT_MISS_LOW):
+        """
+        Changes the thresholds. A disabled governor stays at level 0.
+        """
+        self.enabled = enabled
+        self.temp_high_c = temp_high_c
+        self.temp_low_c = temp_low_c
+        self.miss_high = miss_high
+        self.miss_low = miss_low
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def read_sensors(self):
+        """
+        Reads the temperature (None if there is no sensor) and the throttle
+        flags (0 if not on a Pi).
+        """
+        temp = self._read(self.temp_path)
+        self.temp_c = int(temp) / 1000 if temp else None
+        throttled = self._read(self.throttled_path)
+        self.throttled = int(throttled, 16) if throttled else 0
+
+    def frame(self, missed):
+        """
+        Counts a camera frame, and whether the pipeline missed its deadline.
+        """
+        self.frames += 1
+        self.missed += missed
+
+    def overran(self):
+        """
+        Counts a frame whose processing took longer than the frame period.
+        """
+        self.missed += 1
+
+    def settings(self):
+        return LEVELS[self.level]
+
+    def update(self, now_s=None):
+        """
+        Reads the sensors if due and moves the level by at most one stage.
+        Returns True if the level changed.
+        """
+        now_s = time.perf_counter() if now_s is None else now_s
+        if now_s < self.next_update_s:
+            return False
+        self.next_update_s = now_s + UPDATE_INTERVAL_S
+
+        self.read_sensors()
+        self.miss_rate = min(self.missed / self.frames, 1.0) if self.frames else 0.0
+        self.frames = 0
+        self.missed = 0
+        if not self.enabled:
+            return self._set_level(0)
+
+        hot = self.temp_c is not None and self.temp_c >= self.temp_high_c
+        cool = self.temp_c is None or self.temp_c <= self.temp_low_c
+        throttled = bool(self.throttled & THROTTLED_NOW_MASK)
+
+        if hot or throttled or self.miss_rate >= self.miss_high:
+            self.clear_since_s = None
+            if self.level + 1 < len(LEVELS) and \
+               (self.last_step_down_s is None or now_s - self.last_step_down_s >= STEP_DOWN_HOLD_S):
+                self.last_step_down_s = now_s
+                return self._set_level(self.level + 1)
+        elif cool and self.miss_rate <= self.miss_low:
+            if self.clear_since_s is None:
+                self.clear_since_s = now_s
+            elif self.level > 0 and now_s - self.clear_since_s >= STEP_UP_HOLD_S:
+                self.clear_since_s = now_s      # wait again before the next step
+                return self._set_level(self.level - 1)
+        else:
+            self.clear_since_s = None           # between the thresholds: hold
+        return False
+
+    def _set_level(self, level):
+        if level == self.level:
+            return False
+        old_level, self.level = self.level, level
+        log.warning("Degradation level %d -> %d: %s %s", old_level, level, self.status(), LEVELS[level])
+        return True
+
+    def status(self):
+        """
+        Returns a one-line summary, e.g. for systemctl status.
+        """
+        temp = f"{self.temp_c:.1f} C" if self.temp_c is not None else "no sensor"
+        return f"level {self.level}/{len(LEVELS) - 1}, {temp}, throttled 0x{self.throttled:x}, missed {self.miss_rate:.1%}"
+
+    def stats(self):
+        return {"level": self.level, "temp_c": self.temp_c, "throttled": self.throttled, "miss_rate": self.miss_rate}
@@ -0,0 +1,119 @@
+"""
+Logging that stays off the hot path. Log calls only put the record on an
+in-memory queue. A background thread formats it and writes it to stdout, where
+journald picks it up. Repeated messages are rate limited, and per-frame
+events are counted and summarized periodically instead of logged one by one.
+
+Call setup_logging() once at program start. The writer thread is restarted
+automatically in forked child processes.
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.environ.get("AMBILIGHT_LOG_LEVEL", "INFO")
+LOG_FORMAT = "%(levelname)s %(processName)s %(name)s: %(message)s"
+RATE_LIMIT_INTERVAL_S = 10      # identical messages are logged at most once per interval
+
+_listener = None
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets a given message template (per logger) through at most once per
+    interval, for records that opt in with extra={"rate_limit": True}, at any
+    level. The next one that gets through notes how many were suppressed.
+    Everything else passes, so distinct events are never dropped.
+    """
+
+    def __init__(self, interval_s=RATE_LIMIT_INTERVAL_S):
+        super().__init__()
+        self.interval_s = interval_s
+        self.last = {}          # (logger, msg template) -> (last emitted time, suppressed count)
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, "rate_limit", False):
+            return True
+
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            last_time, suppressed = self.last.get(key, (None, 0))
+            if last_time is not None and now - last_time < self.interval_s:
+                self.last[key] = (last_time, suppressed + 1)
+                return False
+            self.last[key] = (now, 0)
+
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar suppressed]"
+        return True
+
+class Aggregator:
+    """
+    Counts a per-frame event and logs one summary per interval, e.g.
+    "Missed 37 frames in last 10 s (worst 45.2 ms)". count() only does some
+    arithmetic unless a summary is due.
+    """
+
+    def __init__(self, logger, what, interval_s=RATE_LIMIT_INTERVAL_S, level=logging.WARNING, unit="ms"):
+        self.logger = logger
+        self.what = what
+        self.interval_s = interval_s
+        self.level = level
+        self.unit = unit
+        self.n = 0
+        self.worst = None
+        self.since = time.monotonic()
+
+    def count(self, value=None):
+        self.n += 1
+        if value is not None and (self.worst is None or value > self.worst):
+            self.worst = value
+        self.flush()
+
+    def flush(self, force=False):
+        """
+        Logs the summary if the interval has passed (or force is set) and there
+        is something to report.
+        """
+        now = time.monotonic()
+        if not force and now - self.since < self.interval_s:
+            return
+        if self.n:
+            worst = f" (worst {self.worst:.1f} {self.unit})" if self.worst is not None else ""
+            self.logger.log(self.level, f"{self.what} {self.n} times in last {now - self.since:.0f} s{worst}")
+        self.n = 0
+        self.worst = None
+        self.since = now
+
+def _start_listener():
+    """
+    Routes all records through a queue to a writer thread in this process.
+    """
+    global _listener
+
+    q = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(q, handler)
+    _listener.start()
+
+    queue_handler = logging.handlers.QueueHandler(q)
+    queue_handler.addFilter(RateLimitFilter())
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(queue_handler)
+
+def setup_logging(level=LOG_LEVEL):
+    """
+    Sets up non-blocking logging for this process and any children it forks.
+    """
+    logging.getLogger().setLevel(level)
+    _start_listener()
+    os.register_at_fork(after_in_child=_start_listener)
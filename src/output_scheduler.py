@@ -0,0 +1,223 @@
+"""
+Output scheduler: the sink that sends LED frames to the UDP clients at a
+fixed refresh rate on its own clock, independent of the camera. Between processed frames it either
+interpolates towards the newest frame or smooths towards it exponentially, so
+a slower camera or a late frame shows up as a smooth transition instead of a
+stall.
+
+Settings come from an optional "output" object in setup.json, e.g.
+    "output": {"refresh_hz": 90, "mode": "smooth", "smoothing_ms": 40}
+"""
+
+## Imports ###
+import logging
+import math
+import threading
+import time
+import numpy as np
+from proto import ambilight_pb2
+from sinks import Sink
+
+log = logging.getLogger(__name__)
+
+### Defines ###
+MODE_INTERPOLATE = "interpolate"    # linear ramp to the newest frame over one camera frame interval
+MODE_SMOOTH = "smooth"              # exponential smoothing with time constant smoothing_ms
+MODES = (MODE_INTERPOLATE, MODE_SMOOTH)
+
+DEFAULT_REFRESH_HZ = 90
+DEFAULT_MODE = MODE_INTERPOLATE
+DEFAULT_SMOOTHING_MS = 40
+
+IDLE_POLL_S = 0.5               # how long to block per check while no clients are registered
+IDLE_RESEND_S = 1.0             # resend interval once the output is settled and no new frames arrive
+SETTLED_LEVELS = 0.5            # max difference (in 8-bit levels) at which the output counts as settled
+MAX_FRAME_INTERVAL_S = 0.25     # cap on the estimated camera frame interval used for interpolation
+INTERVAL_AVERAGING = 0.1        # weight of the newest sample in the frame interval estimate
+
+def output_settings_from_setup(setup):
+    """
+    Returns the keyword arguments for OutputScheduler.configure() from the
+    "output" object in the given setup.json contents. Raises ValueError for an
+    unknown mode or a non-positive rate.
+    """
+    output = setup.get("output", {})
+    settings = {
+        "refresh_hz": float(output.get("refresh_hz", DEFAULT_REFRESH_HZ)),
+        "mode": output.get("mode", DEFAULT_MODE),
+        "smoothing_ms": float(output.get("smoothing_ms", DEFAULT_SMOOTHING_MS)),
+    }
+    if settings["mode"] not in MODES:
+        raise ValueError(f"unknown output mode {settings['mode']!r}, expected one of {MODES}")
+    if settings["refresh_hz"] <= 0 or settings["smoothing_ms"] < 0:
+        raise ValueError("refresh_hz must be positive and smoothing_ms non-negative")
+    return settings
+
+class OutputScheduler(Sink):
+    """
+    Owns the DATA stream to the clients. Instead of waiting for frames like
+    other sinks, it ticks at refresh_hz and picks up the newest frame from the
+    slot, if any, on each tick. If groups is given, only clients in those
+    groups are sent to (see "pipelines" in setup.json).
+    """
+
+    name = "udp"
+
+    def __init__(self, slot, server, refresh_hz=DEFAULT_REFRESH_HZ, mode=DEFAULT_MODE,
+                 smoothing_ms=DEFAULT_SMOOTHING_MS, send=None, groups=None):
+        super().__init__(slot)
+        self.server = server
+        self.groups = groups
+        self.send = send or self._send_to_clients
+        self.configure(refresh_hz, mode, smoothing_ms)
+        self.max_refresh_hz = None      # cap set by the governor, see limit_refresh()
+        self._resize(0)     # sized by the first frame
+
+        self.frame_interval_s = 1 / self.refresh_hz
+        self.last_frame_s = None
+        self.last_send_s = None
+
+        self.clients_present = threading.Event()
+
+    def configure(self, refresh_hz=DEFAULT_REFRESH_HZ, mode=DEFAULT_MODE, smoothing_ms=DEFAULT_SMOOTHING_MS):
+        """
+        Changes the refresh rate and blending mode. Takes effect on the next
+        tick, so it is safe to call while running.
+        """
+        self.refresh_hz = refresh_hz
+        self.mode = mode
+        self.smoothing_ms = smoothing_ms
+
+    def limit_refresh(self, max_refresh_hz):
+        """
+        Caps the refresh rate below the configured one, or lifts the cap if
+        None. Takes effect on the next tick.
+        """
+        self.max_refresh_hz = max_refresh_hz
+
+    def _resize(self, size):
+        self.origin = np.zeros(size, dtype=np.float32)    # output when the newest frame arrived
+        self.target = np.zeros(size, dtype=np.float32)    # newest frame
+        self.out = np.zeros(size, dtype=np.float32)
+        self.out_u8 = np.zeros(size, dtype=np.uint8)
+        self.scratch = np.zeros(size, dtype=np.float32)
+
+    def _take_latest(self):
+        """
+        Picks up the newest frame from the slot, if there is a new one.
+        """
+        latest = self.next_frame(0)
+        if latest is None:
+            return
+        _, t, frame = latest
+
+        resized = frame.size != self.target.size
+        if resized:
+            self._resize(frame.size)
+
+        if self.last_frame_s is not None:
+            interval = min(t - self.last_frame_s, MAX_FRAME_INTERVAL_S)
+            self.frame_interval_s += INTERVAL_AVERAGING * (interval - self.frame_interval_s)
+        self.last_frame_s = t
+
+        np.copyto(self.target, frame)
+        if resized:
+            np.copyto(self.out, frame)      # nothing to blend from
+        np.copyto(self.origin, self.out)
+
+    def _blend(self, now_s, dt_s):
+        """
+        Moves the output towards the newest frame for a tick of dt_s seconds.
+        """
+        if self.mode == MODE_INTERPOLATE:
+            # Ramp from where the output was when the frame arrived, so a new
+            # frame mid-transition never causes a jump
+            progress = min((now_s - self.last_frame_s) / max(self.frame_interval_s, 1e-3), 1.0)
+            np.subtract(self.target, self.origin, out=self.scratch)
+            np.multiply(self.scratch, progress, out=self.scratch)
+            np.add(self.origin, self.scratch, out=self.out)
+        elif self.smoothing_ms > 0:
+            alpha = 1 - math.exp(-dt_s * 1000 / self.smoothing_ms)
+            np.subtract(self.target, self.out, out=self.scratch)
+            np.multiply(self.scratch, alpha, out=self.scratch)
+            np.add(self.out, self.scratch, out=self.out)
+        else:
+            np.copyto(self.out, self.target)
+
+    def _settled(self):
+        np.subtract(self.target, self.out, out=self.scratch)
+        np.abs(self.scratch, out=self.scratch)
+        return self.scratch.max(initial=0) <= SETTLED_LEVELS
+
+    def _send_to_clients(self, payload):
+        self.server.send(type=ambilight_pb2.MessageType.DATA, payload=payload, groups=self.groups)
+        self.server.data_sent(self.last_frame_s)
+
+    def tick(self, now_s, dt_s):
+        """
+        Runs one output step: picks up a new frame, blends and sends. Once the
+        output has settled and no new frames arrive, only resends every
+        IDLE_RESEND_S. Returns True if a frame was sent.
+        """
+        self._take_latest()
+        if self.last_frame_s is None:
+            return False
+
+        if now_s - self.last_frame_s > IDLE_RESEND_S and self._settled():
+            # A frame can already be settled the first time it is picked up,
+            # e.g. a blank frame published before the first client registered
+            if self.last_send_s is not None and now_s - self.last_send_s < IDLE_RESEND_S:
+                return False
+            np.copyto(self.out, self.target)
+        else:
+            self._blend(now_s, dt_s)
+
+        np.rint(self.out, out=self.scratch)
+        np.copyto(self.out_u8, self.scratch, casting="unsafe")
+        self.send(self.out_u8)
+        self.last_send_s = now_s
+        self.written += 1
+        return True
+
+    def run(self):
+        """
+        Ticks at refresh_hz while clients are registered. A tick that fails
+        is logged and the next one goes ahead, so one bad frame or send
+        never stops the output.
+        """
+        last_s = time.perf_counter()
+        next_tick_s = last_s
+        while True:
+            if not self.clients_present.wait(IDLE_POLL_S):
+                continue
+
+            delay = next_tick_s - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            now_s = time.perf_counter()
+
+            try:
+                self.tick(now_s, now_s - last_s)
+            except Exception:
+                log.exception("Output tick failed", extra={"rate_limit": True})
+            last_s = now_s
+
+            refresh_hz = self.refresh_hz if self.max_refresh_hz is None else min(self.refresh_hz, self.max_refresh_hz)
+            period_s = 1 / refresh_hz
+            next_tick_s += period_s
+            if next_tick_s < now_s:
+                next_tick_s = now_s + period_s     # fell behind, don't try to catch up
+
+    def _on_registry_change(self, snapshot):
+        if any(self.groups is None or client.group in self.groups for client in snapshot):
+            self.clients_present.set()
+        else:
+            self.clients_present.clear()
+
+    def start(self):
+        """
+        Starts the output thread. It only runs while the server has clients
+        in its groups.
+        """
+        self.server.registry.subscribe(self._on_registry_change)
+        super().start()
@@ -1,4 +1,7 @@
 import os, signal
+import logging
+
+log = logging.getLogger(__name__)
 
 PID_DIR = "/home/pi/repos/ambilight-server/.pid"
 
@@ -11,23 +14,23 @@ def check_pid(pid):
     else:
         return True
 
-def update_pid_file(pid_filename):    
+def update_pid_file(pid_filename, kill_previous=True):
+    """ Writes our PID to the file, killing the process it named first unless kill_previous is False. """
     pid_filepath = os.path.join(PID_DIR, pid_filename)
     
-    print(f"pid_filepath: {pid_filepath}")
+    log.debug("pid_filepath: %s", pid_filepath)
 
-    if os.path.exists(pid_filepath):
+    if kill_previous and os.path.exists(pid_filepath):
         with open(pid_filepath) as f:
             try:
                 last_pid = int(f.readline())
                 if check_pid(last_pid):
-                    print(f"PID {last_pid} is running, killing it...",end="")
+                    log.info("PID %d is running, killing it", last_pid)
                     os.kill(last_pid, signal.SIGKILL)
-                    print("done")
             except ValueError:  # catch the case where the file exists but is empty or malformed
                 pass
     
     curr_pid = os.getpid()
     with open(pid_filepath, 'w') as f:
-        print(f"Creating file with PID {curr_pid}")
+        log.info("Creating file with PID %d", curr_pid)
         f.write(str(curr_pid))
\ No newline at end of file
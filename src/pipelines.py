@@ -0,0 +1,121 @@
+"""
+Multi-screen setup: one host driving several screens, from several cameras or
+from several ROIs in one wide camera view. setup.json declares the screens in
+a "pipelines" list, e.g.
+    "pipelines": [{"name": "tv", "roi": [[29, 29], [144, 27], [143, 110], [29, 98]]},
+                  {"name": "monitor", "camera": 1, "roi": [[10, 12], [150, 12], [150, 100], [10, 100]],
+                   "num_rows": 12, "num_cols": 20, "cpus": [2]}]
+Each entry overrides the top-level settings (roi, gamma, zone_size, num_rows,
+num_cols, fade_time_s, sinks) for its screen. Its name is the client group:
+clients set config.group to it to get that screen's DATA, and clients without
+a group get the first screen. Each pipeline is processed in its own worker
+process on its own core ("cpus", by default the cores the camera and server
+processes don't use, counting down from the processing core), and all of them
+share one server and client registry.
+
+Without "pipelines", the top-level settings describe the only screen.
+"""
+
+## Imports ###
+import copy
+import processing
+import sched_profile
+
+### Defines ###
+DEFAULT_GROUP = ""      # group of clients that don't set one
+
+def pipelines_from_setup(setup):
+    """
+    Returns the settings of each pipeline from the given setup.json contents:
+    the top-level settings with the pipeline's entry applied on top, plus its
+    "name" and "camera" (default 0). Only the first pipeline inherits the
+    top-level sinks. Raises ValueError for a missing or duplicate name.
+    """
+    entries = setup.get("pipelines")
+    if not entries:
+        return [dict(setup, name=DEFAULT_GROUP, camera=0)]
+
+    common = {key: value for key, value in setup.items() if key != "pipelines"}
+    pipelines = []
+    for index, entry in enumerate(entries):
+        name = entry.get("name")
+        if not name or any(p["name"] == name for p in pipelines):
+            raise ValueError(f"pipeline {index} needs a unique name, got {name!r}")
+        pipeline = dict(common)
+        if index > 0:
+            pipeline.pop("sinks", None)
+        pipeline.update(entry)
+        pipeline.setdefault("camera", 0)
+        pipelines.append(pipeline)
+    return pipelines
+
+def rescale_rois(setup, resolution):
+    """
+    Returns a copy of the given setup.json contents for a new camera
+    resolution: the top-level ROI and that of every pipeline scaled from the
+    resolution it was given in, and every "resolution" set to the new one.
+    """
+    setup = copy.deepcopy(setup)
+    old_resolution = processing.resolution_from_setup(setup)
+    if "roi" in setup:
+        setup["roi"] = processing.scale_roi(setup["roi"], old_resolution, resolution)
+    setup["resolution"] = list(resolution)
+    for entry in setup.get("pipelines") or []:
+        if "roi" in entry:
+            entry["roi"] = processing.scale_roi(entry["roi"], entry.get("resolution", old_resolution), resolution)
+        if "resolution" in entry:
+            entry["resolution"] = list(resolution)
+    return setup
+
+def pipeline_setup(setup, name):
+    """
+    Returns the settings of the named pipeline from the given setup.json
+    contents. Raises KeyError if there is no such pipeline.
+    """
+    for pipeline in pipelines_from_setup(setup):
+        if pipeline["name"] == name:
+            return pipeline
+    raise KeyError(f"no pipeline named {name!r}")
+
+def groups(pipelines, index):
+    """
+    Returns the client groups the index-th pipeline sends to. The first one
+    also serves clients without a group.
+    """
+    name = pipelines[index]["name"]
+    return (DEFAULT_GROUP, name) if index == 0 else (name,)
+
+def cameras(pipelines):
+    """
+    Returns the camera numbers used by the pipelines, in order.
+    """
+    return sorted({pipeline["camera"] for pipeline in pipelines})
+
+def worker_cpus(profile):
+    """
+    Returns the cores left for pipeline workers by the given scheduling
+    profile: those the camera and server processes don't use, counting down
+    from the processing core. If there are none, the processing core.
+    """
+    online = sched_profile.ONLINE_CPUS
+    taken = set()
+    for role in ("camera", "server"):
+        taken |= sched_profile.cpus_available(profile.get(role, {}).get("cpus") or [])
+    first, = sched_profile.cpus_available((profile["processing"].get("cpus") or online[-1:])[:1])
+    free = sorted((cpu for cpu in online if cpu not in taken), key=lambda cpu: (first - cpu) % (online[-1] + 1))
+    return free or [first]
+
+def worker_profile(profile, pipelines, index):
+    """
+    Returns the scheduling profile (see sched_profile.py) for the processing
+    worker of the index-th pipeline: its "cpus" if set, otherwise one of
+    worker_cpus() per pipeline. Pipelines share cores once there are more of
+    them than free cores.
+    """
+    profile = copy.deepcopy(profile)
+    cpus = pipelines[index].get("cpus")
+    if cpus is None:
+        free = worker_cpus(profile)
+        cpus = [free[index % len(free)]]
+    profile["processing"]["cpus"] = cpus
+    return profile
@@ -0,0 +1,294 @@
+"""
+Frame processing pipeline shared by ambilight.py and the benchmark scripts:
+turns a camera frame into the per-LED color array sent to clients.
+"""
+
+## Imports ###
+import cv2
+import numpy as np
+
+### Defines ###
+NUM_ROWS = 22               # layout of LEDs defines a rectangular grid
+NUM_COLS = 36
+NUM_LEDS = 114
+ZONE_SIZE = 6               # how many grid elements to average (see: https://docs.google.com/spreadsheets/d/1SJUuVqygsfONSyFsHIomGW3i-9cAV04BaVC1PwiqIyY/edit#gid=0)
+
+GAMMA_R = 3.0               # gamma to use for color channels (see: https://drive.google.com/file/d/1v7AEu2hqfFiiNiP1ngT0oPzDP944fT0s/view?usp=sharing)
+GAMMA_G = 3.3
+GAMMA_B = 4.0
+
+def gamma_lut(gamma):
+    """
+    Returns a 256-entry uint8 lookup table for the given gamma.
+    """
+    return (((np.arange(256)/255) ** gamma) * 255).astype('uint8')
+
+DEFAULT_RESOLUTION = (160, 128)     # downscale to this resolution for all other processing, see "resolution" in setup.json
+DEFAULT_FPS = 90                    # camera frame rate, see "camera_fps" in setup.json
+
+DEFAULT_ASPECT = 16/9
+WIDE_ASPECT = 2.39/1
+
+FINGERPRINT_STEP = 8            # sample every 8th pixel in each direction
+FINGERPRINT_TOLERANCE = 1.5     # mean abs difference (in 8-bit levels) treated as sensor noise
+
+def perimeter_indices(num_rows, num_cols):
+    """
+    Returns (rows, cols) index arrays that pick the LED colors out of a
+    num_rows x num_cols grid, starting at the bottom center and going
+    clockwise: bottom left (center to corner), left (bottom to top), top (left
+    to right), right (top to bottom), bottom right (corner to center). The two
+    bottom-center grid cells are skipped.
+    """
+    last_row = num_rows - 1
+    last_col = num_cols - 1
+    half = num_cols // 2
+
+    rows = np.concatenate([
+        np.full(half - 1, last_row),                # bottom left (center to corner)
+        np.arange(last_row, -1, -1),                # left (bottom to top)
+        np.zeros(num_cols, dtype=int),              # top (left to right)
+        np.arange(num_rows),                        # right (top to bottom)
+        np.full(last_col - half, last_row),         # bottom right (corner to center)
+    ])
+    cols = np.concatenate([
+        np.arange(half - 2, -1, -1),
+        np.zeros(num_rows, dtype=int),
+        np.arange(num_cols),
+        np.full(num_rows, last_col),
+        np.arange(last_col, half, -1),
+    ])
+    return rows, cols
+
+def resolution_from_setup(setup):
+    """
+    Returns the processing resolution from the given setup.json contents. The
+    ROI in setup.json is in pixels of this resolution.
+    """
+    return tuple(setup.get("resolution", DEFAULT_RESOLUTION))
+
+def fps_from_setup(setup):
+    """
+    Returns the camera frame rate from the given setup.json contents.
+    """
+    return setup.get("camera_fps", DEFAULT_FPS)
+
+def scale_roi(roi, from_resolution, to_resolution):
+    """
+    Returns the ROI corners given in pixels of from_resolution in pixels of
+    to_resolution. Both resolutions must cover the same field of view.
+    """
+    sx = to_resolution[0] / from_resolution[0]
+    sy = to_resolution[1] / from_resolution[1]
+    return [[round(x * sx, 2), round(y * sy, 2)] for x, y in roi]
+
+class PipelineParams:
+    """
+    Processing parameters together with the tables precomputed from them
+    (perspective matrix, gamma LUTs, LED index tables). Treated as immutable:
+    use replace() to get a new object that only recomputes the tables
+    affected by the changed parameters, then swap it in between frames.
+    """
+
+    def __init__(self, roi, resolution, gamma=(GAMMA_R, GAMMA_G, GAMMA_B),
+                 num_rows=NUM_ROWS, num_cols=NUM_COLS, zone_size=ZONE_SIZE):
+        self.roi = roi
+        self.resolution = tuple(resolution)
+        self.gamma = tuple(gamma)
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.zone_size = zone_size
+        self._compute_transform()
+        self._compute_luts()
+        self._compute_layout()
+
+    def _compute_transform(self):
+        resolution = self.resolution
+        dst = [[0, 0], [resolution[0], 0], [resolution[0], resolution[1]], [0, resolution[1]]] # define corners of rectangle (UL, UR, LR, LL)
+        self.M = cv2.getPerspectiveTransform(np.float32(self.roi), np.float32(dst))     # 0.1ms
+
+    def _compute_luts(self):
+        self.luts = tuple(gamma_lut(g) for g in self.gamma)
+        self.lut3 = np.dstack(self.luts)     # (1, 256, 3), for a single 3-channel cv2.LUT
+
+    def _compute_layout(self):
+        self.led_rows, self.led_cols = perimeter_indices(self.num_rows, self.num_cols)
+        self.led_index = self.led_rows * self.num_cols + self.led_cols   # into the flattened grid
+        self.num_leds = len(self.led_rows)
+
+    def replace(self, **changes):
+        """
+        Returns a copy with the given parameters changed. Only the tables that
+        depend on a changed parameter are recomputed.
+        """
+        new = PipelineParams.__new__(PipelineParams)
+        new.__dict__.update(self.__dict__)
+        changed = {k for k, v in changes.items() if getattr(self, k) != v}
+        new.__dict__.update(changes)
+        if changed & {"roi", "resolution"}:
+            new.resolution = tuple(new.resolution)
+            new._compute_transform()
+        if "gamma" in changed:
+            new.gamma = tuple(new.gamma)
+            new._compute_luts()
+        if changed & {"num_rows", "num_cols"}:
+            new._compute_layout()
+        return new
+
+def process_frame(frame, params, aspect_ratio="", show=None):
+    """
+    Warps the ROI of the given frame to a rectangle, reduces it to the LED
+    perimeter and applies gamma, using the tables in params. Returns a
+    (params.num_leds, 3) uint8 array. If show is given it is called with each
+    intermediate image, for debugging. Use a FrameProcessor to process a
+    stream of frames without allocating.
+    """
+    return FrameProcessor(params).process(frame, aspect_ratio=aspect_ratio, show=show)
+
+class FrameProcessor:
+    """
+    Runs process_frame() on buffers allocated once, so steady-state frames
+    allocate no arrays. The buffers are sized for the frame shape and params
+    and are reallocated when either changes, e.g. after swapping in new params
+    on reload. process() returns an internal buffer that the next call
+    overwrites.
+
+    A scale below 1 warps the ROI to a correspondingly smaller image, which
+    makes the warp and resize cheaper at a small cost in accuracy (see
+    governor.py).
+    """
+
+    def __init__(self, params, scale=1.0):
+        self.params = params
+        self.scale = scale
+        self._key = None
+
+    def _allocate(self, frame):
+        params = self.params
+        resolution = (frame.shape[1], frame.shape[0])
+        if resolution != params.resolution:
+            params = self.params = params.replace(resolution=resolution)
+        rows, cols = params.num_rows, params.num_cols
+
+        scale = self.scale
+        self.crop_size = (max(round(resolution[0] * scale), cols), max(round(resolution[1] * scale), rows))
+        self.M = params.M if scale == 1 else np.diag([scale, scale, 1.0]) @ params.M
+        self.crop = np.empty((self.crop_size[1], self.crop_size[0]) + frame.shape[2:], dtype=frame.dtype)
+        self.grid = np.empty((rows, cols, 3), dtype=frame.dtype)
+        self.left = np.empty((rows, 1, 3))          # zone means in float64 like np.mean, shaped for cv2.reduce
+        self.right = np.empty((rows, 1, 3))
+        self.top = np.empty((1, cols - 2, 3))
+        self.bottom = np.empty((1, cols - 2, 3))
+        self.border = np.zeros((rows, cols, 3), dtype=np.uint8)     # only the perimeter is ever written
+        self.border_flat = self.border.reshape(-1, 3)
+        self.leds = np.empty((params.num_leds, 3), dtype=np.uint8)
+        self.leds_lut_view = self.leds.reshape(-1, 1, 3)
+        self.out = np.empty((params.num_leds, 3), dtype=np.uint8)
+        self.out_lut_view = self.out.reshape(-1, 1, 3)
+        self._key = (frame.shape, frame.dtype, params, scale)
+
+    def process(self, frame, gain=1.0, aspect_ratio="", show=None):
+        """
+        Processes the frame like process_frame(), scaling the result by gain
+        (0 to 1). The gain is applied to the zone means rather than the frame,
+        at a fraction of the cost. Without gain the result is the same as
+        process_frame(frame). Scaling the frame first makes it float, so
+        nothing is rounded until the final truncation; the LEDs differ from
+        that by up to one level before gamma, even at gain 1.
+        """
+        key = self._key
+        if key is None or key[0] != frame.shape or key[1] != frame.dtype or key[2] is not self.params or key[3] != self.scale:
+            self._allocate(frame)
+        params = self.params
+
+        # Do the perspective transform
+        crop = cv2.warpPerspective(frame, self.M, self.crop_size, dst=self.crop)    # 1.8ms
+
+        if aspect_ratio == 'wide':
+            crop_portion = int((1 - DEFAULT_ASPECT / WIDE_ASPECT)/2 * crop.shape[0])  # amount to crop from top/bottom
+            crop = crop[crop_portion:crop.shape[0]-crop_portion,:]
+
+        if show:
+            show(crop)
+
+        # Resize to the LED grid size
+        grid = cv2.resize(crop, (params.num_cols, params.num_rows), dst=self.grid)
+
+        if show:
+            show(grid)
+
+        # Average across zone_size rows/cols into the border of the grid. Sum
+        # then divide, since np.mean allocates a casting buffer per call and
+        # REDUCE_AVG rounds differently.
+        zone = params.zone_size
+        cv2.reduce(grid[:,:zone], 1, cv2.REDUCE_SUM, dst=self.left, dtype=cv2.CV_64F)       # left side
+        cv2.reduce(grid[:,-zone:], 1, cv2.REDUCE_SUM, dst=self.right, dtype=cv2.CV_64F)     # right side
+        cv2.reduce(grid[:zone,1:-1], 0, cv2.REDUCE_SUM, dst=self.top, dtype=cv2.CV_64F)     # top side
+        cv2.reduce(grid[-zone:,1:-1], 0, cv2.REDUCE_SUM, dst=self.bottom, dtype=cv2.CV_64F) # bottom side
+        for side in (self.left, self.right, self.top, self.bottom):
+            np.divide(side, zone, out=side)
+            if gain != 1:
+                np.multiply(side, gain, out=side)
+        border = self.border
+        np.copyto(border[:,0:1], self.left, casting='unsafe')
+        np.copyto(border[:,-1:], self.right, casting='unsafe')
+        np.copyto(border[0:1,1:-1], self.top, casting='unsafe')
+        np.copyto(border[-1:,1:-1], self.bottom, casting='unsafe')
+
+        if show:
+            show(border)
+
+        # Walk the perimeter of the grid into LED order
+        np.take(self.border_flat, params.led_index, axis=0, out=self.leds)
+
+        # Apply all three gamma luts in one pass
+        cv2.LUT(self.leds_lut_view, params.lut3, dst=self.out_lut_view)
+        return self.out
+
+class FrameFingerprint:
+    """
+    Cheap change detector for camera frames. Compares a sparse pixel sample of
+    each frame against the sample of the last frame that was fully processed,
+    so slow drifts still add up past the tolerance instead of being hidden by
+    frame-to-frame noise.
+    """
+
+    def __init__(self, step=FINGERPRINT_STEP, tolerance=FINGERPRINT_TOLERANCE):
+        self.step = step
+        self.tolerance = tolerance
+        self.reference = None       # preallocated sample buffers, swapped when the reference changes
+        self.sample = None
+        self.has_reference = False
+        self.skipped = 0
+        self.total = 0
+
+    def matches(self, frame):
+        """
+        Returns True if frame matches the reference within tolerance, in which
+        case the caller can reuse its last result. Otherwise the frame becomes
+        the new reference and False is returned.
+        """
+        self.total += 1
+        view = frame[::self.step, ::self.step]
+        if self.sample is None or self.sample.shape != view.shape or self.sample.dtype != view.dtype:
+            self.sample = np.empty(view.shape, dtype=view.dtype)
+            self.reference = np.empty(view.shape, dtype=view.dtype)
+            self.has_reference = False
+        np.copyto(self.sample, view)
+
+        # cv2.norm sums the abs differences without the temporaries numpy needs
+        if self.has_reference:
+            if cv2.norm(self.sample, self.reference, cv2.NORM_L1) / self.sample.size <= self.tolerance:
+                self.skipped += 1
+                return True
+
+        # Keep the sample as the new reference, swapping buffers instead of copying
+        self.reference, self.sample = self.sample, self.reference
+        self.has_reference = True
+        return False
+
+    def reset(self):
+        """
+        Forgets the reference so that the next frame is always processed.
+        """
+        self.has_reference = False
@@ -1,58 +1,55 @@
 """
-See https://github.com/iharosi/ps5-wake for the core utility used here.
+Switches the TV to the PS5 when the PS5 wakes, and back to the Apple TV (then
+off) when it goes to standby. PS5 state comes from the device-state daemon
+(device_state.py), which owns the probes.
 """
 
 import TV
-import subprocess, json, time
+import device_state
+import time
+import logging
+import log_utils
 
-PS5_STATUS_INTERVAL_S = 2     # how often to check the status
-STATUS_STANDBY = 620
-STATUS_ON = 200
+log = logging.getLogger("ps5_status")
+
+RECONNECT_INTERVAL_S = 2     # how often to retry connecting to the device-state daemon
 
 def ps5_status():
-    tv = TV.TV()
+    tv = TV.TV(connect=False)   # connects on demand when switching sources
+    client = device_state.DeviceStateClient()
 
-    last_status = None
     while True:
-        time.sleep(PS5_STATUS_INTERVAL_S)
+        if not client.connected():
+            if not client.connect():
+                log.info("Waiting for device-state daemon...")
+                time.sleep(RECONNECT_INTERVAL_S)
+                continue
+            log.info("Connected to device-state daemon")
 
-        output = subprocess.run("/home/pi/repos/ambilight-server/tools/ps5-wake -jP -B", shell=True, capture_output=True)
-        output_str = output.stdout.strip().decode("utf-8")
-        print(output_str)
         try:
-            d = json.loads(output_str)
-        except json.decoder.JSONDecodeError:
-            print(f"Could not decode string: {output_str}")
+            event = client.read_event()
+        except ConnectionError as e:
+            log.warning("%s", e)
             continue
-        status = d["code"]
 
-        if last_status == None:
-            # skip the very first iteration
-            last_status = status
-            continue
-        if status != STATUS_STANDBY and sstatus != STATUS_ON:
-            # unrecognized status
-            continue
-        if status == last_status:
-            # no change
+        if event["device"] != device_state.DEVICE_PS5 or event["initial"]:
+            # only react to changes, not to the state at the time we connected
             continue
-        
-        if status == STATUS_ON:
+
+        if event["state"] == device_state.ON:
             # turn on and switch to PS5
-            print("PS5 is turning on the TV!")
+            log.info("PS5 is turning on the TV!")
             if not tv.connect():
                 tv.turn_on()
             tv.go_to_ps5()
 
-        elif status == STATUS_STANDBY:
+        elif event["state"] == device_state.STANDBY:
             # switch to apple tv and turn off
-            print("PS5 is turning off the TV!")
+            log.info("PS5 is turning off the TV!")
             tv.go_to_appletv()
             tv.turn_off()
 
-        # update last status
-        last_status = status        
-
 if __name__ == "__main__":
+    log_utils.setup_logging()
     ps5_status()
-    print("Exiting")
\ No newline at end of file
+    log.info("Exiting")
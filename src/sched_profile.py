@@ -0,0 +1,112 @@
+"""
+Scheduling profile for the ambilight processes: CPU affinity, nice level,
+optional SCHED_FIFO priority and optional mlockall(). Every step degrades
+gracefully: if we lack the privilege for it we log why and carry on with
+default scheduling.
+
+The profile can be overridden with a "sched_profile" object in setup.json, e.g.
+    "sched_profile": {"enabled": true, "lock_memory": true,
+                      "camera": {"cpus": [2], "realtime_priority": 50}}
+"""
+
+import ctypes
+import ctypes.util
+import copy
+import os
+import logging
+
+log = logging.getLogger(__name__)
+
+# Default for a 4-core Pi: keep the 90 fps path on cores 2 and 3 and push
+# everything else (TV status, ps5-status, journald, ...) onto cores 0 and 1.
+# The server's socket threads share cores 0 and 1, at a higher priority.
+# SCHED_FIFO is opt-in via realtime_priority since a spinning FIFO thread can
+# starve the rest of the system.
+DEFAULT_PROFILE = {
+    "enabled": True,
+    "lock_memory": False,
+    "camera": {"cpus": [2], "nice": -5, "realtime_priority": None},
+    "processing": {"cpus": [3], "nice": -5, "realtime_priority": None},
+    "server": {"cpus": [0, 1], "nice": -5, "realtime_priority": None},
+    "tv_status": {"cpus": [0, 1], "nice": 10, "realtime_priority": None},
+}
+
+# The cores the service started with. apply() narrows the affinity of the
+# calling thread, so later lookups must not go by the current one.
+ONLINE_CPUS = sorted(os.sched_getaffinity(0))
+
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+def profile_from_setup(setup):
+    """
+    Returns DEFAULT_PROFILE with any "sched_profile" overrides from the given
+    setup.json contents applied.
+    """
+    profile = copy.deepcopy(DEFAULT_PROFILE)
+    for key, value in setup.get("sched_profile", {}).items():
+        if isinstance(value, dict) and isinstance(profile.get(key), dict):
+            profile[key].update(value)
+        else:
+            profile[key] = value
+    return profile
+
+def cpus_available(cpus):
+    """
+    Maps the requested cores onto the ones this machine has, so a profile
+    written for a Pi 4 still does something sensible on fewer cores.
+    """
+    return {ONLINE_CPUS[cpu % len(ONLINE_CPUS)] for cpu in cpus}
+
+def lock_memory():
+    """
+    Locks current and future pages in RAM so the hot path never page faults.
+    Returns True on success.
+    """
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+        log.warning("mlockall failed: %s (needs CAP_IPC_LOCK or LimitMEMLOCK)", os.strerror(ctypes.get_errno()))
+        return False
+    return True
+
+def apply(role, profile=DEFAULT_PROFILE):
+    """
+    Applies the profile for the given role ("camera", "processing",
+    "server", "tv_status") to the calling thread. Threads started afterwards inherit it.
+    Returns a dict of what was actually applied.
+    """
+    applied = {}
+    settings = profile.get(role)
+    if not profile.get("enabled") or not settings:
+        return applied
+
+    cpus = settings.get("cpus")
+    if cpus:
+        try:
+            cpus = cpus_available(cpus)
+            os.sched_setaffinity(0, cpus)
+            applied["cpus"] = sorted(cpus)
+        except OSError as e:
+            log.warning("%s: could not set CPU affinity: %s", role, e)
+
+    nice = settings.get("nice")
+    if nice is not None:
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, nice)
+            applied["nice"] = nice
+        except OSError as e:
+            log.warning("%s: could not set nice %s: %s", role, nice, e)
+
+    priority = settings.get("realtime_priority")
+    if priority:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            applied["realtime_priority"] = priority
+        except OSError as e:
+            log.warning("%s: could not set SCHED_FIFO priority %s: %s (needs CAP_SYS_NICE or LimitRTPRIO)", role, priority, e)
+
+    if profile.get("lock_memory") and lock_memory():
+        applied["lock_memory"] = True
+
+    log.info("%s: scheduling profile %s", role, applied)
+    return applied
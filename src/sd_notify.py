@@ -0,0 +1,31 @@
+"""
+Minimal systemd notification support (see sd_notify(3)), so the service can use
+Type=notify without depending on python-systemd.
+"""
+
+import os
+import socket
+import logging
+
+log = logging.getLogger(__name__)
+
+def notify(state):
+    """
+    Sends the given state string (e.g. "READY=1") to systemd. Returns False if
+    we are not running under systemd with a notify socket.
+    """
+    addr = os.environ.get("NOTIFY_SOCKET")
+    if not addr:
+        return False
+    if addr[0] == "@":  # abstract namespace socket
+        addr = "\0" + addr[1:]
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(addr)
+            sock.sendall(state.encode())
+    except OSError as e:
+        log.warning("Failed to notify systemd: %s", e)
+        return False
+
+    return True
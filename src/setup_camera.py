@@ -6,11 +6,24 @@ import numpy as np
 import cv2
 import matplotlib.pyplot as plt
 import json
+import os
 from picamera2 import Picamera2, Preview
 from libcamera import Transform
-
-RESOLUTION = (160,128)          # actual resolution we will be processing
-FPS = 90
+import pipelines
+import processing
+import calibrate
+
+SETUP_PATH = 'setup.json'
+
+# Keep the settings already in setup.json (gamma, resolution and frame rate
+# from autotune.py, ...) and capture at the resolution the ROI is used at
+try:
+  with open(SETUP_PATH) as f:
+    setup = json.load(f)
+except OSError:
+  setup = {}
+RESOLUTION = processing.resolution_from_setup(setup)    # actual resolution we will be processing
+FPS = processing.fps_from_setup(setup)
 FRAME_DUR_US = int(1/FPS * 1e6)
 
 def select_roi(frame):   
@@ -74,6 +87,7 @@ while True:
     w = up
     s = down
     x = exit
+    c = find the ROI automatically (shows a white screen on the TV)
     enter = select ROI''')
 
     key = input()
@@ -92,6 +106,15 @@ while True:
         pt.tilt(-1 * move_amount + pt.get_tilt())
     elif key =='s':
         pt.tilt(move_amount + pt.get_tilt())
+    elif key =='c':
+        import TV
+        roi = calibrate.calibrate(lambda: picam2.capture_array("main"), TV.TV())
+        if roi is None:
+            print('No screen found, try again or hit enter to select the ROI by hand')
+            continue
+        picam2.stop_preview()
+        roi = np.array(roi)
+        break
     elif key =='':
         array = picam2.capture_array("main")
         picam2.stop_preview()
@@ -104,12 +127,15 @@ print('Pan:' + str(pt.get_pan()))
 print('Tilt: ' + str(pt.get_tilt()))
 print('ROI: ' + str(roi))
 
-dict_to_write = {}
+dict_to_write = pipelines.rescale_rois(setup, RESOLUTION)   # keeps the ROIs of other screens in place
 dict_to_write['pan'] = pt.get_pan()
 dict_to_write['tilt'] = pt.get_tilt()
 dict_to_write['roi'] = roi.tolist()
+dict_to_write['resolution'] = list(RESOLUTION)
 
-with open('setup.json','w') as outfile:
+# write atomically, since a running ambilight.py reloads this file on change
+with open(SETUP_PATH + '.tmp','w') as outfile:
     json.dump(dict_to_write, outfile)
+os.replace(SETUP_PATH + '.tmp', SETUP_PATH)
 
 picam2.stop()
@@ -0,0 +1,312 @@
+"""
+Output sinks. The processing loop publishes each LED frame once into a
+FrameSlot. Every sink runs on its own thread and takes the newest frame when
+it is ready for one, so a slow sink only drops its own frames and never holds
+up processing or the other sinks.
+
+The UDP clients are served by output_scheduler.OutputScheduler. Extra sinks
+can be listed in a "sinks" array in setup.json (read at startup), e.g.
+    "sinks": [{"type": "pipe", "path": "/tmp/ambilight.fifo"},
+              {"type": "file", "path": "/home/pi/ambilight.rec"},
+              {"type": "spi", "bus": 0, "device": 0, "speed_hz": 8000000}]
+"""
+
+## Imports ###
+import errno
+import logging
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+### Defines ###
+IDLE_POLL_S = 0.5               # how long a sink blocks per check while no frames arrive
+REOPEN_INTERVAL_S = 1.0         # how often to retry opening a pipe with no reader
+FILE_FLUSH_INTERVAL_S = 1.0     # how often the recorder flushes to disk
+RECORD_HEADER = struct.Struct("!dI")    # wall clock time in s, payload length in bytes
+
+DEFAULT_PIPE_PATH = "/tmp/ambilight.fifo"
+DEFAULT_SPI_SPEED_HZ = 8000000
+APA102_MAX_BRIGHTNESS = 31      # 5-bit global brightness per LED
+
+# seq counts published frames, so a sink can tell how many it skipped. data is
+# a flat uint8 RGB array owned by the slot; sinks must not modify it.
+Frame = namedtuple("Frame", "seq time_s data")
+
+class FrameSlot:
+    """
+    Latest-value slot with a single publisher. publish() replaces the frame
+    with one reference assignment, so readers never take a lock, and wakes
+    up every sink waiting for a new frame.
+    """
+
+    def __init__(self):
+        self.latest = None
+        self.seq = 0
+        self._events = []
+
+    def publish(self, led_data, copy=True):
+        """
+        Publishes a copy of led_data as the newest frame. With copy False the
+        slot takes over led_data itself, which must then be a uint8 array
+        that nothing else holds on to, e.g. one just received from a queue.
+        """
+        self.seq += 1
+        data = np.array(led_data, dtype=np.uint8) if copy else led_data
+        self.latest = Frame(self.seq, time.perf_counter(), data.reshape(-1))
+        for event in self._events:
+            event.set()
+
+    def listen(self):
+        """
+        Returns an event that is set whenever a new frame is published.
+        """
+        event = threading.Event()
+        self._events.append(event)
+        return event
+
+class Sink:
+    """
+    Base class for a consumer of a FrameSlot running on its own thread.
+    Subclasses implement write(frame), returning False if the frame was
+    dropped, and may override close().
+    """
+
+    name = "sink"
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.new_frame = slot.listen()
+        self.last_seq = 0
+        self.written = 0
+        self.dropped = 0
+        self.thread = None
+
+    def next_frame(self, timeout=None):
+        """
+        Returns the newest frame not taken yet, waiting up to timeout seconds
+        for one, or None. Frames published in between count as dropped.
+        """
+        if not self.new_frame.wait(timeout):
+            return None
+        self.new_frame.clear()
+        frame = self.slot.latest
+        if frame is None or frame.seq == self.last_seq:
+            return None
+        if self.last_seq:
+            self.dropped += frame.seq - self.last_seq - 1
+        self.last_seq = frame.seq
+        return frame
+
+    def write(self, frame):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def run(self):
+        while True:
+            frame = self.next_frame(IDLE_POLL_S)
+            if frame is None:
+                continue
+            try:
+                if self.write(frame):
+                    self.written += 1
+                else:
+                    self.dropped += 1
+            except ImportError as e:
+                log.error("%s sink disabled: %s", self.name, e)
+                return
+            except OSError as e:
+                log.warning("%s sink: %s", self.name, e, extra={"rate_limit": True})
+                self.dropped += 1
+                self.close()
+            except Exception:
+                log.exception("%s sink write failed", self.name, extra={"rate_limit": True})
+                self.dropped += 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=f"{self.name}-sink", daemon=True)
+        self.thread.start()
+
+    def stats(self):
+        return {"written": self.written, "dropped": self.dropped}
+
+class PipeSink(Sink):
+    """
+    Writes raw RGB frames to a named pipe, e.g. for a visualizer. Frames are
+    dropped while no reader is attached or the reader falls behind. Frames of
+    up to PIPE_BUF bytes (1365 LEDs) are written atomically.
+    """
+
+    name = "pipe"
+
+    def __init__(self, slot, path=DEFAULT_PIPE_PATH):
+        super().__init__(slot)
+        self.path = path
+        self.fd = None
+        self.next_open_s = 0
+
+    def _open(self):
+        """
+        Opens the pipe for writing, creating it if needed. Returns False if
+        there is no reader yet.
+        """
+        now_s = time.monotonic()
+        if now_s < self.next_open_s:
+            return False
+        self.next_open_s = now_s + REOPEN_INTERVAL_S
+
+        if not os.path.exists(self.path):
+            os.mkfifo(self.path)
+        try:
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return False    # no reader
+            raise
+        log.info("Reader attached to %s", self.path)
+        return True
+
+    def write(self, frame):
+        if self.fd is None and not self._open():
+            return False
+        try:
+            os.write(self.fd, frame.data)
+        except BlockingIOError:
+            return False        # reader is behind
+        except BrokenPipeError:
+            log.info("Reader detached from %s", self.path)
+            self.close()
+            return False
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = None
+
+class FileSink(Sink):
+    """
+    Records every frame it gets to a file, each as a RECORD_HEADER followed by
+    the raw RGB bytes. Read it back with read_recording().
+    """
+
+    name = "file"
+
+    def __init__(self, slot, path):
+        super().__init__(slot)
+        self.path = path
+        self.file = None
+        self.next_flush_s = 0
+
+    def write(self, frame):
+        if self.file is None:
+            self.file = open(self.path, "ab")
+        # frame.time_s is a perf_counter time, record wall clock time instead
+        self.file.write(RECORD_HEADER.pack(time.time(), frame.data.size))
+        self.file.write(frame.data)
+
+        now_s = time.monotonic()
+        if now_s >= self.next_flush_s:
+            self.file.flush()
+            self.next_flush_s = now_s + FILE_FLUSH_INTERVAL_S
+        return True
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+
+def read_recording(path):
+    """
+    Yields (time_s, led_data) for each frame recorded by FileSink, with
+    led_data as an (n, 3) uint8 array.
+    """
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            time_s, size = RECORD_HEADER.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                return  # truncated last record
+            yield time_s, np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+
+class SpiSink(Sink):
+    """
+    Drives an APA102 (DotStar) strip on a local SPI bus. spidev is only
+    imported when the sink first writes, so it is not needed otherwise.
+    """
+
+    name = "spi"
+
+    def __init__(self, slot, bus=0, device=0, speed_hz=DEFAULT_SPI_SPEED_HZ, brightness=APA102_MAX_BRIGHTNESS):
+        super().__init__(slot)
+        self.bus = bus
+        self.device = device
+        self.speed_hz = speed_hz
+        self.brightness = min(max(int(brightness), 0), APA102_MAX_BRIGHTNESS)
+        self.spi = None
+        self.buffer = None
+        self.leds = None
+
+    def _open(self):
+        import spidev
+        self.spi = spidev.SpiDev()
+        self.spi.open(self.bus, self.device)
+        self.spi.max_speed_hz = self.speed_hz
+
+    def _build_buffer(self, num_leds):
+        """
+        Preallocates the APA102 transfer: a 4-byte start frame, 4 bytes per
+        LED (brightness, blue, green, red) and enough end frame bytes to clock
+        the data through the whole strip.
+        """
+        end_bytes = (num_leds + 15) // 16
+        self.buffer = np.zeros(4 + 4 * num_leds + end_bytes, dtype=np.uint8)
+        self.buffer[4 + 4 * num_leds:] = 0xFF
+        self.leds = self.buffer[4:4 + 4 * num_leds].reshape(num_leds, 4)
+        self.leds[:, 0] = 0xE0 | self.brightness
+
+    def write(self, frame):
+        if self.spi is None:
+            self._open()
+        num_leds = frame.data.size // 3
+        if self.leds is None or len(self.leds) != num_leds:
+            self._build_buffer(num_leds)
+
+        self.leds[:, 1:] = frame.data.reshape(num_leds, 3)[:, ::-1]    # RGB -> BGR
+        self.spi.writebytes2(self.buffer)
+        return True
+
+    def close(self):
+        if self.spi is not None:
+            self.spi.close()
+        self.spi = None
+
+SINK_TYPES = {
+    "pipe": PipeSink,
+    "file": FileSink,
+    "spi": SpiSink,
+}
+
+def sinks_from_setup(setup, slot):
+    """
+    Returns the extra sinks listed in the "sinks" array of the given
+    setup.json contents, reading from slot. Raises ValueError for an unknown
+    sink type.
+    """
+    sinks = []
+    for settings in setup.get("sinks", []):
+        settings = dict(settings)
+        sink_type = settings.pop("type", None)
+        if sink_type not in SINK_TYPES:
+            raise ValueError(f"unknown sink type {sink_type!r}, expected one of {sorted(SINK_TYPES)}")
+        sinks.append(SINK_TYPES[sink_type](slot, **settings))
+    return sinks
@@ -0,0 +1,50 @@
+"""
+Records named startup events across processes and prints where the time went.
+Times come from time.monotonic(), which is system-wide on Linux, so events from
+child processes line up with the parent's.
+"""
+
+import time
+
+class StartupTimeline:
+    def __init__(self, t0=None, q=None):
+        """
+        t0 is the reference time (defaults to now). If a multiprocessing queue
+        is given, marks are sent to it instead of being kept locally, so child
+        processes can report to the parent's timeline.
+        """
+        self.t0 = t0 if t0 is not None else time.monotonic()
+        self.q = q
+        self.events = []
+
+    def mark(self, name):
+        """
+        Records that the named step finished now.
+        """
+        event = (time.monotonic(), name)
+        if self.q is not None:
+            self.q.put(event)
+        else:
+            self.events.append(event)
+
+    def elapsed_ms(self):
+        return (time.monotonic() - self.t0) * 1000
+
+    def collect(self, q):
+        """
+        Moves all events sent by child processes on q into this timeline.
+        """
+        while not q.empty():
+            self.events.append(q.get())
+
+    def report(self):
+        """
+        Returns the timeline as a multi-line string, one event per line with its
+        time since t0 and since the previous event.
+        """
+        lines = ["Startup timeline:"]
+        last = self.t0
+        for t, name in sorted(self.events):
+            lines.append(f"  +{(t - self.t0) * 1000:8.1f} ms  (+{(t - last) * 1000:7.1f} ms)  {name}")
+            last = t
+        return "\n".join(lines)
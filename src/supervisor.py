@@ -0,0 +1,147 @@
+"""
+Supervision of the capture worker. The camera process kicks a Watchdog on
+every loop iteration and counts the frames it captures. A Supervisor thread in
+the main process restarts the worker when it dies or stops kicking, without
+touching the server, its clients or the processing state, all of which live in
+the main process.
+
+A restart hands over to a hot standby: a worker forked ahead of time that has
+done its imports and waits on an Event before opening the camera, so recovery
+costs opening the camera rather than a whole process start.
+"""
+
+## Imports ###
+import logging
+import threading
+import time
+from multiprocessing import Event, RawValue
+
+log = logging.getLogger(__name__)
+
+### Defines ###
+STALL_TIMEOUT_S = 2.0       # a worker that hasn't kicked the watchdog for this long is hung
+POLL_INTERVAL_S = 0.05      # how often the supervisor checks on the worker
+MIN_BACKOFF_S = 1.0         # wait before restarting a worker that failed without capturing a frame,
+MAX_BACKOFF_S = 30.0        # doubling up to this while it keeps failing
+
+class Watchdog:
+    """
+    State shared between a worker process and its supervisor, in shared memory
+    so it is cheap to update every frame and survives restarts of the worker.
+    """
+
+    def __init__(self):
+        self.deadline_s = RawValue('d', 0.0)    # time.monotonic() by which the worker must kick again
+        self.frames = RawValue('Q', 0)          # frames captured, across restarts
+        self.tv_on = RawValue('b', 0)           # last TV status, so a restarted worker resumes capture
+
+    def kick(self, timeout_s=STALL_TIMEOUT_S):
+        """
+        Tells the supervisor the worker is alive. Pass a longer timeout before
+        something that legitimately blocks for a while.
+        """
+        self.deadline_s.value = time.monotonic() + timeout_s
+
+    def frame(self):
+        """
+        Counts a captured frame and kicks the watchdog.
+        """
+        self.frames.value += 1
+        self.deadline_s.value = time.monotonic() + STALL_TIMEOUT_S
+
+    def expired(self):
+        return time.monotonic() > self.deadline_s.value
+
+class Supervisor:
+    """
+    Keeps a worker process running. start_worker(standby) must start the
+    worker and return its Process. standby is None for the first worker;
+    otherwise it is an Event the worker waits on before taking over. A worker
+    that exits or lets its watchdog expire is killed and its standby takes
+    over. The first frame after a restart is logged with the recovery time.
+    """
+
+    def __init__(self, name, start_worker, watchdog, start_timeout_s, poll_interval_s=POLL_INTERVAL_S):
+        self.name = name
+        self.start_worker = start_worker
+        self.watchdog = watchdog
+        self.start_timeout_s = start_timeout_s
+        self.poll_interval_s = poll_interval_s
+        self.process = None
+        self.standby = None
+        self.standby_process = None
+        self.restarts = 0
+        self.recovery_ms = []       # fault detected to first frame, per restart
+        self.thread = None
+
+    def _start_standby(self):
+        self.standby = Event()
+        self.standby_process = self.start_worker(self.standby)
+
+    def start(self):
+        """
+        Starts the worker, its standby and the supervising thread.
+        """
+        self.watchdog.kick(self.start_timeout_s)
+        self.process = self.start_worker(None)
+        self._start_standby()
+        self.thread = threading.Thread(target=self.run, name=f"{self.name}-supervisor", daemon=True)
+        self.thread.start()
+
+    def restart(self):
+        """
+        Kills the worker if it is still running and activates the standby.
+        """
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        if self.standby_process is None or not self.standby_process.is_alive():
+            self._start_standby()
+
+        self.watchdog.kick(self.start_timeout_s)
+        self.standby.set()
+        self.process = self.standby_process
+        self.standby_process = None
+        self.restarts += 1
+
+    def run(self):
+        detected_s = None       # when the fault being recovered from was detected
+        frames_at_fault = 0
+        backoff_s = 0
+        restart_at_s = None
+        while True:
+            time.sleep(self.poll_interval_s)
+            if detected_s is not None and self.watchdog.frames.value > frames_at_fault:
+                self.recovery_ms.append((time.perf_counter() - detected_s) * 1000)
+                log.info("%s worker recovered, first frame %.0f ms after the fault was detected",
+                         self.name, self.recovery_ms[-1])
+                detected_s = None
+                backoff_s = 0
+                self._start_standby()   # only now, so it doesn't compete with the recovery
+
+            if restart_at_s is not None:
+                if time.perf_counter() >= restart_at_s:
+                    restart_at_s = None
+                    self.restart()
+                continue
+
+            if not self.process.is_alive():
+                reason = f"exited with code {self.process.exitcode}"
+            elif self.watchdog.expired():
+                reason = "stopped responding"
+            else:
+                continue
+
+            # Back off while workers keep failing before they capture anything,
+            # e.g. with the camera unplugged
+            if detected_s is not None:
+                backoff_s = min(max(2 * backoff_s, MIN_BACKOFF_S), MAX_BACKOFF_S)
+            log.error("%s worker %s, restarting it%s", self.name, reason,
+                      f" in {backoff_s:.0f} s" if backoff_s else "")
+            if detected_s is None:
+                detected_s = time.perf_counter()
+                frames_at_fault = self.watchdog.frames.value
+            restart_at_s = time.perf_counter() + backoff_s
+
+    def stats(self):
+        return {"restarts": self.restarts, "recovery_ms": list(self.recovery_ms)}
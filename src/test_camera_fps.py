@@ -3,16 +3,29 @@
 ## Imports ###
 import time
 import os
+import sys
 from picamera2 import Picamera2, Preview
 from libcamera import Transform
+import json
 import numpy as np
+import processing
 
-RESOLUTION = (160, 128)          # downscale to this resolution for all other processing
-FPS = 90
+# Test the resolution and frame rate ambilight.py will use
+try:
+  with open('setup.json') as f:
+    setup = json.load(f)
+except OSError:
+  setup = {}
+RESOLUTION = processing.resolution_from_setup(setup)    # downscale to this resolution for all other processing
+FPS = processing.fps_from_setup(setup)
 
 SCRIPT_NAME = os.path.splitext(__file__)[0]
 
 def main():
+  # optionally save the captured frames, e.g. for bench_static.py
+  save_path = sys.argv[2] if len(sys.argv) > 2 and sys.argv[1] == "--save" else None
+  frames = []
+
   picam2 = Picamera2()
   picam2.preview_configuration.main.size = RESOLUTION
   picam2.preview_configuration.main.format = "BGR888"
@@ -54,6 +67,8 @@ def main():
   # for image in CAMERA.capture_continuous(raw_capture, format='yuv', use_video_port=True):    # using video port true seems to cause exposure flicker but is way faster        
   while True:
     frame = picam2.capture_array()
+    if save_path:
+      frames.append(frame)
     after = time.perf_counter()
     deltas.append((after - before) * 1000)
     before = time.perf_counter()
@@ -69,5 +84,9 @@ def main():
   print(f"min: {np.min(deltas)}")
   print(f"max: {np.max(deltas)}")
 
+  if save_path:
+    np.save(save_path, np.array(frames))
+    print(f"saved {len(frames)} frames to {save_path}")
+
 if __name__ == '__main__':
     main()
\ No newline at end of file